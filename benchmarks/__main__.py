@@ -0,0 +1,43 @@
+"""Offline benchmarks of the simulation, parsing and inference hot paths.
+
+python -m benchmarks run [-k PATTERN] [-o results.json]
+python -m benchmarks compare old.json new.json [--threshold 0.1]
+"""
+
+import argparse
+import sys
+
+from . import harness
+from .cases import CASES
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("-k", "--pattern", default="", help="Only run cases whose name contains PATTERN")
+    run_parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    run_parser.add_argument("--min-time", type=float, default=0.5, help="Minimum time spent on each case, in seconds")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Tolerated ops/sec loss, 0.1 is 10%%")
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case "run":
+            results = harness.run(CASES, pattern=args.pattern, min_time=args.min_time)
+            if args.output:
+                harness.save(results, args.output)
+        case "compare":
+            regressions = harness.compare(harness.load(args.old), harness.load(args.new), threshold=args.threshold)
+            if regressions:
+                print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
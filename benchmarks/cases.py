@@ -0,0 +1,181 @@
+import numpy as np
+
+import nawminator as nm
+
+SEED = 20240724
+
+
+def random_army(rng: np.random.Generator, max_count: int) -> nm.army.Army:
+    return nm.army.Army(rng.integers(0, max_count, size=len(nm.army.unit_names), endpoint=True))
+
+
+def random_parties(max_count: int, seed: int = SEED) -> tuple[nm.war.WarParty, nm.war.WarParty]:
+    rng = np.random.default_rng(seed)
+    atk_bonuses, def_bonuses = rng.integers(0, 300, size=(2, 2)) * 0.005
+    return (
+        nm.war.WarParty(random_army(rng, max_count), nm.war.Bonuses(*atk_bonuses), atk=True),
+        nm.war.WarParty(random_army(rng, max_count), nm.war.Bonuses(*def_bonuses), atk=False),
+    )
+
+
+def simulate_battle(max_count: int):
+    def setup():
+        attacker, defender = random_parties(max_count)
+        return lambda: nm.war.simulate_battle(attacker, defender)
+
+    return setup
+
+
+def army_from_str():
+    rng = np.random.default_rng(SEED)
+    strings = [random_army(rng, 10**9).to_str() for _ in range(100)]
+    return lambda: [nm.army.Army.from_str(s) for s in strings]
+
+
+def battle_rc():
+    attacker, defender = random_parties(10**6)
+    return nm.war.simulate_battle(attacker, defender).to_rc()
+
+
+def battle_from_rc():
+    rc = battle_rc()
+    return lambda: nm.battle.Battle.from_rc(rc)
+
+
+def battle_to_rc():
+    attacker, defender = random_parties(10**6)
+    battle = nm.war.simulate_battle(attacker, defender)
+    return battle.to_rc
+
+
+def bonuses_from_rounds():
+    rounds = nm.battle.Battle.from_rc(battle_rc()).rounds
+    return lambda: nm.war.Bonuses.from_rounds(rounds)
+
+
+def levels_from_bonuses():
+    rng = np.random.default_rng(SEED)
+    levels = [
+        nm.levels.Levels(
+            mandibule=m, carapace=c, hero_lvl=h, hero_type=nm.levels.HeroType.DEFENSE, dome=d, loge=0
+        ).bonus_dome
+        for m, c, h, d in rng.integers(0, 40, size=(100, 4))
+    ]
+
+    def fn():
+        for dmg, hp in levels:
+            # the heuristics can't explain every level set, which now raises
+            try:
+                nm.levels.Levels.from_bonuses(
+                    dmg, hp, nm.levels.FightZone.DOME, alli_type=nm.levels.AllianceType.NEUTRE, atk=False
+                )
+            except ValueError:
+                pass
+
+    return fn
+
+
+def levels_milp_batch():
+    rng = np.random.default_rng(SEED)
+    bonuses = [
+        nm.levels.Levels(mandibule=m, carapace=c, hero_lvl=h, hero_type=nm.levels.HeroType.VIE, dome=d).bonus_dome
+        for m, c, h, d in rng.integers(0, 40, size=(100, 4))
+    ]
+    dmg, hp = [(b[0], b[0]) for b in bonuses], [(b[1], b[1]) for b in bonuses]
+
+    def fn():
+        # a fresh solver, the cache of the shared one would answer every call but the first
+        nm.levels.LevelsMILP(nm.levels.FightZone.DOME, atk=False).solve_batch(dmg, hp, step=0)
+
+    return fn
+
+
+def levels_milp_realistic():
+    rng = np.random.default_rng(SEED)
+    step = 5e-3
+    dmg, hp = [], []
+    for m, c, d, h, alliance, hero_type in zip(
+        *rng.integers(0, 61, size=(3, 1000)),
+        rng.integers(0, 181, 1000),
+        rng.integers(0, len(nm.levels.ALLIANCES), 1000),
+        rng.integers(0, len(nm.levels.HERO_TYPES), 1000),
+    ):
+        levels = nm.levels.Levels(
+            mandibule=m,
+            carapace=c,
+            hero_lvl=h,
+            hero_type=nm.levels.HERO_TYPES[hero_type],
+            dome=d,
+            alliance=nm.levels.ALLIANCES[alliance],
+        )
+        bonus_dmg, bonus_hp = levels.bonus_dome
+        # bounds rounded to the step like Bonuses.compute_bonuses, the hp being unknown in a fifth of the reports
+        dmg.append((np.floor(bonus_dmg / step) * step, np.ceil(bonus_dmg / step) * step))
+        hp.append(
+            (None, None) if rng.random() < 0.2 else (np.floor(bonus_hp / step) * step, np.ceil(bonus_hp / step) * step)
+        )
+
+    def fn():
+        nm.levels.LevelsMILP(nm.levels.FightZone.DOME, atk=False).solve_batch(dmg, hp, step=step)
+
+    return fn
+
+
+def army_init():
+    units = random_army(np.random.default_rng(SEED), 10**9)._units
+    return lambda: nm.army.Army(units)
+
+
+def army_split_by_hp():
+    army = random_army(np.random.default_rng(SEED), 10**9)
+    hp = army.base_hp / 3
+    return lambda: army.split_by_hp(hp)
+
+
+def simulate_envelope():
+    attacker, defender = random_parties(10**7)
+    # analysis-like bounds, a whole level of uncertainty on every bonus
+    for party in (attacker, defender):
+        party.bonuses = nm.war.Bonuses(
+            party.bonuses.dmg, party.bonuses.hp, party.bonuses.dmg - 0.05, party.bonuses.hp - 0.05
+        )
+    return lambda: nm.war.simulate_envelope(attacker, defender, resolution=5)
+
+
+def find_cheapest_army():
+    defender = nm.war.WarParty(
+        nm.army.Army(JS=100000, S=50000, G=100000, TK=100000), nm.war.Bonuses(0.5, 0.6), atk=False
+    )
+    levels = nm.levels.Levels(mandibule=20, carapace=20, alliance=nm.levels.AllianceType.NEUTRE)
+    return lambda: nm.war.find_cheapest_army(defender, levels, ["E", "ME", "JS", "S", "SE"])
+
+
+def plan_waves():
+    attacker = nm.war.WarParty(nm.army.Army(JS=30000, S=20000, TK=5000), nm.war.Bonuses(0.5, 0.5), atk=True)
+    defender = nm.war.WarParty(nm.army.Army(JS=20000, G=20000, L=5000, TK=3000), nm.war.Bonuses(0.6, 0.8), atk=False)
+    return lambda: nm.war.plan_waves(attacker, defender, max_waves=6, resolution=3)
+
+
+def size_flood():
+    defender = nm.war.WarParty(nm.army.Army(JS=20000, G=20000, L=5000, TK=3000), nm.war.Bonuses(0.6, 0.8), atk=False)
+    return lambda: nm.war.size_flood(defender, nm.war.Bonuses(0.5, 0.5), "E")
+
+
+CASES = {
+    "army_init": army_init,
+    "army_split_by_hp": army_split_by_hp,
+    "simulate_battle[small]": simulate_battle(10**3),
+    "simulate_battle[medium]": simulate_battle(10**7),
+    "simulate_battle[2**50]": simulate_battle(2**50),
+    "simulate_envelope[5**4]": simulate_envelope,
+    "find_cheapest_army[5 types]": find_cheapest_army,
+    "plan_waves[6 waves]": plan_waves,
+    "size_flood": size_flood,
+    "army_from_str[x100]": army_from_str,
+    "battle_from_rc": battle_from_rc,
+    "battle_to_rc": battle_to_rc,
+    "bonuses_from_rounds": bonuses_from_rounds,
+    "levels_from_bonuses[x100]": levels_from_bonuses,
+    "levels_milp_batch[x100]": levels_milp_batch,
+    "levels_milp_batch[realistic x1000]": levels_milp_realistic,
+}
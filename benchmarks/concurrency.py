@@ -0,0 +1,72 @@
+"""Throughput of the app engine handlers with N simultaneous users.
+
+python -m benchmarks.concurrency [--users 8] [--requests 20] [--executor process] [--workers 4]
+
+Each user sends its requests one after the other through nawminator.workers, as the Gradio handlers do, while a
+probe measures how late the event loop wakes up, i.e. how long cheap UI updates would wait.
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import nawminator as nm
+from .cases import random_parties
+
+
+async def user(parties: list[tuple], latencies: list[float]):
+    for attacker, defender in parties:
+        start = time.perf_counter()
+        await nm.workers.run(nm.workers.simulate_rc, attacker, defender)
+        latencies.append(time.perf_counter() - start)
+
+
+async def probe(lags: list[float], period: float = 0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - start - period)
+
+
+async def load(users: int, requests: int, max_count: int) -> dict:
+    # distinct armies for each request, so that the simulation cache can't serve them
+    parties = [[random_parties(max_count, seed=u * requests + r) for r in range(requests)] for u in range(users)]
+    await nm.workers.run(
+        nm.workers.simulate_rc, *random_parties(max_count, seed=users * requests)
+    )  # starts the workers
+    latencies, lags = [], []
+    probe_task = asyncio.create_task(probe(lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(user(p, latencies) for p in parties))
+    elapsed = time.perf_counter() - start
+    probe_task.cancel()
+    return {
+        "requests_per_sec": len(latencies) / elapsed,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        "loop_lag_p99": float(np.percentile(lags, 99)) if lags else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.concurrency", description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20, help="Requests sent by each user")
+    parser.add_argument("--max-count", type=int, default=10**7, help="Maximum unit count of each unit type")
+    parser.add_argument("--executor", choices=["process", "thread", "inline"], default=nm.workers.EXECUTOR)
+    parser.add_argument("--workers", type=int, default=nm.workers.WORKERS)
+    args = parser.parse_args(argv)
+
+    nm.workers.EXECUTOR, nm.workers.WORKERS = args.executor, args.workers
+    result = asyncio.run(load(args.users, args.requests, args.max_count))
+    print(
+        f"{args.users} users, {args.executor} x{args.workers}: {result['requests_per_sec']:,.1f} req/s"
+        f"  latency p50 {result['latency_p50'] * 1e3:,.1f}ms p99 {result['latency_p99'] * 1e3:,.1f}ms"
+        f"  loop lag p99 {result['loop_lag_p99'] * 1e3:,.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import json
+import platform
+import time
+import typing as t
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+
+@dataclass
+class Result:
+    calls: int
+    ops_per_sec: float
+    p50: float
+    p99: float
+
+
+def measure(fn: t.Callable[[], t.Any], min_time: float = 0.5, min_calls: int = 5, warmup: int = 1) -> Result:
+    """Calls fn until min_time seconds and min_calls calls have passed, timing each call separately"""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < min_calls or time.perf_counter() - start < min_time:
+        call_start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - call_start)
+    durations = np.array(durations)
+    p50, p99 = np.percentile(durations, [50, 99])
+    return Result(calls=len(durations), ops_per_sec=len(durations) / durations.sum(), p50=p50, p99=p99)
+
+
+def run(cases: dict[str, t.Callable[[], t.Callable[[], t.Any]]], pattern: str = "", **measure_args) -> dict:
+    """Builds and measures every case whose name contains pattern, printing results as they come"""
+    results = {}
+    for name, setup in cases.items():
+        if pattern not in name:
+            continue
+        result = measure(setup(), **measure_args)
+        print(
+            f"{name:<40} {result.ops_per_sec:>12,.1f} ops/s  p50 {result.p50 * 1e6:>12,.1f}µs"
+            f"  p99 {result.p99 * 1e6:>12,.1f}µs"
+        )
+        results[name] = asdict(result)
+    return {"meta": metadata(), "results": results}
+
+
+def metadata() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save(results: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(old: dict, new: dict, threshold: float = 0.1) -> list[str]:
+    """Prints the ops/sec change of every case in both results, returning the ones slower by more than threshold"""
+    regressions = []
+    for name, new_result in new["results"].items():
+        if (old_result := old["results"].get(name)) is None:
+            continue
+        change = new_result["ops_per_sec"] / old_result["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<40} {old_result['ops_per_sec']:>12,.1f} -> {new_result['ops_per_sec']:>12,.1f} ops/s  {change:+.1%}{flag}"
+        )
+    return regressions
@@ -0,0 +1,58 @@
+"""Import time of the engine, measured with python -X importtime in fresh interpreters.
+
+python -m benchmarks.startup [--module nawminator] [--runs 10] [-o results.json]
+
+Results are written in the format of python -m benchmarks run, so that python -m benchmarks compare can check them
+for regressions. The run fails if a UI module gets imported along with the engine.
+"""
+
+import argparse
+import subprocess
+import sys
+
+import numpy as np
+
+from . import harness
+
+FORBIDDEN_MODULES = ("gradio", "pandas", "scipy")
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in µs of every module imported by module, from a fresh interpreter"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="nawminator")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    if forbidden := sorted({m.split(".")[0] for m in runs[0]} & set(FORBIDDEN_MODULES)):
+        print(f"import {args.module} pulls in {', '.join(forbidden)}")
+        return 1
+
+    results = {}
+    for name in (args.module, *(m for m in runs[0] if m.startswith(f"{args.module}."))):
+        durations = np.array([run[name] for run in runs]) * 1e-6
+        p50, p99 = np.percentile(durations, [50, 99])
+        results[f"import {name}"] = {"calls": len(durations), "ops_per_sec": 1 / p50, "p50": p50, "p99": p99}
+        print(f"import {name:<35} p50 {p50 * 1e3:>8,.1f}ms  p99 {p99 * 1e3:>8,.1f}ms")
+    if args.output:
+        harness.save({"meta": harness.metadata(), "results": results}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
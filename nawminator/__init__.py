@@ -1 +1,12 @@
-from . import army, utils, interface, levels, battle, war
+import importlib
+
+from . import metrics, army, utils, levels, battle, war
+
+# UI, service and export modules are only imported on first access, so that the engine doesn't pay for gradio or pandas
+_LAZY_MODULES = {"interface", "workers", "server", "export", "store"}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
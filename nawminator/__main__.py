@@ -0,0 +1,5 @@
+import sys
+
+from nawminator.cli import main
+
+sys.exit(main())
@@ -1,4 +1,5 @@
 import gradio as gr
+from loguru import logger
 from nawminator.utils import seconds_to_yjhms, format_yjhms
 import nawminator as nm
 import numpy as np
@@ -23,6 +24,7 @@ with gr.Blocks(title="Nawminator") as demo:
                 inputs=[army_input.state, *bonuses],
                 outputs=output,
             )
+            @nm.metrics.timed("app.compute_duration")
             def compute_duration(army: nm.army.Army, tdp, bonus_alli):
                 durations, total_duration = army.recruit_time(tdp, bonus_alli)
                 return format_yjhms(seconds_to_yjhms(total_duration))
@@ -176,17 +178,22 @@ with gr.Blocks(title="Nawminator") as demo:
                     show_progress="hidden",
                 )
                 def invert_players(*args):
-                    print("Invert!")
+                    logger.debug("Invert!")
                     return args
 
                 @gr.on(
                     triggers=simu_btn.click,
                     inputs=[attacker_party_state, defender_party_state, lieu_input],
                     outputs=output,
+                    concurrency_limit=nm.workers.WORKERS,
+                    concurrency_id="engine",
                 )
-                def simulate_fight(atk_party: nm.war.WarParty, def_party: nm.war.WarParty, lieu: nm.levels.FightZone):
-                    battle = nm.war.simulate_battle(attacker=atk_party, defender=def_party)
-                    return gr.Textbox(value=battle.to_rc(), label=f"Résultat en {lieu}")
+                @nm.metrics.timed("app.simulate_fight")
+                async def simulate_fight(
+                    atk_party: nm.war.WarParty, def_party: nm.war.WarParty, lieu: nm.levels.FightZone
+                ):
+                    rc = await nm.workers.run(nm.workers.simulate_rc, atk_party, def_party)
+                    return gr.Textbox(value=rc, label=f"Résultat en {lieu}")
 
                 @gr.on(
                     triggers=analyse_button.click,
@@ -209,12 +216,15 @@ with gr.Blocks(title="Nawminator") as demo:
                         *defender_levels_input.input_fields,
                     ],
                     show_progress="hidden",
+                    concurrency_limit=nm.workers.WORKERS,
+                    concurrency_id="engine",
                 )
-                def analyse_fight(rc: str, lieu: nm.levels.FightZone, atk_alli, def_alli):
-                    attacker, defender = nm.war.analyze_battle(nm.battle.Battle.from_rc(rc))
-                    attacker_levels = l = nm.levels.Levels.from_bonuses(
-                        attacker.bonuses.dmg, attacker.bonuses.hp, lieu=lieu, alli_type=atk_alli, atk=True
+                @nm.metrics.timed("app.analyse_fight")
+                async def analyse_fight(rc: str, lieu: nm.levels.FightZone, atk_alli, def_alli):
+                    attacker, defender, attacker_levels, defender_levels = await nm.workers.run(
+                        nm.workers.analyse_rc, rc, lieu, atk_alli, def_alli
                     )
+                    l = attacker_levels
 
                     attacker_levels_fields = [
                         l.mandibule,
@@ -225,9 +235,7 @@ with gr.Blocks(title="Nawminator") as demo:
                         l.loge,
                         l.alliance,
                     ]
-                    defender_levels = l = nm.levels.Levels.from_bonuses(
-                        defender.bonuses.dmg, defender.bonuses.hp, lieu=lieu, alli_type=def_alli, atk=False
-                    )
+                    l = defender_levels
                     defender_levels_fields = [
                         l.mandibule,
                         l.carapace,
@@ -253,5 +261,8 @@ with gr.Blocks(title="Nawminator") as demo:
 
             defender_col.render()
 
+# Cheap UI updates run unbounded, the engine events are limited to the worker count above
+demo.queue(default_concurrency_limit=None, max_size=nm.workers.QUEUE_SIZE)
+
 if __name__ == "__main__":
     demo.launch(server_name="0.0.0.0")
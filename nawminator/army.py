@@ -1,5 +1,8 @@
+import typing as t
+
 import numpy as np
 import regex as re
+from .metrics import timed
 from .utils import parse_naw_int, NAW_INT_REGEX
 
 MAX_UNIT_COUNT = 2**56
@@ -43,18 +46,110 @@ unit_stats = np.array(
     dtype=np.int64,
 )
 
+# Largest unit count per type whose army hp, times four, can't overflow an int64 when splitting it by hp
+_INT64_HP_UNIT_COUNT = 2**60 // (len(unit_names) * int(unit_stats[:, 0].max()))
+
+_ARMY_PATTERN = re.compile(
+    rf"^.*?(?={"|".join(rf"(?:{unit_regex}\s*:\s*{NAW_INT_REGEX}|{NAW_INT_REGEX}\s+{unit_regex})" for name, short_name, unit_regex in unit_names)})"
+    + rf"\W*".join(
+        rf"(?:{unit_regex}\s*:\s*(?P<{short_name}>{NAW_INT_REGEX})|(?P<{short_name}>{NAW_INT_REGEX})\s+{unit_regex})?"
+        for name, short_name, unit_regex in unit_names
+    ),
+    flags=re.IGNORECASE,
+)
+
+
+def _parse_units(s: str) -> list[int]:
+    match = _ARMY_PATTERN.search(s)
+    if match is None:
+        raise ValueError(f"Cannot parse army {s}")
+    return [parse_naw_int(i) if i is not None else 0 for i in match.groups()]
+
+
+def split_units_by_count(units: np.ndarray, cnt: np.int64 | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Removes cnt units from the first unit types, row-wise for a N×15 array with N counts"""
+    units = np.asarray(units, dtype=np.int64)
+    cnt = np.asarray(cnt, dtype=np.int64)[..., np.newaxis]
+    units_before = np.cumsum(units, axis=-1) - units
+    lost = np.clip(cnt - units_before, 0, units)
+    return lost, units - lost
+
+
+def split_units_by_hp(units: np.ndarray, hp: np.float64 | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Removes hp base hp from the first unit types, row-wise for a N×15 array with N hp values.
+
+    Partial losses round half up as floor(0.5 + dmg / unit hp), computed in integers from floor(2 * hp) so that they
+    stay exact for any count, in python ints when the hp of an army could overflow an int64"""
+    units = np.asarray(units, dtype=np.int64)
+    hp = np.asarray(hp, dtype=np.float64)[..., np.newaxis]
+    unit_hps = units * unit_stats[:, 0]
+    if units.size and units.max() > _INT64_HP_UNIT_COUNT:
+        unit_hps = unit_hps.astype(object)
+    hp_after = np.cumsum(unit_hps, axis=-1)
+    double_hp = np.minimum(np.maximum(np.floor(2 * hp), -1), 2 * hp_after[..., -1:].astype(np.float64) + 2)
+    double_hp = double_hp.astype(np.int64) if unit_hps.dtype != object else np.frompyfunc(int, 1, 1)(double_hp)
+    # floor(0.5 + (hp - hp_before) / unit_hp) == (floor(2 * hp) - 2 * hp_before + unit_hp) // (2 * unit_hp)
+    lost = (double_hp - 2 * (hp_after - unit_hps) + unit_stats[:, 0]) // (2 * unit_stats[:, 0])
+    lost = np.minimum(np.maximum(lost, 0), units).astype(np.int64)
+    return lost, units - lost
+
+
+# Recruit time multipliers by TDP level and alliance quest bonus. Built with the python power so that the
+# durations don't change by a second from the previous 0.95**tdp * 0.99**bonus_alli
+RECRUIT_TABLE_SIZE = 101
+TDP_MULTIPLIERS = np.array([0.95**level for level in range(RECRUIT_TABLE_SIZE)])
+ALLI_MULTIPLIERS = np.array([0.99**level for level in range(RECRUIT_TABLE_SIZE)])
+
+# First unit of each xp line, e.g. JS for JS/S/SE
+_XP_LINES = np.array([0, 2, 5, 7, 9, 12])
+
+
+def _multipliers(table: np.ndarray, base: float, levels) -> np.ndarray:
+    """Multipliers of the levels, looked up in the table when they all are integers in it and computed with the
+    python power otherwise, e.g. for a TDP of 120 or 10.5"""
+    levels = np.asarray(levels, dtype=np.float64)
+    if ((levels == np.floor(levels)) & (levels >= 0) & (levels < len(table))).all():
+        return table[levels.astype(np.intp)]
+    return np.array([base ** float(level) for level in levels.ravel()]).reshape(levels.shape)
+
+
+def reduced_recruit_time(raw_durations: np.ndarray, tdp=0, bonus_alli=0) -> np.ndarray:
+    """Sums the raw durations along the last axis once reduced by the TDP and alliance quest bonus, flooring
+    each unit type's duration"""
+    reduced_durations = (
+        raw_durations * _multipliers(TDP_MULTIPLIERS, 0.95, tdp) * _multipliers(ALLI_MULTIPLIERS, 0.99, bonus_alli)
+    )
+    return np.floor(reduced_durations).astype(np.int64).sum(axis=-1)
+
+
+def non_xp_units(units: np.ndarray) -> np.ndarray:
+    """Moves every unit to the first unit of its xp line"""
+    grouped = np.zeros_like(units)
+    grouped[..., _XP_LINES] = np.add.reduceat(units, _XP_LINES, axis=-1)
+    return grouped
+
 
 class Army:
+    __slots__ = ("_units",)
+
     def __init__(self, units: np.array = None, **units_args):
         if units is None:
             units = [units_args.setdefault(short_name, 0) for name, short_name, _ in unit_names]
         assert len(units) == len(unit_names), f"Expected array of length {len(unit_names)}, got {len(units)}"
         self._units: np.ndarray = np.array(units, dtype=np.int64)
-        if (max_unit := max(self._units)) > MAX_UNIT_COUNT:
+        if (max_unit := self._units.max()) > MAX_UNIT_COUNT:
             raise ValueError(
                 f"Can't have {max_unit} units of any type without risking overflows, maximum is {MAX_UNIT_COUNT}"
             )
 
+    @classmethod
+    def _wrap(cls, units: np.ndarray) -> "Army":
+        """Wraps an already validated int64 array, without copying it. For internal use on arrays derived from
+        validated armies, e.g. split results."""
+        army = cls.__new__(cls)
+        army._units = units
+        return army
+
     def __add__(self, other: "Army"):
         if not isinstance(other, Army):
             raise TypeError(f"Expected type Army for addition, got {type(other)}")
@@ -64,9 +159,9 @@ class Army:
         if not isinstance(other, Army):
             raise TypeError(f"Expected type Army for substraction, got {type(other)}")
         new_units = self._units - other._units
-        if min(new_units) < 0:
+        if (new_units < 0).any():
             raise ValueError(f"Can't subtract more units than there are.")
-        return Army(new_units)
+        return Army._wrap(new_units)
 
     def __eq__(self, other: "Army"):
         if not isinstance(other, Army):
@@ -93,74 +188,34 @@ class Army:
         return np.sum(self._units * unit_stats[:, 0].transpose()).sum()
 
     @classmethod
+    @timed("Army.from_str", lambda army: {"units": army.count})
     def from_str(cls, s: str) -> "Army":
-        print(s)
-        pattern = rf"^.*?(?={"|".join(rf"(?:{unit_regex}\s*:\s*{NAW_INT_REGEX}|{NAW_INT_REGEX}\s+{unit_regex})" for name, short_name, unit_regex in unit_names)})"
-        pattern += rf"\W*".join(
-            rf"(?:{unit_regex}\s*:\s*(?P<{short_name}>{NAW_INT_REGEX})|(?P<{short_name}>{NAW_INT_REGEX})\s+{unit_regex})?"
-            for name, short_name, unit_regex in unit_names
-        )
+        return cls(units=_parse_units(s))
 
-        match = re.search(pattern, s, flags=re.IGNORECASE)
-        if match is None:
-            raise ValueError(f"Cannot parse army {s}")
-
-        armee = np.array(
-            [parse_naw_int(i) if i is not None else 0 for i in match.groups()],
-            dtype=np.int64,
-        )
-        return cls(units=armee)
+    @classmethod
+    def from_strs(cls, strings: t.Iterable[str], as_armies: bool = False) -> np.ndarray | list["Army"]:
+        """Parses many army strings at once, as a N×15 array of unit counts or as a list of Army"""
+        units = np.array([_parse_units(s) for s in strings], dtype=np.int64).reshape(-1, len(unit_names))
+        if as_armies:
+            return [cls(units=row) for row in units]
+        return units
 
     def split_by_count(self, cnt: np.int64) -> tuple["Army", "Army"]:
-        armee = self._units
-        lost = np.zeros_like(armee, dtype=np.int64)
-        left = armee.copy()
-        to_remove = cnt
-        for i, unit_count in enumerate(armee):
-            units_lost = min(to_remove, unit_count)
-            units_left = unit_count - units_lost
-            to_remove = to_remove - units_lost
-            lost[i] = units_lost
-            left[i] = units_left
-        return Army(lost), Army(left)
+        lost, left = split_units_by_count(self._units, cnt)
+        return Army._wrap(lost), Army._wrap(left)
 
     def split_by_hp(self, hp: np.float64):
-        armee = self._units
-        lost = np.zeros_like(armee, dtype=np.int64)
-        left = armee.copy()
-        unit_hps = armee * unit_stats[:, 0].transpose()
-        hp_left_to_remove = hp
-        for i, row_hp in enumerate(unit_hps):
-            if hp_left_to_remove == 0:
-                break
-            dmg = min(row_hp, hp_left_to_remove)
-            units_lost = np.floor(0.5 + (dmg / unit_stats[i, 0])).astype(np.int64)  # Avoids round half to even rounding
-            lost[i] += units_lost
-            left[i] -= units_lost
-            hp_left_to_remove -= dmg
-
-        return Army(lost), Army(left)
+        lost, left = split_units_by_hp(self._units, hp)
+        return Army._wrap(lost), Army._wrap(left)
 
     def recruit_time(self, tdp=0, bonus_alli=0):
-        raw_durations = self._units * unit_stats[:, 3].transpose()
-        reduced_durations = raw_durations * 0.95**tdp * 0.99**bonus_alli
-        total_duration = np.floor(reduced_durations).astype(np.int64).sum()
-
-        return self._units * unit_stats[:, 3].transpose(), total_duration
+        raw_durations = self._units * unit_stats[:, 3]
+        return raw_durations, reduced_recruit_time(raw_durations, tdp, bonus_alli)
 
     def non_xp_recruit_time(self, tdp=0, bonus_alli=0):
-        units = self._units.copy()
-        units[0:2] = np.sum(units[0:2]), *np.zeros(1)
-        units[2:5] = np.sum(units[2:5]), *np.zeros(2)
-        units[5:7] = np.sum(units[5:7]), *np.zeros(1)
-        units[7:9] = np.sum(units[7:9]), *np.zeros(1)
-        units[9:12] = np.sum(units[9:12]), *np.zeros(2)
-        units[12:15] = np.sum(units[12:15]), *np.zeros(2)
-        raw_durations = units * unit_stats[:, 3].transpose()
-        reduced_durations = raw_durations * 0.95**tdp * 0.99**bonus_alli
-        total_duration = np.floor(reduced_durations).astype(np.int64).sum()
-
-        return self._units * unit_stats[:, 3].transpose(), total_duration
+        raw_durations = self._units * unit_stats[:, 3]
+        non_xp_durations = non_xp_units(self._units) * unit_stats[:, 3]
+        return raw_durations, reduced_recruit_time(non_xp_durations, tdp, bonus_alli)
 
     def to_str(self) -> str:
         return ", ".join(
@@ -177,6 +232,110 @@ class Army:
         )
 
 
+class ArmyBatch:
+    """Many armies stored as the rows of a single contiguous N×15 array"""
+
+    def __init__(self, units: np.ndarray):
+        units = np.ascontiguousarray(units, dtype=np.int64)
+        if units.ndim != 2 or units.shape[1] != len(unit_names):
+            raise ValueError(f"Expected array of shape (N, {len(unit_names)}), got {units.shape}")
+        if units.size and (max_unit := units.max()) > MAX_UNIT_COUNT:
+            raise ValueError(
+                f"Can't have {max_unit} units of any type without risking overflows, maximum is {MAX_UNIT_COUNT}"
+            )
+        self._units: np.ndarray = units
+
+    @classmethod
+    def _wrap(cls, units: np.ndarray) -> "ArmyBatch":
+        batch = cls.__new__(cls)
+        batch._units = units
+        return batch
+
+    @classmethod
+    def from_armies(cls, armies: t.Iterable[Army]) -> "ArmyBatch":
+        return cls(np.array([a._units for a in armies], dtype=np.int64).reshape(-1, len(unit_names)))
+
+    @classmethod
+    def from_strs(cls, strings: t.Iterable[str]) -> "ArmyBatch":
+        return cls._wrap(Army.from_strs(strings))
+
+    def __len__(self) -> int:
+        return len(self._units)
+
+    def __getitem__(self, key) -> "Army | ArmyBatch":
+        if isinstance(key, (int, np.integer)):
+            return Army._wrap(self._units[key])
+        return ArmyBatch._wrap(np.ascontiguousarray(self._units[key]))
+
+    def __iter__(self) -> t.Iterator[Army]:
+        return (Army._wrap(row) for row in self._units)
+
+    def __add__(self, other: "ArmyBatch | Army"):
+        if not isinstance(other, (ArmyBatch, Army)):
+            raise TypeError(f"Expected type ArmyBatch or Army for addition, got {type(other)}")
+        return ArmyBatch(self._units + other._units)
+
+    def __sub__(self, other: "ArmyBatch | Army"):
+        if not isinstance(other, (ArmyBatch, Army)):
+            raise TypeError(f"Expected type ArmyBatch or Army for substraction, got {type(other)}")
+        new_units = self._units - other._units
+        if (new_units < 0).any():
+            raise ValueError(f"Can't subtract more units than there are.")
+        return ArmyBatch._wrap(new_units)
+
+    def __eq__(self, other: "ArmyBatch"):
+        if not isinstance(other, ArmyBatch):
+            return False
+        return self._units.shape == other._units.shape and (self._units == other._units).all()
+
+    def __repr__(self):
+        return self._units.__repr__()
+
+    @property
+    def units(self) -> np.ndarray:
+        return self._units
+
+    @property
+    def count(self) -> np.ndarray:
+        return self._units.sum(axis=1)
+
+    @property
+    def stats(self) -> np.ndarray:
+        """N×3 array of (base_hp, base_atk, base_def)"""
+        return self._units @ unit_stats[:, :3]
+
+    @property
+    def base_hp(self) -> np.ndarray:
+        return self.stats[:, 0]
+
+    @property
+    def base_atk(self) -> np.ndarray:
+        return self.stats[:, 1]
+
+    @property
+    def base_def(self) -> np.ndarray:
+        return self.stats[:, 2]
+
+    def recruit_time(self, tdp=0, bonus_alli=0) -> tuple[np.ndarray, np.ndarray]:
+        raw_durations = self._units * unit_stats[:, 3]
+        return raw_durations, reduced_recruit_time(raw_durations, tdp, bonus_alli)
+
+    def recruit_time_grid(self, tdps, bonus_allis, non_xp=False) -> np.ndarray:
+        """Total recruit time of every army for every TDP level and alliance quest bonus, as an
+        armies × tdps × bonus_allis int64 array. non_xp counts every unit at the price of its non xp variant."""
+        units = non_xp_units(self._units) if non_xp else self._units
+        raw_durations = units * unit_stats[:, 3]
+        tdp_multipliers = _multipliers(TDP_MULTIPLIERS, 0.95, tdps)
+        alli_multipliers = _multipliers(ALLI_MULTIPLIERS, 0.99, bonus_allis)
+
+        durations = np.empty((len(self), len(tdp_multipliers), len(alli_multipliers)), dtype=np.int64)
+        # One tdp level at a time keeps the temporary at armies × bonus_allis × 15
+        for i, tdp_multiplier in enumerate(tdp_multipliers):
+            reduced_durations = raw_durations[:, None, :] * tdp_multiplier * alli_multipliers[:, None]
+            np.floor(reduced_durations).astype(np.int64).sum(axis=2, out=durations[:, i])
+        return durations
+
+
 def last_units_hp(army: Army):
     last_unit_idx = max(army._units.nonzero()[0])
     return unit_stats[last_unit_idx, 0]
@@ -1,12 +1,21 @@
-import functools
 import itertools as it
+import os
+import typing as t
 from dataclasses import dataclass
 
 import numpy as np
 import regex as re
 
-from nawminator.army import Army
-from nawminator.utils import format_naw_int, NAW_INT_REGEX, parse_naw_int
+from nawminator.army import Army, split_units_by_count, unit_names
+from nawminator.metrics import timed
+from nawminator.utils import format_naw_int, map_chunks, NAW_INT_REGEX, parse_naw_int
+
+_ATTACKER_PATTERN = re.compile(r"Troupe en attaque : (.*?)\n")
+_DEFENDER_PATTERN = re.compile(r"Troupe en défense : (.*?)\n")
+_DAMAGE_PATTERN = re.compile(
+    rf"^.*?inflige\w* ({NAW_INT_REGEX}) \(\+ ({NAW_INT_REGEX})\) dégâts .*? tu\w+ ({NAW_INT_REGEX}) (unités?|ennemis?)\W*$",
+    re.MULTILINE,
+)
 
 
 @dataclass
@@ -19,23 +28,109 @@ class Round:
     attacker_losses: Army
 
 
-@dataclass
+@dataclass(init=False, eq=False)
 class Battle:
+    """A battle stored as round arrays: R-length damage vectors and R×15 loss matrices.
+
+    Round objects are only created on demand, through rounds.
+    """
+
     attacker: Army
     defender: Army
-    rounds: list[Round]
+    attacker_base_dmg: np.ndarray
+    attacker_bonus_dmg: np.ndarray
+    defender_base_dmg: np.ndarray
+    defender_bonus_dmg: np.ndarray
+    attacker_losses: np.ndarray
+    defender_losses: np.ndarray
+
+    def __init__(self, attacker: Army, defender: Army, rounds: t.Sequence[Round] = ()):
+        self.attacker = attacker
+        self.defender = defender
+        self.attacker_base_dmg = np.array([r.attacker_base_dmg for r in rounds], dtype=np.int64)
+        self.attacker_bonus_dmg = np.array([r.attacker_bonus_dmg for r in rounds], dtype=np.float64)
+        self.defender_base_dmg = np.array([r.defender_base_dmg for r in rounds], dtype=np.int64)
+        self.defender_bonus_dmg = np.array([r.defender_bonus_dmg for r in rounds], dtype=np.float64)
+        self.attacker_losses = np.array([r.attacker_losses._units for r in rounds], dtype=np.int64).reshape(
+            len(rounds), len(unit_names)
+        )
+        self.defender_losses = np.array([r.defender_losses._units for r in rounds], dtype=np.int64).reshape(
+            len(rounds), len(unit_names)
+        )
 
     @classmethod
-    def from_rc(cls, rc: str):
-        attacker = Army.from_str(re.search(r"Troupe en attaque : (.*?)\n", rc).group(1))
-        defender = Army.from_str(re.search(r"Troupe en défense : (.*?)\n", rc).group(1))
+    def from_arrays(
+        cls,
+        attacker: Army,
+        defender: Army,
+        attacker_base_dmg: np.ndarray,
+        attacker_bonus_dmg: np.ndarray,
+        defender_base_dmg: np.ndarray,
+        defender_bonus_dmg: np.ndarray,
+        attacker_losses: np.ndarray,
+        defender_losses: np.ndarray,
+    ) -> "Battle":
+        """Wraps already built round arrays, without copying them"""
+        battle = cls.__new__(cls)
+        battle.attacker = attacker
+        battle.defender = defender
+        battle.attacker_base_dmg = attacker_base_dmg
+        battle.attacker_bonus_dmg = attacker_bonus_dmg
+        battle.defender_base_dmg = defender_base_dmg
+        battle.defender_bonus_dmg = defender_bonus_dmg
+        battle.attacker_losses = attacker_losses
+        battle.defender_losses = defender_losses
+        return battle
 
-        res = re.findall(
-            rf"^.*?inflige\w* ({NAW_INT_REGEX}) \(\+ ({NAW_INT_REGEX})\) dégâts .*? tu\w+ ({NAW_INT_REGEX}) (unités?|ennemis?)\W*$",
-            rc,
-            re.MULTILINE,
+    def __eq__(self, other: "Battle"):
+        if not isinstance(other, Battle):
+            return NotImplemented
+        return (
+            self.attacker == other.attacker
+            and self.defender == other.defender
+            and all(
+                np.array_equal(getattr(self, name), getattr(other, name))
+                for name in (
+                    "attacker_base_dmg",
+                    "attacker_bonus_dmg",
+                    "defender_base_dmg",
+                    "defender_bonus_dmg",
+                    "attacker_losses",
+                    "defender_losses",
+                )
+            )
         )
 
+    def __len__(self) -> int:
+        return len(self.attacker_base_dmg)
+
+    def round(self, i: int) -> Round:
+        return Round(
+            attacker_base_dmg=self.attacker_base_dmg[i],
+            attacker_bonus_dmg=self.attacker_bonus_dmg[i],
+            defender_base_dmg=self.defender_base_dmg[i],
+            defender_bonus_dmg=self.defender_bonus_dmg[i],
+            attacker_losses=Army._wrap(self.attacker_losses[i]),
+            defender_losses=Army._wrap(self.defender_losses[i]),
+        )
+
+    @property
+    def rounds(self) -> list[Round]:
+        """Round views of the round arrays, built on each access"""
+        return [self.round(i) for i in range(len(self))]
+
+    @classmethod
+    @timed("Battle.from_rc", lambda battle: {"rounds": len(battle)})
+    def from_rc(cls, rc: str):
+        if (attacker_match := _ATTACKER_PATTERN.search(rc)) is None:
+            raise ValueError(f"Cannot find the attacking troops in {rc}")
+        if (defender_match := _DEFENDER_PATTERN.search(rc)) is None:
+            raise ValueError(f"Cannot find the defending troops in {rc}")
+        attacker = Army.from_str(attacker_match.group(1))
+        defender = Army.from_str(defender_match.group(1))
+
+        res = _DAMAGE_PATTERN.findall(rc)
+
         damage_lines = [(parse_naw_int(a), parse_naw_int(b), parse_naw_int(c)) for a, b, c, d in res]
 
         if len(damage_lines) % 2 != 0:
@@ -43,26 +138,26 @@ class Battle:
                 f"The number of rounds in the rapport is uneven. Parsed {len(damage_lines)} rounds from {rc}"
             )
 
-        cur_atk = attacker
-        cur_def = defender
-        rounds = []
-        for atk, riposte in it.batched(damage_lines, n=2):
-            atk_loss, cur_atk = cur_atk.split_by_count(riposte[2])
-            def_loss, cur_def = cur_def.split_by_count(atk[2])
-            rounds.append(
-                Round(
-                    attacker_base_dmg=np.int64(atk[0]),
-                    attacker_bonus_dmg=np.float64(atk[1]),
-                    attacker_losses=atk_loss,
-                    defender_base_dmg=np.int64(riposte[0]),
-                    defender_bonus_dmg=np.float64(riposte[1]),
-                    defender_losses=def_loss,
-                )
+        # attack and riposte lines alternate, as (base dmg, bonus dmg, kills)
+        attacks = np.array(damage_lines[0::2], dtype=np.int64).reshape(-1, 3)
+        ripostes = np.array(damage_lines[1::2], dtype=np.int64).reshape(-1, 3)
+
+        def losses(army: Army, kills: np.ndarray) -> np.ndarray:
+            # removing kills round after round from the first unit types is removing their running total at once
+            lost, _ = split_units_by_count(
+                np.broadcast_to(army._units, (len(kills), len(unit_names))), np.cumsum(kills)
             )
-        return cls(
-            attacker=attacker,
-            defender=defender,
-            rounds=rounds,
+            return np.diff(lost, axis=0, prepend=np.zeros((1, len(unit_names)), dtype=np.int64))
+
+        return cls.from_arrays(
+            attacker,
+            defender,
+            attacker_base_dmg=attacks[:, 0],
+            attacker_bonus_dmg=attacks[:, 1].astype(np.float64),
+            defender_base_dmg=ripostes[:, 0],
+            defender_bonus_dmg=ripostes[:, 1].astype(np.float64),
+            attacker_losses=losses(attacker, ripostes[:, 2]),
+            defender_losses=losses(defender, attacks[:, 2]),
         )
 
     def to_rc(self) -> str:
@@ -74,22 +169,22 @@ Troupe en défense : {self.defender.to_str()}.
 Combat
 """
 
-        for r in self.rounds:
+        attacker_kills = self.defender_losses.sum(axis=1)
+        defender_kills = self.attacker_losses.sum(axis=1)
+        for i in range(len(self)):
             rapport += "L'attaquant inflige {} (+ {}) dégâts au défenseur et tue {} unités.\n".format(
-                format_naw_int(round(r.attacker_base_dmg)),
-                format_naw_int(round(r.attacker_bonus_dmg)),
-                format_naw_int(r.defender_losses.count),
+                format_naw_int(round(self.attacker_base_dmg[i])),
+                format_naw_int(round(self.attacker_bonus_dmg[i])),
+                format_naw_int(attacker_kills[i]),
             )
             rapport += "Le défenseur inflige {} (+ {}) dégâts à l'attaquant et tue {} unités.\n".format(
-                format_naw_int(round(r.defender_base_dmg)),
-                format_naw_int(round(r.defender_bonus_dmg)),
-                format_naw_int(r.attacker_losses.count),
+                format_naw_int(round(self.defender_base_dmg[i])),
+                format_naw_int(round(self.defender_bonus_dmg[i])),
+                format_naw_int(defender_kills[i]),
             )
 
         rapport += "\nAprès combat\n"
-        total_atk_losses, total_def_losses = self.get_total_losses()
-        final_atk = self.attacker - total_atk_losses
-        final_def = self.defender - total_def_losses
+        final_atk, final_def = self.get_left_armies()
         if final_atk.count != 0:
             rapport += f"Troupe restante à l'attaquant (avant xp): {final_atk.to_str()}\n"
         if final_def.count != 0:
@@ -97,22 +192,180 @@ Combat
 
         return rapport.strip()
 
-    def __hash__(self):
-        return id(self)
+    def get_armies_by_round(self) -> tuple[np.ndarray, np.ndarray]:
+        """(R + 1)×15 arrays of the attacker and defender armies before each round, then after the last one"""
+        zeros = np.zeros((1, len(unit_names)), dtype=np.int64)
+        return (
+            self.attacker._units - np.cumsum(np.vstack([zeros, self.attacker_losses]), axis=0),
+            self.defender._units - np.cumsum(np.vstack([zeros, self.defender_losses]), axis=0),
+        )
 
-    @functools.cache
     def get_total_losses(self) -> tuple[Army, Army]:
-        total_atk_losses = sum(
-            (r.attacker_losses for r in self.rounds),
-            start=Army(),
-        )
-        total_def_losses = sum(
-            (r.defender_losses for r in self.rounds),
-            start=Army(),
-        )
-        return total_atk_losses, total_def_losses
+        return Army._wrap(self.attacker_losses.sum(axis=0)), Army._wrap(self.defender_losses.sum(axis=0))
 
-    @functools.cache
     def get_left_armies(self) -> tuple[Army, Army]:
         atk_loss, def_loss = self.get_total_losses()
         return self.attacker - atk_loss, self.defender - def_loss
+
+    @property
+    def stalemate(self) -> bool:
+        """Both armies still stand and the last round killed nobody, no later round could have changed anything"""
+        if len(self) == 0 or self.attacker_losses[-1].any() or self.defender_losses[-1].any():
+            return False
+        attacker, defender = self.get_left_armies()
+        return attacker.count > 0 and defender.count > 0
+
+
+@dataclass(eq=False)
+class BattleBatch:
+    """Many battles stored as flat round arrays: the rounds of battle i are the rows offsets[i]:offsets[i + 1]."""
+
+    attackers: np.ndarray
+    defenders: np.ndarray
+    offsets: np.ndarray
+    attacker_base_dmg: np.ndarray
+    attacker_bonus_dmg: np.ndarray
+    defender_base_dmg: np.ndarray
+    defender_bonus_dmg: np.ndarray
+    attacker_losses: np.ndarray
+    defender_losses: np.ndarray
+
+    @classmethod
+    def from_battles(cls, battles: t.Iterable[Battle]) -> "BattleBatch":
+        """Concatenates the round arrays of the battles"""
+        battles = list(battles) if not isinstance(battles, Battle) else [battles]
+        offsets = np.zeros(len(battles) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in battles], out=offsets[1:])
+        empty = Battle(Army(), Army())
+        return cls(
+            np.array([b.attacker._units for b in battles], dtype=np.int64).reshape(-1, len(unit_names)),
+            np.array([b.defender._units for b in battles], dtype=np.int64).reshape(-1, len(unit_names)),
+            offsets,
+            *(
+                np.concatenate([getattr(b, name) for b in battles] or [getattr(empty, name)])
+                for name in (
+                    "attacker_base_dmg",
+                    "attacker_bonus_dmg",
+                    "defender_base_dmg",
+                    "defender_bonus_dmg",
+                    "attacker_losses",
+                    "defender_losses",
+                )
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Battle:
+        rounds = slice(self.offsets[i], self.offsets[i + 1])
+        return Battle.from_arrays(
+            attacker=Army._wrap(self.attackers[i]),
+            defender=Army._wrap(self.defenders[i]),
+            attacker_base_dmg=self.attacker_base_dmg[rounds],
+            attacker_bonus_dmg=self.attacker_bonus_dmg[rounds],
+            defender_base_dmg=self.defender_base_dmg[rounds],
+            defender_bonus_dmg=self.defender_bonus_dmg[rounds],
+            attacker_losses=self.attacker_losses[rounds],
+            defender_losses=self.defender_losses[rounds],
+        )
+
+    def __iter__(self) -> t.Iterator[Battle]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def rounds(self) -> np.ndarray:
+        """Number of rounds of each battle"""
+        return np.diff(self.offsets)
+
+    def get_total_losses(self) -> tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0:
+            return np.zeros_like(self.attackers), np.zeros_like(self.defenders)
+        starts = self.offsets[:-1]
+        return np.add.reduceat(self.attacker_losses, starts), np.add.reduceat(self.defender_losses, starts)
+
+    def get_left_armies(self) -> tuple[np.ndarray, np.ndarray]:
+        atk_loss, def_loss = self.get_total_losses()
+        return self.attackers - atk_loss, self.defenders - def_loss
+
+    @property
+    def stalemates(self) -> np.ndarray:
+        """Battle.stalemate of every battle"""
+        last = np.maximum(self.offsets[1:] - 1, 0)
+        killed = np.zeros(len(self), dtype=bool)
+        if len(self.attacker_losses):
+            killed = self.attacker_losses[last].any(axis=1) | self.defender_losses[last].any(axis=1)
+        attackers, defenders = self.get_left_armies()
+        return (self.rounds > 0) & ~killed & (attackers.sum(axis=1) > 0) & (defenders.sum(axis=1) > 0)
+
+
+@dataclass
+class RCError:
+    """A report of a dump that could not be parsed, index being its position in the dump"""
+
+    index: int
+    rc: str
+    message: str
+
+
+def split_rcs(lines: t.Iterable[str]) -> t.Iterator[str]:
+    """Splits the lines of a dump into reports, a new report starting at each "Troupe en attaque" line.
+
+    Whatever precedes the first report is dropped, and the header lines of a report end up at the tail of the
+    previous one, which Battle.from_rc ignores.
+    """
+    report = []
+    for line in lines:
+        if line.lstrip().startswith("Troupe en attaque :") and report:
+            yield "".join(report)
+            report = []
+        if report or line.lstrip().startswith("Troupe en attaque :"):
+            report.append(line if line.endswith("\n") else line + "\n")
+    if report:
+        yield "".join(report)
+
+
+def _parse_rcs(rcs: t.Sequence[str]) -> list[Battle | str]:
+    """Parses a chunk of reports, malformed ones being replaced by their error message"""
+    results = []
+    for rc in rcs:
+        try:
+            results.append(Battle.from_rc(rc))
+        except ValueError as e:
+            results.append(str(e))
+    return results
+
+
+def iter_rcs(
+    source: str | os.PathLike | t.TextIO,
+    errors: list[RCError] | None = None,
+    jobs: int | None = None,
+    chunk_size: int = 256,
+) -> t.Iterator[Battle]:
+    """Lazily parses every report of a dump, in order.
+
+    source is a path or an open text file, read line by line. Malformed reports are appended to errors and
+    skipped, or raise a ValueError if errors is None. With jobs > 1, chunks of chunk_size reports are parsed by a
+    pool of jobs processes, with at most 2 * jobs chunks in flight so that memory stays bounded.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8") as f:
+            yield from iter_rcs(f, errors=errors, jobs=jobs, chunk_size=chunk_size)
+        return
+
+    chunks = it.batched(split_rcs(source), chunk_size)
+    index = 0
+
+    def collect(chunk: t.Sequence[str], results: list[Battle | str]) -> t.Iterator[Battle]:
+        nonlocal index
+        for rc, result in zip(chunk, results):
+            if isinstance(result, str):
+                if errors is None:
+                    raise ValueError(f"Cannot parse report {index}: {result}")
+                errors.append(RCError(index, rc, result))
+            else:
+                yield result
+            index += 1
+
+    for chunk, results in map_chunks(_parse_rcs, chunks, jobs):
+        yield from collect(chunk, results)
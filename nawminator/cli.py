@@ -0,0 +1,235 @@
+"""Bulk analysis and simulation from the command line, one JSON line out per battle.
+
+python -m nawminator analyze DUMP [DUMP ...] [--zone Dôme] [--atk-alliance Neutre] [--def-alliance Neutre]
+python -m nawminator simulate MATCHUPS.{csv,jsonl}
+
+analyze reads dumps of reports (- for stdin) and writes the bonuses inferred for each battle, with the matching
+levels. simulate reads matchups and writes the outcome of each one. A JSONL matchup is {"attacker": party,
+"defender": party} with the parties of the server API; a CSV one has attacker and defender army columns, with either
+attacker_levels/defender_levels and zone columns, or attacker_dmg, attacker_hp, defender_dmg and defender_hp ones.
+
+Inputs are read lazily and processed chunk_size items at a time by --jobs processes, with a bounded number of chunks
+in flight, and results are written in input order as soon as their chunk is done. Malformed items give an
+{"error": message} line instead of stopping the run.
+"""
+
+import argparse
+import contextlib
+import csv
+import functools
+import itertools as it
+import json
+import sys
+import time
+import typing as t
+
+import nawminator as nm
+from nawminator.levels import AllianceType, FightZone
+from nawminator.utils import map_chunks
+
+
+class Progress:
+    """Count of processed items and errors on stderr, redrawn at most every interval seconds"""
+
+    def __init__(self, enabled: bool = True, interval: float = 0.5):
+        self.enabled = enabled
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self._start = self._last = time.monotonic()
+
+    def update(self, done: int, errors: int):
+        self.done += done
+        self.errors += errors
+        if self.enabled and (now := time.monotonic()) - self._last >= self.interval:
+            self._last = now
+            self._write()
+
+    def close(self):
+        if self.enabled:
+            self._write()
+            if sys.stderr.isatty():
+                sys.stderr.write("\n")
+
+    def _write(self):
+        elapsed = time.monotonic() - self._start
+        line = f"{self.done:,} done, {self.errors:,} errors, {self.done / max(elapsed, 1e-9):,.0f}/s"
+        # redrawn in place on a terminal, one line per update in a log
+        sys.stderr.write(f"\r{line}" if sys.stderr.isatty() else f"{line}\n")
+        sys.stderr.flush()
+
+
+def open_input(path: str, **kwargs) -> t.TextIO:
+    if path == "-":
+        return open(sys.stdin.fileno(), encoding="utf-8", closefd=False, **kwargs)
+    return open(path, encoding="utf-8", **kwargs)
+
+
+def alliance(value: str) -> t.Optional[AllianceType]:
+    return None if value.lower() in ("none", "aucune") else AllianceType(value)
+
+
+### ANALYZE
+
+
+def iter_reports(paths: t.Sequence[str]) -> t.Iterator[tuple[str, int, str]]:
+    """(path, index, report) for every report of every dump"""
+    for path in paths:
+        with open_input(path) as f:
+            for index, rc in enumerate(nm.battle.split_rcs(f)):
+                yield path, index, rc
+
+
+def analyze_chunk(
+    chunk: t.Sequence[tuple[str, int, str]],
+    zone: FightZone,
+    atk_alliance: t.Optional[AllianceType],
+    def_alliance: t.Optional[AllianceType],
+    levels: bool,
+) -> list[dict]:
+    results, analyzed = [], []
+    for path, index, rc in chunk:
+        try:
+            attacker, defender = nm.war.analyze_battle(nm.battle.Battle.from_rc(rc))
+        except ValueError as e:
+            results.append({"file": path, "index": index, "error": str(e)})
+            continue
+        result = {
+            "file": path,
+            "index": index,
+            "attacker": nm.server.bonuses_to_json(attacker.bonuses),
+            "defender": nm.server.bonuses_to_json(defender.bonuses),
+        }
+        results.append(result)
+        analyzed.append((result, attacker, defender))
+    if not levels or not analyzed:
+        return results
+
+    # levels of the whole chunk solved as one batch per side, the heuristics of infer_levels for the unexplained
+    for side, alli_type, atk in (("attacker", atk_alliance, True), ("defender", def_alliance, False)):
+        parties = [attacker if atk else defender for _, attacker, defender in analyzed]
+        inferred = nm.workers.infer_levels_batch([party.bonuses for party in parties], zone, [alli_type], atk)
+        for (result, *_), party, party_levels in zip(analyzed, parties, inferred):
+            if "error" in result:
+                continue
+            try:
+                if party_levels is None:
+                    party_levels = nm.workers.infer_levels(party, zone, alli_type, atk=atk)
+                result[f"{side}_levels"] = party_levels.to_str()
+            except ValueError as e:
+                file, index = result["file"], result["index"]
+                result.clear()
+                result.update({"file": file, "index": index, "error": str(e)})
+    return results
+
+
+### SIMULATE
+
+
+def iter_matchups(path: str, format: t.Optional[str] = None) -> t.Iterator[tuple[int, str | dict]]:
+    """(index, matchup) for every matchup of the file, CSV rows as dicts and JSONL ones as unparsed lines"""
+    format = format or ("csv" if path.endswith(".csv") else "jsonl")
+    with open_input(path, newline="") as f:
+        if format == "csv":
+            yield from enumerate(csv.DictReader(f))
+        else:
+            yield from enumerate(line for line in f if line.strip())
+
+
+def parse_matchup(matchup: str | dict) -> tuple[nm.war.WarParty, nm.war.WarParty]:
+    if isinstance(matchup, str):
+        matchup = json.loads(matchup)
+    else:
+        row, matchup = matchup, {}
+        for side in ("attacker", "defender"):
+            if row.get(f"{side}_levels"):
+                party = {"levels": row[f"{side}_levels"], "zone": row.get("zone") or FightZone.TDC}
+            else:
+                party = {"bonuses": {"dmg": row[f"{side}_dmg"], "hp": row[f"{side}_hp"]}}
+            matchup[side] = {"army": row[side], **party}
+    return nm.server.parse_party(matchup["attacker"], True), nm.server.parse_party(matchup["defender"], False)
+
+
+def simulate_chunk(chunk: t.Sequence[tuple[int, str | dict]]) -> list[dict]:
+    results = []
+    parties = []
+    for index, matchup in chunk:
+        try:
+            parties.append(parse_matchup(matchup))
+            results.append({"index": index})
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            results.append({"index": index, "error": f"{type(e).__name__}: {e}"})
+    if not parties:
+        return results
+
+    battles = nm.war.simulate_battles(
+        [a.army._units for a, _ in parties],
+        [d.army._units for _, d in parties],
+        [(a.bonuses.dmg, a.bonuses.hp) for a, _ in parties],
+        [(d.bonuses.dmg, d.bonuses.hp) for _, d in parties],
+    )
+    attackers_left, defenders_left = battles.get_left_armies()
+    stalemates = battles.stalemates
+    valid = (result for result in results if "error" not in result)
+    for i, result in enumerate(valid):
+        result.update(
+            rounds=int(battles.rounds[i]),
+            attacker_wiped=not attackers_left[i].any(),
+            defender_wiped=not defenders_left[i].any(),
+            stalemate=bool(stalemates[i]),
+            attacker_left=attackers_left[i].tolist(),
+            defender_left=defenders_left[i].tolist(),
+        )
+    return results
+
+
+def run(fn: t.Callable, items: t.Iterable, output: t.TextIO, jobs: int, chunk_size: int, progress: Progress):
+    with contextlib.closing(progress):
+        for _, results in map_chunks(fn, it.batched(items, chunk_size), jobs):
+            output.writelines(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+            output.flush()
+            progress.update(len(results), sum("error" in result for result in results))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m nawminator", description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="Write the JSON lines to this file instead of stdout")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Items sent to a worker at once")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't show the progress on stderr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analyze_parser = subparsers.add_parser("analyze", help="Infer the bonuses and levels of reports")
+    analyze_parser.add_argument("dumps", nargs="+", help="Files of reports, - for stdin")
+    analyze_parser.add_argument("--zone", type=FightZone, default=FightZone.TDC, choices=list(FightZone))
+    for side in ("atk", "def"):
+        analyze_parser.add_argument(
+            f"--{side}-alliance",
+            type=alliance,
+            default=AllianceType.NEUTRE,
+            help=f"{', '.join(AllianceType)} or None, defaults to {AllianceType.NEUTRE}",
+        )
+    analyze_parser.add_argument("--no-levels", action="store_true", help="Only infer the bonuses")
+
+    simulate_parser = subparsers.add_parser("simulate", help="Simulate matchups")
+    simulate_parser.add_argument("matchups", help="CSV or JSONL file of matchups, - for stdin")
+    simulate_parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case "analyze":
+            fn = functools.partial(
+                analyze_chunk,
+                zone=args.zone,
+                atk_alliance=args.atk_alliance,
+                def_alliance=args.def_alliance,
+                levels=not args.no_levels,
+            )
+            items = iter_reports(args.dumps)
+        case "simulate":
+            fn = simulate_chunk
+            items = iter_matchups(args.matchups, args.format)
+
+    with open(args.output, "w", encoding="utf-8") if args.output else contextlib.nullcontext(sys.stdout) as output:
+        run(fn, items, output, args.jobs, args.chunk_size, Progress(enabled=not args.quiet))
+    return 0
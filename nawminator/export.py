@@ -0,0 +1,131 @@
+"""Columnar export of battles, to pandas DataFrames and from there to Parquet or Feather files.
+
+Two tables are available:
+    rounds   one row per round: battle, round, the four damage columns and one losses column per unit type and side,
+             e.g. attacker_losses_JS
+    battles  one row per battle: battle, rounds, the starting armies and total losses per unit type, the total
+             damage dealt by each side and whether the attacker or defender was wiped out, or the battle stalled
+
+Both are built from the round arrays of the battles, no Round or Army object is created. Battles are numbered in
+the order they are given, a Battle, a BattleBatch or any iterable of Battle being accepted, e.g. iter_rcs.
+"""
+
+import itertools as it
+import os
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from nawminator.army import unit_names
+from nawminator.battle import Battle, BattleBatch
+
+Battles = Battle | BattleBatch | t.Iterable[Battle]
+
+_DMG_COLUMNS = ("attacker_base_dmg", "attacker_bonus_dmg", "defender_base_dmg", "defender_bonus_dmg")
+
+
+def as_batch(battles: Battles) -> BattleBatch:
+    if isinstance(battles, BattleBatch):
+        return battles
+    return BattleBatch.from_battles(battles)
+
+
+def _unit_columns(prefix: str, units: np.ndarray) -> dict[str, np.ndarray]:
+    return {f"{prefix}_{short_name}": units[:, i] for i, (_, short_name, _) in enumerate(unit_names)}
+
+
+def rounds_frame(battles: Battles, start: int = 0) -> pd.DataFrame:
+    """One row per round, battles being numbered from start"""
+    batch = as_batch(battles)
+    counts = batch.rounds
+    first_rows = np.repeat(batch.offsets[:-1], counts)
+    return pd.DataFrame(
+        {
+            "battle": np.repeat(np.arange(start, start + len(batch)), counts),
+            "round": np.arange(len(first_rows)) - first_rows,
+            **{name: getattr(batch, name) for name in _DMG_COLUMNS},
+            **_unit_columns("attacker_losses", batch.attacker_losses),
+            **_unit_columns("defender_losses", batch.defender_losses),
+        }
+    )
+
+
+def _sum_by_battle(batch: BattleBatch, values: np.ndarray) -> np.ndarray:
+    cumulated = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=cumulated[1:])
+    return cumulated[batch.offsets[1:]] - cumulated[batch.offsets[:-1]]
+
+
+def battles_frame(battles: Battles, start: int = 0) -> pd.DataFrame:
+    """One summary row per battle, battles being numbered from start"""
+    batch = as_batch(battles)
+    attacker_losses, defender_losses = batch.get_total_losses()
+    attacker_dmg, defender_dmg = (
+        _sum_by_battle(batch, batch.attacker_base_dmg + batch.attacker_bonus_dmg),
+        _sum_by_battle(batch, batch.defender_base_dmg + batch.defender_bonus_dmg),
+    )
+    return pd.DataFrame(
+        {
+            "battle": np.arange(start, start + len(batch)),
+            "rounds": batch.rounds,
+            **_unit_columns("attacker", batch.attackers),
+            **_unit_columns("defender", batch.defenders),
+            **_unit_columns("attacker_losses", attacker_losses),
+            **_unit_columns("defender_losses", defender_losses),
+            "attacker_dmg": attacker_dmg,
+            "defender_dmg": defender_dmg,
+            "attacker_wiped": (batch.attackers == attacker_losses).all(axis=1),
+            "defender_wiped": (batch.defenders == defender_losses).all(axis=1),
+            "stalemate": batch.stalemates,
+        }
+    )
+
+
+def _chunks(battles: Battles, chunk_size: int) -> t.Iterator[BattleBatch]:
+    if isinstance(battles, (Battle, BattleBatch)):
+        yield as_batch(battles)
+        return
+    chunks = it.batched(battles, chunk_size)
+    # an empty first chunk still gives the file its schema
+    first = next(chunks, ())
+    yield as_batch(first)
+    for chunk in chunks:
+        yield as_batch(chunk)
+
+
+def _write(battles: Battles, path: str | os.PathLike, summary: bool, chunk_size: int, new_writer: t.Callable) -> int:
+    import pyarrow as pa
+
+    make_frame = battles_frame if summary else rounds_frame
+    count = 0
+    writer = None
+    try:
+        for batch in _chunks(battles, chunk_size):
+            table = pa.Table.from_pandas(make_frame(batch, start=count), preserve_index=False)
+            if writer is None:
+                writer = new_writer(path, table.schema)
+            writer.write_table(table)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def to_parquet(battles: Battles, path: str | os.PathLike, summary: bool = False, chunk_size: int = 10_000) -> int:
+    """Writes the rounds table, or the battles table if summary, to a Parquet file and returns the number of battles.
+
+    Iterables of battles are written chunk_size battles at a time, each chunk being a row group."""
+    import pyarrow.parquet as pq
+
+    return _write(battles, path, summary, chunk_size, pq.ParquetWriter)
+
+
+def to_feather(battles: Battles, path: str | os.PathLike, summary: bool = False, chunk_size: int = 10_000) -> int:
+    """Writes the rounds table, or the battles table if summary, to a Feather file and returns the number of battles.
+
+    Iterables of battles are written chunk_size battles at a time, each chunk being a record batch."""
+    import pyarrow as pa
+
+    return _write(battles, path, summary, chunk_size, pa.ipc.new_file)
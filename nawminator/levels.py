@@ -1,10 +1,15 @@
+import collections
+import functools
 import re
+import threading
 from dataclasses import dataclass
 
 import numpy as np
 from enum import Enum, StrEnum
 import typing as t
 
+from nawminator.metrics import timed
+
 
 class AllianceType(StrEnum):
     GUERRIER = "Guerrier"
@@ -141,6 +146,7 @@ H{self.hero_type[:1]}{self.hero_lvl}
 A{self.alliance[:1] if self.alliance else "R"}"""
 
     @classmethod
+    @timed("Levels.from_bonuses")
     def from_bonuses(cls, bonus_dmg, bonus_hp, lieu: FightZone, alli_type: AllianceType = None, atk=True):
         step = 1 / 100
         hero_type = HeroType.ATTAQUE
@@ -161,7 +167,7 @@ A{self.alliance[:1] if self.alliance else "R"}"""
             hero_type = HeroType.ATTAQUE if atk else HeroType.DEFENSE
             hero_lvl = 100 + 20 * (unexplained_dmg_bonus % 5)
             explained_dmg_bonus += hero_lvl / 20
-            unexplained_dmg_bonus -= hero_lvl / 20  ## TODO: check if that makes it subzero
+            unexplained_dmg_bonus -= hero_lvl / 20
 
         # no hero needed to explain leftover
         mandi = unexplained_dmg_bonus // 5
@@ -197,13 +203,13 @@ A{self.alliance[:1] if self.alliance else "R"}"""
             unexplained_hp_bonus *= 2
 
             if unexplained_hp_bonus % 5 != 0:
-                hero_type = (HeroType.VIE,)
+                hero_type = HeroType.VIE
                 hero_lvl = 150 + 10 * (unexplained_hp_bonus % 5)
                 explained_hp_bonus += hero_lvl / 10
-                unexplained_hp_bonus -= hero_lvl / 10  # TODO: check if subzero
+                unexplained_hp_bonus -= hero_lvl / 10
             cara = mandi
             explained_hp_bonus += cara * 10
-            unexplained_hp_bonus -= cara * 10  # TODO: check if subzero
+            unexplained_hp_bonus -= cara * 10
 
             dome = unexplained_hp_bonus // 5
 
@@ -213,7 +219,7 @@ A{self.alliance[:1] if self.alliance else "R"}"""
             unexplained_hp_bonus -= 10
 
             if unexplained_hp_bonus % 5 != 0:
-                hero_type = (HeroType.VIE,)
+                hero_type = HeroType.VIE
                 hero_lvl = 100 + 20 * (unexplained_hp_bonus % 5)
                 explained_hp_bonus += hero_lvl / 20
                 unexplained_hp_bonus -= hero_lvl / 20
@@ -225,12 +231,511 @@ A{self.alliance[:1] if self.alliance else "R"}"""
         else:
             raise ValueError(f"Unknown FightZone: {lieu}")
 
+        # the alliance, hero or mandibule can explain more than the bonuses
+        if min(mandi, cara, dome, loge) < 0:
+            raise ValueError(f"Can't explain bonuses of {bonus_dmg} dmg and {bonus_hp} hp with {alli_type} alliance")
+
         return cls(
-            mandibule=mandi,
-            carapace=cara,
-            hero_lvl=hero_lvl,
+            mandibule=int(mandi),
+            carapace=int(cara),
+            hero_lvl=int(hero_lvl),
             hero_type=hero_type,
-            dome=dome,
-            loge=loge,
+            dome=int(dome),
+            loge=int(loge),
             alliance=alli_type,
         )
+
+
+BONUS_UNIT = 0.0005  # a hero level, every level bonus is a multiple of it
+MAX_LEVEL = 60
+MAX_HERO_LVL = 180
+ALLIANCES = [AllianceType.GUERRIER, AllianceType.NEUTRE, AllianceType.PACIFISTE, None]
+HERO_TYPES = list(HeroType)
+
+_TABLE_DTYPE = np.dtype(
+    [
+        ("bonus", np.int64),
+        ("mandibule", np.int64),
+        ("carapace", np.int64),
+        ("dome", np.int64),
+        ("loge", np.int64),
+        ("alliance", np.int64),
+    ]
+)
+CANDIDATE_DTYPE = np.dtype(
+    [
+        ("mandibule", np.int64),
+        ("carapace", np.int64),
+        ("dome", np.int64),
+        ("loge", np.int64),
+        ("alliance", np.int64),
+        ("hero_type", np.int64),
+        ("hero_lvl_min", np.int64),
+        ("hero_lvl_max", np.int64),
+    ]
+)
+
+
+def _to_units(bonus) -> np.ndarray:
+    return np.rint(np.asarray(bonus, dtype=np.float64) / BONUS_UNIT).astype(np.int64)
+
+
+class LevelsIndex:
+    """Sorted tables of the bonuses given by every level, to find all the levels explaining a bonus interval.
+
+    Bonuses are counted in BONUS_UNIT. The dmg bonus only depends on mandibule and alliance, and the hp bonus on
+    carapace, dôme or loge and alliance, so each table holds one of them, the hero being added at query time as a
+    range of levels. Candidates are joined on the alliance.
+    """
+
+    def __init__(self, max_level: int = MAX_LEVEL, max_hero_lvl: int = MAX_HERO_LVL):
+        self.max_hero_lvl = max_hero_lvl
+        levels = np.arange(max_level + 1)
+        zero = np.zeros_like(levels)
+
+        dmg_rows, tdc_rows, dome_rows, loge_rows = [], [], [], []
+        for alli_idx, alliance in enumerate(ALLIANCES):
+            alli_dmg, alli_hp = _to_units(Levels(alliance=alliance)._alli())
+            alli = np.full_like(levels, alli_idx)
+            dmg_rows.append((_to_units(Levels(mandibule=levels)._mandi()) + alli_dmg, levels, zero, zero, zero, alli))
+            cara = _to_units(Levels(carapace=levels)._cara()) + alli_hp
+            tdc_rows.append((cara, zero, levels, zero, zero, alli))
+            c, d = (x.ravel() for x in np.meshgrid(levels, levels, indexing="ij"))
+            dome = _to_units(Levels(carapace=c)._cara()) + _to_units(Levels(dome=d)._dome()) + alli_hp
+            dome_rows.append((dome, np.zeros_like(c), c, d, np.zeros_like(c), np.full_like(c, alli_idx)))
+            loge = _to_units(Levels(carapace=c)._cara()) + _to_units(Levels(loge=d)._loge()) + alli_hp
+            loge_rows.append((loge, np.zeros_like(c), c, np.zeros_like(c), d, np.full_like(c, alli_idx)))
+
+        self._dmg = self._table(dmg_rows)
+        self._hp = {
+            FightZone.TDC: self._table(tdc_rows),
+            FightZone.DOME: self._table(dome_rows),
+            FightZone.LOGE: self._table(loge_rows),
+        }
+
+    @staticmethod
+    def _table(rows: list[tuple[np.ndarray, ...]]) -> np.ndarray:
+        table = np.empty(sum(len(r[0]) for r in rows), dtype=_TABLE_DTYPE)
+        for name, column in zip(_TABLE_DTYPE.names, zip(*rows)):
+            table[name] = np.concatenate(column)
+        return table[np.argsort(table["bonus"], kind="stable")]
+
+    @staticmethod
+    def _range(table: np.ndarray, low: int, high: int) -> np.ndarray:
+        start = np.searchsorted(table["bonus"], low, side="left")
+        stop = np.searchsorted(table["bonus"], high, side="right")
+        return table[start:stop]
+
+    @staticmethod
+    def _interval(bounds: tuple, step: float) -> tuple[int, int]:
+        """Integer bonus interval of (min, max) bounds rounded to step, (None, None) meaning unknown"""
+        low, high = bounds
+        if high is None:
+            return 0, np.iinfo(np.int64).max // 2
+        low = high if low is None else low
+        if step == 0:
+            return int(np.ceil(low / BONUS_UNIT - 1e-6)), int(np.floor(high / BONUS_UNIT + 1e-6))
+        return int(np.floor((low - step) / BONUS_UNIT + 1e-6)) + 1, int(np.ceil((high + step) / BONUS_UNIT - 1e-6)) - 1
+
+    def _join(
+        self, dmg_rows: np.ndarray, hp_rows: np.ndarray, hero_type: HeroType, hero_min: np.ndarray, hero_max: np.ndarray
+    ) -> np.ndarray:
+        """Pairs of dmg and hp rows with the same alliance, hero_min/hero_max being len(dmg_rows)×len(hp_rows)"""
+        valid = (dmg_rows["alliance"][:, np.newaxis] == hp_rows["alliance"][np.newaxis, :]) & (hero_min <= hero_max)
+        d, h = np.nonzero(valid)
+        candidates = np.empty(len(d), dtype=CANDIDATE_DTYPE)
+        candidates["mandibule"] = dmg_rows["mandibule"][d]
+        for name in ("carapace", "dome", "loge", "alliance"):
+            candidates[name] = hp_rows[name][h]
+        candidates["hero_type"] = HERO_TYPES.index(hero_type)
+        candidates["hero_lvl_min"] = hero_min[d, h]
+        candidates["hero_lvl_max"] = hero_max[d, h]
+        return candidates
+
+    def query(
+        self,
+        dmg: tuple,
+        hp: tuple,
+        lieu: FightZone,
+        atk: bool = True,
+        alli_types: t.Optional[t.Sequence[t.Optional[AllianceType]]] = None,
+        step: float = 5e-3,
+    ) -> np.ndarray:
+        """Every level set whose bonuses fall in the (min, max) dmg and hp intervals.
+
+        Bounds are taken as rounded to step like in Bonuses.compute_bonuses, so the true bonus is strictly within
+        one step of them, a min of None meaning the bound is exact and a max of None that it is unknown.
+        Returns a CANDIDATE_DTYPE array, alliance and hero_type being indices in ALLIANCES and HERO_TYPES, each
+        row standing for every hero level from hero_lvl_min to hero_lvl_max. Rows are sorted by total level.
+        """
+        return self._query(*self._interval(dmg, step), *self._interval(hp, step), lieu, atk, alli_types)
+
+    def _query(
+        self,
+        dmg_low: int,
+        dmg_high: int,
+        hp_low: int,
+        hp_high: int,
+        lieu: FightZone,
+        atk: bool = True,
+        alli_types: t.Optional[t.Sequence[t.Optional[AllianceType]]] = None,
+    ) -> np.ndarray:
+        """LevelsIndex.query on integer bonus intervals"""
+        hp_table = self._hp[FightZone.TDC if atk else lieu]
+        if alli_types is not None:
+            alli_idx = [ALLIANCES.index(a) for a in alli_types]
+            hp_table = hp_table[np.isin(hp_table["alliance"], alli_idx)]
+        max_hero = self.max_hero_lvl
+
+        def full(shape: tuple, value: int) -> np.ndarray:
+            return np.full(shape, value, dtype=np.int64)
+
+        # the hero adds to the dmg bonus
+        dmg_rows, hp_rows = self._range(self._dmg, dmg_low - max_hero, dmg_high), self._range(hp_table, hp_low, hp_high)
+        shape = (len(dmg_rows), len(hp_rows))
+        dmg_hero = self._join(
+            dmg_rows,
+            hp_rows,
+            HeroType.ATTAQUE if atk else HeroType.DEFENSE,
+            np.broadcast_to(np.maximum(0, dmg_low - dmg_rows["bonus"])[:, np.newaxis], shape),
+            np.broadcast_to(np.minimum(max_hero, dmg_high - dmg_rows["bonus"])[:, np.newaxis], shape),
+        )
+        # the hero adds to the hp bonus
+        dmg_rows, hp_rows = self._range(self._dmg, dmg_low, dmg_high), self._range(hp_table, hp_low - max_hero, hp_high)
+        shape = (len(dmg_rows), len(hp_rows))
+        hp_hero = self._join(
+            dmg_rows,
+            hp_rows,
+            HeroType.VIE,
+            np.broadcast_to(np.maximum(0, hp_low - hp_rows["bonus"])[np.newaxis, :], shape),
+            np.broadcast_to(np.minimum(max_hero, hp_high - hp_rows["bonus"])[np.newaxis, :], shape),
+        )
+        # the hero adds to neither
+        hp_rows = self._range(hp_table, hp_low, hp_high)
+        shape = (len(dmg_rows), len(hp_rows))
+        no_hero = self._join(
+            dmg_rows, hp_rows, HeroType.DEFENSE if atk else HeroType.ATTAQUE, full(shape, 0), full(shape, max_hero)
+        )
+
+        candidates = np.concatenate([dmg_hero, hp_hero, no_hero])
+        total = candidates["mandibule"] + candidates["carapace"] + candidates["dome"] + candidates["loge"]
+        return candidates[np.lexsort((-candidates["hero_lvl_max"], candidates["hero_type"], total))]
+
+    @staticmethod
+    def to_levels(candidate: np.void) -> Levels:
+        """Levels of a query row, with its highest hero level"""
+        return Levels(
+            mandibule=int(candidate["mandibule"]),
+            carapace=int(candidate["carapace"]),
+            hero_lvl=int(candidate["hero_lvl_max"]),
+            hero_type=HERO_TYPES[candidate["hero_type"]],
+            dome=int(candidate["dome"]),
+            loge=int(candidate["loge"]),
+            alliance=ALLIANCES[candidate["alliance"]],
+        )
+
+
+@functools.cache
+def levels_index() -> LevelsIndex:
+    """The LevelsIndex of the default level ranges, built on first use"""
+    return LevelsIndex()
+
+
+def bonus_interval(bounds: tuple, step: float) -> tuple[float, float]:
+    """Lowest and highest bonus that (min, max) bounds rounded to step can stand for, read like in LevelsIndex.query"""
+    low, high = LevelsIndex._interval(bounds, step)
+    return low * BONUS_UNIT, high * BONUS_UNIT
+
+
+# Variables of one level inference MILP: the levels, the alliance and hero type indicators, the hero level on dmg
+# and on hp, |carapace - mandibule| and an indicator skipping the bonus constraints of infeasible analyses
+_MILP_LEVELS = slice(0, 4)
+_MILP_ALLI = slice(4, 8)
+_MILP_HERO = slice(8, 11)
+_HD, _HV, _SPREAD, _SKIP = 11, 12, 13, 14
+_MILP_VARS = 15
+# Analyses solved in a single program by LevelsMILP.solve_batch
+MILP_BLOCK = 16
+# Widest bonus interval, in BONUS_UNIT, that LevelsMILP.solve_batch answers from the LevelsIndex rather than the MILP,
+# the joins of the index growing with the square of the width
+MILP_INDEX_WIDTH = 200
+
+
+class LevelsMILP:
+    """Level inference as a mixed-integer program solved by scipy.optimize.milp, bonuses counted in BONUS_UNIT:
+
+        dmg = 100 mandibule + alliance + hero on dmg
+        hp  = 100 carapace + 50 dôme + 100 loge + zone + alliance + hero on hp
+
+    one alliance and one hero type being picked, the hero level only adding to the bonus of its type, and both
+    bonuses falling in their intervals. The plausibility prior is the lowest total level, then the carapace level
+    closest to the mandibule one. Analyses share a single program in batch, each one being a diagonal block.
+
+    A program takes HiGHS about 5ms an analysis, so solve_batch answers the analyses whose both intervals are at
+    most MILP_INDEX_WIDTH wide from a LevelsIndex, at thousands per second, and only solves the ones with a wider
+    or unknown bound, at about 200 per second.
+    """
+
+    def __init__(
+        self,
+        lieu: FightZone,
+        atk: bool = True,
+        max_level: int = MAX_LEVEL,
+        max_hero_lvl: int = MAX_HERO_LVL,
+        cache_size: int = 1 << 16,
+    ):
+        self.zone = FightZone.TDC if atk else lieu
+        self.atk = atk
+        self.max_level = max_level
+        self.max_hero_lvl = max_hero_lvl
+        self.hero_types = [
+            HeroType.ATTAQUE if atk else HeroType.DEFENSE,
+            HeroType.VIE,
+            HeroType.DEFENSE if atk else HeroType.ATTAQUE,
+        ]
+
+        alli_dmg, alli_hp = np.array([_to_units(Levels(alliance=alliance)._alli()) for alliance in ALLIANCES]).T
+        self.zone_hp = {
+            FightZone.TDC: 0,
+            FightZone.DOME: _to_units(Levels()._dome()),
+            FightZone.LOGE: _to_units(Levels()._loge()),
+        }[self.zone]
+        self.dmg_row = np.zeros(_MILP_VARS)
+        self.dmg_row[0] = _to_units(Levels(mandibule=1)._mandi())
+        self.dmg_row[_MILP_ALLI] = alli_dmg
+        self.dmg_row[_HD] = 1
+        self.hp_row = np.zeros(_MILP_VARS)
+        self.hp_row[1] = _to_units(Levels(carapace=1)._cara())
+        self.hp_row[2] = _to_units(Levels(dome=1)._dome() - Levels()._dome())
+        self.hp_row[3] = _to_units(Levels(loge=1)._loge() - Levels()._loge())
+        self.hp_row[_MILP_ALLI] = alli_hp
+        self.hp_row[_HV] = 1
+        # past the highest bonus, intervals are clipped so that skipping the constraints is always enough
+        self.max_bonus = int(
+            max(self.dmg_row[:_SKIP] @ self._upper(None)[:_SKIP], self.hp_row[:_SKIP] @ self._upper(None)[:_SKIP])
+        )
+        big = self.max_bonus + 2
+
+        def row(*items: tuple[int, float]) -> np.ndarray:
+            r = np.zeros(_MILP_VARS)
+            for j, value in items:
+                r[j] = value
+            return r
+
+        self.rows = np.array(
+            [
+                self.dmg_row + row((_SKIP, big)),
+                self.dmg_row + row((_SKIP, -big)),
+                self.hp_row + row((_SKIP, big)),
+                self.hp_row + row((_SKIP, -big)),
+                row(*((j, 1) for j in range(_MILP_ALLI.start, _MILP_ALLI.stop))),
+                row(*((j, 1) for j in range(_MILP_HERO.start, _MILP_HERO.stop))),
+                row((_HD, 1), (_MILP_HERO.start, -max_hero_lvl)),
+                row((_HV, 1), (_MILP_HERO.start + 1, -max_hero_lvl)),
+                row((_SPREAD, 1), (1, -1), (0, 1)),
+                row((_SPREAD, 1), (1, 1), (0, -1)),
+            ]
+        )
+        # total level first, spread second, skipping last
+        self.level_weight = max_level + 1
+        self.objective = np.zeros(_MILP_VARS)
+        self.objective[_MILP_LEVELS] = self.level_weight
+        self.objective[_SPREAD] = 1
+        self.objective[_SKIP] = self.level_weight * (4 * max_level + 2)
+        self.cache_size = cache_size
+        self._cache: collections.OrderedDict[tuple, np.ndarray] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def index(self) -> LevelsIndex:
+        if (self.max_level, self.max_hero_lvl) == (MAX_LEVEL, MAX_HERO_LVL):
+            return levels_index()
+        return LevelsIndex(self.max_level, self.max_hero_lvl)
+
+    def _upper(self, alli_types: t.Optional[t.Sequence[t.Optional[AllianceType]]]) -> np.ndarray:
+        upper = np.ones(_MILP_VARS)
+        upper[_MILP_LEVELS] = [
+            self.max_level,
+            self.max_level,
+            self.max_level if self.zone == FightZone.DOME else 0,
+            self.max_level if self.zone == FightZone.LOGE else 0,
+        ]
+        if alli_types is not None:
+            upper[_MILP_ALLI] = [alliance in alli_types for alliance in ALLIANCES]
+        upper[[_HD, _HV]] = self.max_hero_lvl
+        upper[_SPREAD] = self.max_level
+        return upper
+
+    def _row_bounds(self, dmg: np.ndarray, hp: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Lower and upper bounds of the rows of every analysis, dmg and hp being N×2 integer intervals"""
+        dmg = np.clip(dmg, -1, self.max_bonus + 1)
+        hp = np.clip(hp - self.zone_hp, -1, self.max_bonus + 1)
+        n = len(dmg)
+        low = np.tile([0, -np.inf, 0, -np.inf, 1, 1, -np.inf, -np.inf, 0, 0], (n, 1)).astype(np.float64)
+        high = np.tile([np.inf, 0, np.inf, 0, 1, 1, 0, 0, np.inf, np.inf], (n, 1)).astype(np.float64)
+        low[:, 0], high[:, 1], low[:, 2], high[:, 3] = dmg[:, 0], dmg[:, 1], hp[:, 0], hp[:, 1]
+        return low.ravel(), high.ravel()
+
+    def _candidates(self, solutions: np.ndarray, dmg: np.ndarray, hp: np.ndarray) -> np.ndarray:
+        """CANDIDATE_DTYPE rows of solutions, each with every hero level keeping its bonuses in the intervals"""
+        solutions = np.rint(solutions).astype(np.int64)
+        # bonuses without the hero
+        dmg_rest = solutions[:, :_HD] @ self.dmg_row[:_HD].astype(np.int64)
+        hp_rest = solutions[:, :_HD] @ self.hp_row[:_HD].astype(np.int64) + self.zone_hp
+        hero = solutions[:, _MILP_HERO].argmax(axis=1)
+        hero_min = np.select([hero == 0, hero == 1], [dmg[:, 0] - dmg_rest, hp[:, 0] - hp_rest], 0)
+        hero_max = np.select([hero == 0, hero == 1], [dmg[:, 1] - dmg_rest, hp[:, 1] - hp_rest], self.max_hero_lvl)
+
+        candidates = np.empty(len(solutions), dtype=CANDIDATE_DTYPE)
+        for name, column in zip(("mandibule", "carapace", "dome", "loge"), solutions[:, _MILP_LEVELS].T):
+            candidates[name] = column
+        candidates["alliance"] = solutions[:, _MILP_ALLI].argmax(axis=1)
+        candidates["hero_type"] = np.array([HERO_TYPES.index(hero_type) for hero_type in self.hero_types])[hero]
+        candidates["hero_lvl_min"] = np.maximum(0, hero_min)
+        candidates["hero_lvl_max"] = np.minimum(self.max_hero_lvl, hero_max)
+        return candidates
+
+    def _solve(self, objective, rows, low, high, lower, upper) -> t.Optional[np.ndarray]:
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        result = milp(
+            objective,
+            integrality=np.ones(len(objective)),
+            bounds=Bounds(lower, upper),
+            constraints=LinearConstraint(rows, low, high),
+            # objectives are integers, only an exact optimum is the most plausible
+            options={"mip_rel_gap": 0},
+        )
+        return None if result.x is None else np.rint(result.x)
+
+    def _solve_index(self, dmg: tuple[int, int], hp: tuple[int, int], alli_types) -> np.ndarray:
+        """Solution of an analysis picked among the LevelsIndex candidates with the objective of the program"""
+        candidates = self.index._query(*dmg, *hp, self.zone, self.atk, alli_types)
+        x = np.zeros(_MILP_VARS)
+        if len(candidates) == 0:
+            x[[_MILP_ALLI.start, _MILP_HERO.start, _SKIP]] = 1
+            return x
+        levels = np.array([candidates[name] for name in ("mandibule", "carapace", "dome", "loge")]).T
+        spread = np.abs(levels[:, 1] - levels[:, 0])
+        best = candidates[np.argmin(levels.sum(axis=1) * self.level_weight + spread)]
+        x[_MILP_LEVELS] = [best["mandibule"], best["carapace"], best["dome"], best["loge"]]
+        x[_MILP_ALLI.start + best["alliance"]] = 1
+        x[_MILP_HERO.start + self.hero_types.index(HERO_TYPES[best["hero_type"]])] = 1
+        x[_SPREAD] = abs(best["carapace"] - best["mandibule"])
+        return x
+
+    def _solve_block(self, dmg: np.ndarray, hp: np.ndarray, alli_types) -> np.ndarray:
+        """Solutions of the analyses of integer intervals dmg and hp, as one program of len(dmg) diagonal blocks"""
+        import scipy.sparse
+
+        n = len(dmg)
+        low, high = self._row_bounds(dmg, hp)
+        x = self._solve(
+            np.tile(self.objective, n),
+            scipy.sparse.kron(scipy.sparse.eye(n), scipy.sparse.csr_array(self.rows), format="csr"),
+            low,
+            high,
+            np.zeros(n * _MILP_VARS),
+            np.tile(self._upper(alli_types), n),
+        )
+        return x.reshape(n, _MILP_VARS)
+
+    def solve_batch(
+        self,
+        dmg: t.Sequence[tuple],
+        hp: t.Sequence[tuple],
+        alli_types: t.Optional[t.Sequence[t.Optional[AllianceType]]] = None,
+        step: float = 5e-3,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """One most plausible level set for each pair of (min, max) dmg and hp bounds, read like in
+        LevelsIndex.query, as a CANDIDATE_DTYPE array and a mask of the analyses no level set explains.
+
+        Analyses are deduplicated on their integer intervals and the solutions kept in an LRU cache. The others
+        are looked up in the LevelsIndex when narrow enough, and solved MILP_BLOCK at a time otherwise, past which
+        HiGHS gets slower per analysis."""
+        dmg = np.array([LevelsIndex._interval(bounds, step) for bounds in dmg], dtype=np.int64).reshape(-1, 2)
+        hp = np.array([LevelsIndex._interval(bounds, step) for bounds in hp], dtype=np.int64).reshape(-1, 2)
+        alli_key = None if alli_types is None else tuple(ALLIANCES.index(alliance) for alliance in alli_types)
+        keys = [(alli_key, *d, *h) for d, h in zip(dmg.tolist(), hp.tolist())]
+
+        with self._lock:
+            found = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in found:
+                self._cache.move_to_end(key)
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        narrow = [key for key in missing if max(key[2] - key[1], key[4] - key[3]) <= MILP_INDEX_WIDTH]
+        for key in narrow:
+            found[key] = self._solve_index(key[1:3], key[3:5], alli_types)
+        wide = [key for key in missing if key not in found]
+        for i in range(0, len(wide), MILP_BLOCK):
+            block = np.array([key[1:] for key in wide[i : i + MILP_BLOCK]], dtype=np.int64)
+            found.update(zip(wide[i : i + MILP_BLOCK], self._solve_block(block[:, :2], block[:, 2:], alli_types)))
+        with self._lock:
+            for key in missing:
+                self._cache[key] = found[key]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        solutions = np.array([found[key] for key in keys]).reshape(-1, _MILP_VARS)
+        return self._candidates(solutions, dmg, hp), solutions[:, _SKIP] == 1
+
+    def solve(
+        self,
+        dmg: tuple,
+        hp: tuple,
+        alli_types: t.Optional[t.Sequence[t.Optional[AllianceType]]] = None,
+        step: float = 5e-3,
+        max_solutions: int = 8,
+    ) -> np.ndarray:
+        """Up to max_solutions equally plausible level sets for (min, max) dmg and hp bounds, as CANDIDATE_DTYPE
+        rows sorted like LevelsIndex.query ones, and empty if no level set explains the bonuses.
+
+        The objective of the optimum is fixed and every solution found cut off in turn. With a fixed sum of the
+        levels, spread, alliance and hero type indicators, another solution has at least one of them over its
+        value in the previous one. The hero level isn't part of a solution, each row standing for all that fit."""
+        dmg_interval = np.array([LevelsIndex._interval(dmg, step)], dtype=np.int64)
+        hp_interval = np.array([LevelsIndex._interval(hp, step)], dtype=np.int64)
+        low, high = self._row_bounds(dmg_interval, hp_interval)
+        rows, low, high = list(self.rows), list(low), list(high)
+        lower, upper = np.zeros(_MILP_VARS), self._upper(alli_types)
+        upper[_SKIP] = 0
+        picked = [j for j in range(_HD) if upper[j] > 0] + [_SPREAD]
+
+        solutions = []
+        while len(solutions) < max_solutions:
+            n_vars = len(lower)
+            padded = np.array([np.pad(row, (0, n_vars - len(row))) for row in rows])
+            x = self._solve(np.pad(self.objective, (0, n_vars - _MILP_VARS)), padded, low, high, lower, upper)
+            if x is None:
+                break
+            solutions.append(x[:_MILP_VARS])
+            if len(solutions) == 1:
+                rows.append(self.objective)
+                low.append(self.objective @ x[:_MILP_VARS])
+                high.append(self.objective @ x[:_MILP_VARS])
+
+            # z_k = 1 forces the kth variable below its upper bound over its value in x, one of them must be
+            above = [j for j in picked if x[j] < upper[j]]
+            if not above:
+                break
+            lower = np.concatenate([lower, np.zeros(len(above))])
+            upper = np.concatenate([upper, np.ones(len(above))])
+            rows.append(np.concatenate([np.zeros(n_vars), np.ones(len(above))]))
+            low.append(1)
+            high.append(np.inf)
+            for k, j in enumerate(above):
+                force = np.zeros(len(lower))
+                force[[j, n_vars + k]] = 1, -(x[j] + 1)
+                rows.append(force)
+                low.append(0)
+                high.append(np.inf)
+
+        if not solutions:
+            return np.empty(0, dtype=CANDIDATE_DTYPE)
+        candidates = self._candidates(np.array(solutions), dmg_interval, hp_interval)
+        return candidates[np.lexsort((-candidates["hero_lvl_max"], candidates["hero_type"]))]
+
+
+@functools.cache
+def levels_milp(lieu: FightZone, atk: bool = True) -> LevelsMILP:
+    """The LevelsMILP of the default level ranges for a fight zone and side, kept with its cache"""
+    return LevelsMILP(lieu, atk)
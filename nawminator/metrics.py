@@ -0,0 +1,127 @@
+"""Opt-in timing of the hot paths, logged through loguru as JSON lines.
+
+Configured from the environment, when the package is imported:
+    NAWMINATOR_METRICS           "1" to time the functions decorated with timed, off by default
+    NAWMINATOR_METRICS_INTERVAL  seconds between two flushes of the aggregates, defaults to 60
+    NAWMINATOR_METRICS_FILE      file the JSON lines are also written to, one aggregate per line
+
+Every flush logs one line per metric with its count and p50/p95/p99 since the previous flush, durations in
+milliseconds, e.g. {"metric": "simulate_battle", "time": 1721800000.0, "count": 120, "p50": 0.04, ...} then
+{"metric": "simulate_battle.rounds", ...} for the values recorded along. When off, timed returns the function itself
+and loguru isn't even imported.
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import typing as t
+
+import numpy as np
+
+ENABLED = os.environ.get("NAWMINATOR_METRICS", "0") not in ("", "0")
+INTERVAL = float(os.environ.get("NAWMINATOR_METRICS_INTERVAL", 60))
+FILE = os.environ.get("NAWMINATOR_METRICS_FILE")
+
+# Samples kept per metric between two flushes, the count stays exact past it
+MAX_SAMPLES = 100_000
+
+
+class Metrics:
+    """Samples of every metric since the last flush"""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self._counts: dict[str, int] = {}
+        self._samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, name: str, value: float):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            samples = self._samples.setdefault(name, [])
+            if len(samples) < MAX_SAMPLES:
+                samples.append(value)
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def aggregates(self, reset: bool = False) -> list[dict]:
+        with self._lock:
+            counts, samples = self._counts, self._samples
+            if reset:
+                self._counts, self._samples = {}, {}
+                self._last_flush = time.monotonic()
+        aggregates = []
+        for name, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            aggregates.append(
+                {
+                    "metric": name,
+                    "time": time.time(),
+                    "count": counts[name],
+                    "p50": float(p50),
+                    "p95": float(p95),
+                    "p99": float(p99),
+                    "max": float(max(values)),
+                }
+            )
+        return aggregates
+
+    def flush(self):
+        from loguru import logger
+
+        for aggregate in self.aggregates(reset=True):
+            logger.bind(metrics=aggregate).info(json.dumps(aggregate))
+
+
+metrics = Metrics()
+
+
+def _record(name: str, start: int, measure: t.Optional[t.Callable], result):
+    metrics.record(name, (time.perf_counter_ns() - start) / 1e6)
+    if measure is not None:
+        for key, value in measure(result).items():
+            metrics.record(f"{name}.{key}", value)
+
+
+def timed(name: str, measure: t.Optional[t.Callable[[t.Any], dict[str, float]]] = None) -> t.Callable:
+    """Records the duration of every call of the decorated function under name, and the values returned by
+    measure(result) under name.key. Does nothing unless metrics are enabled."""
+
+    def decorator(fn: t.Callable) -> t.Callable:
+        if not ENABLED:
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                result = await fn(*args, **kwargs)
+                _record(name, start, measure, result)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            result = fn(*args, **kwargs)
+            _record(name, start, measure, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+if ENABLED:
+    if FILE:
+        from loguru import logger
+
+        logger.add(FILE, format="{message}", filter=lambda record: "metrics" in record["extra"])
+    atexit.register(metrics.flush)
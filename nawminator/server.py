@@ -0,0 +1,338 @@
+"""Headless JSON API of the engine, on the standard library http.server, without the Gradio UI.
+
+python -m nawminator.server [--host 0.0.0.0] [--port 7861]
+
+Every endpoint takes and returns a JSON object, batch endpoints taking lists:
+    POST /simulate           {"attacker": party, "defender": party}
+    POST /simulate/batch     {"matchups": [{"attacker": party, "defender": party}, ...]}
+    POST /simulate/envelope  {"attacker": party, "defender": party, "resolution": int, "step": float}
+    POST /plan/waves         {"attacker": party, "defender": party, "max_waves": int, "resolution": int,
+                              "objective": "losses" or "ponte"}
+    POST /plan/flood         {"attacker": party without army, "defender": party, "unit_type": str, "tdp": int,
+                              "bonus_alli": int}
+    POST /analyze            {"rc": str}
+    POST /analyze/batch      {"rcs": [str, ...], "zone": str, "atk_alliance": str, "def_alliance": str}
+    POST /recruit_time       {"army": army, "tdp": int, "bonus_alli": int}
+    POST /recruit_time/batch {"armies": [army, ...], "tdp": int, "bonus_alli": int}
+    POST /recruit_time/grid  {"armies": [army, ...], "tdps": [int, ...], "bonus_allis": [int, ...], "non_xp": bool}
+    GET  /health
+
+An army is a string as pasted from the game, a list of 15 unit counts or a {short name: count} object. A party
+is {"army": army, "bonuses": {"dmg": float, "hp": float}}, optionally with "min_dmg" and "min_hp" bounds, or
+{"army": army, "levels": str, "zone": str}, the zone only mattering for the defender.
+
+The envelope takes the bounds as the bonus range, unless given the step /analyze rounds them to (0.005), then
+spanning every bonus within one step of them like the level inference does.
+
+Given a zone, /analyze/batch also infers the most plausible levels of every side, null where none explain its
+bonuses. An alliance restricts them to it, null meaning no alliance and a missing one any alliance.
+"""
+
+import argparse
+import http.server
+import json
+import math
+import typing as t
+
+from loguru import logger
+
+from nawminator.army import Army, ArmyBatch
+from nawminator.battle import Battle
+from nawminator.levels import AllianceType, FightZone, Levels
+from nawminator.war import (
+    Bonuses,
+    BonusBounds,
+    WarParty,
+    analyze_battle,
+    plan_waves,
+    size_flood,
+    simulate_battle,
+    simulate_battles,
+    simulate_envelope,
+)
+from nawminator.workers import infer_levels_batch
+
+MAX_BODY_SIZE = 1 << 20
+MAX_BATCH_SIZE = 10_000
+# Largest bonus accepted in a party, far above what any level gives, so that multipliers stay finite
+MAX_BONUS = 1000.0
+
+
+def parse_army(army: str | list | dict) -> Army:
+    match army:
+        case str():
+            return Army.from_str(army)
+        case list():
+            return Army(army)
+        case dict():
+            return Army(**army)
+        case _:
+            raise ValueError(f"Cannot interpret {army!r} as an army")
+
+
+def parse_bonus(name: str, value) -> float:
+    """A finite bonus of at most MAX_BONUS, over -1 for hp and at least -1 for dmg, -1 meaning no damage at all"""
+    bonus = float(value)
+    low_ok = bonus > -1 if "hp" in name else bonus >= -1
+    if not (math.isfinite(bonus) and low_ok and bonus <= MAX_BONUS):
+        raise ValueError(f"Invalid {name} bonus {value!r}")
+    return bonus
+
+
+def parse_party(party: dict, atk: bool) -> WarParty:
+    army = parse_army(party["army"])
+    if "bonuses" in party:
+        bonuses = {
+            name: None if value is None else parse_bonus(name, value) for name, value in party["bonuses"].items()
+        }
+        return WarParty(army, Bonuses(**bonuses), atk=atk)
+    levels = Levels.from_str(party["levels"])
+    if atk:
+        return WarParty(army, Bonuses(*levels.bonus_atk), atk=True)
+    match FightZone(party.get("zone", FightZone.TDC)):
+        case FightZone.TDC:
+            bonuses = levels.bonus_tdc
+        case FightZone.DOME:
+            bonuses = levels.bonus_dome
+        case FightZone.LOGE:
+            bonuses = levels.bonus_loge
+    return WarParty(army, Bonuses(*bonuses), atk=False)
+
+
+def bonuses_to_json(bonuses: Bonuses) -> dict:
+    return {
+        name: None if value is None else float(value)
+        for name, value in (
+            ("dmg", bonuses.dmg),
+            ("min_dmg", bonuses.min_dmg),
+            ("hp", bonuses.hp),
+            ("min_hp", bonuses.min_hp),
+        )
+    }
+
+
+ROUND_COLUMNS = (
+    "attacker_base_dmg",
+    "attacker_bonus_dmg",
+    "defender_base_dmg",
+    "defender_bonus_dmg",
+    "attacker_losses",
+    "defender_losses",
+)
+
+
+def battle_to_json(battle: Battle) -> dict:
+    attacker_left, defender_left = battle.get_left_armies()
+    return {
+        "attacker": battle.attacker._units.tolist(),
+        "defender": battle.defender._units.tolist(),
+        "rounds": [
+            dict(zip(ROUND_COLUMNS, values))
+            for values in zip(*(getattr(battle, name).tolist() for name in ROUND_COLUMNS))
+        ],
+        "attacker_left": attacker_left._units.tolist(),
+        "defender_left": defender_left._units.tolist(),
+    }
+
+
+def simulate(body: dict) -> dict:
+    return battle_to_json(simulate_battle(parse_party(body["attacker"], True), parse_party(body["defender"], False)))
+
+
+def simulate_batch(body: dict) -> dict:
+    matchups = check_batch(body["matchups"])
+    attackers = [parse_party(m["attacker"], True) for m in matchups]
+    defenders = [parse_party(m["defender"], False) for m in matchups]
+    battles = simulate_battles(
+        [p.army._units for p in attackers],
+        [p.army._units for p in defenders],
+        [(p.bonuses.dmg, p.bonuses.hp) for p in attackers],
+        [(p.bonuses.dmg, p.bonuses.hp) for p in defenders],
+    )
+    return {"battles": [battle_to_json(b) for b in battles]}
+
+
+def envelope(body: dict) -> dict:
+    resolution = int(body.get("resolution", 3))
+    if resolution**4 > MAX_BATCH_SIZE:
+        raise ValueError(f"Grids are limited to {MAX_BATCH_SIZE} battles, got a resolution of {resolution}")
+    attacker, defender = parse_party(body["attacker"], True), parse_party(body["defender"], False)
+    envelope = simulate_envelope(attacker, defender, resolution, float(body.get("step", 0)))
+    return {
+        "outcome": envelope.outcome.name.lower(),
+        "win_rate": envelope.win_rate,
+        "samples": len(envelope.bonuses),
+        "attacker_losses": [losses._units.tolist() for losses in envelope.attacker_losses],
+        "defender_losses": [losses._units.tolist() for losses in envelope.defender_losses],
+    }
+
+
+def waves(body: dict) -> dict:
+    attacker, defender = parse_party(body["attacker"], True), parse_party(body["defender"], False)
+    max_waves, resolution = int(body.get("max_waves", 3)), int(body.get("resolution", 1))
+    if not 1 <= max_waves <= 8:
+        raise ValueError(f"Plans are limited to 1 to 8 waves, got {max_waves}")
+    # waves a single plan can pick from at every step
+    if resolution < 1 or (resolution + 1) ** (attacker.army._units > 0).sum() > MAX_BATCH_SIZE:
+        raise ValueError(f"Waves are limited to {MAX_BATCH_SIZE} choices, got a resolution of {resolution}")
+    objective = body.get("objective", "losses")
+    if objective not in ("losses", "ponte"):
+        raise ValueError(f"Unknown objective {objective!r}")
+    plan = plan_waves(attacker, defender, max_waves, resolution, objective)
+    return {
+        "waves": [wave._units.tolist() for wave in plan.waves],
+        "battles": [battle_to_json(b) for b in plan.battles],
+        "cost": plan.cost,
+        "wiped": plan.wiped,
+    }
+
+
+def flood(body: dict) -> dict:
+    attacker = parse_party({"army": [0] * 15, **body["attacker"]}, True)
+    defender = parse_party(body["defender"], False)
+    curve = size_flood(
+        defender, attacker.bonuses, body.get("unit_type", "JS"), body.get("tdp", 0), body.get("bonus_alli", 0)
+    )
+    return {
+        "counts": curve.counts.tolist(),
+        "hp_removed": curve.hp_removed.tolist(),
+        "ponte": curve.ponte.astype(int).tolist(),
+        "breakpoint": curve.breakpoint,
+        "best_count": curve.best_count,
+    }
+
+
+def analyze(body: dict) -> dict:
+    attacker, defender = analyze_battle(Battle.from_rc(body["rc"]))
+    return {"attacker": bonuses_to_json(attacker.bonuses), "defender": bonuses_to_json(defender.bonuses)}
+
+
+def analyze_batch(body: dict) -> dict:
+    battles = [Battle.from_rc(rc) for rc in check_batch(body["rcs"])]
+    bounds = BonusBounds.from_battles(battles)
+    results = [
+        {"attacker": bonuses_to_json(bounds[i]), "defender": bonuses_to_json(bounds[len(battles) + i])}
+        for i in range(len(battles))
+    ]
+    if "zone" in body:
+        zone = FightZone(body["zone"])
+        for side, key, atk, offset in (
+            ("attacker", "atk_alliance", True, 0),
+            ("defender", "def_alliance", False, len(battles)),
+        ):
+            alli_types = None if key not in body else [None if body[key] is None else AllianceType(body[key])]
+            levels = infer_levels_batch([bounds[offset + i] for i in range(len(battles))], zone, alli_types, atk)
+            for result, side_levels in zip(results, levels):
+                result[f"{side}_levels"] = None if side_levels is None else side_levels.to_str()
+    return {"battles": results}
+
+
+def recruit_time(body: dict) -> dict:
+    _, total = parse_army(body["army"]).recruit_time(body.get("tdp", 0), body.get("bonus_alli", 0))
+    return {"recruit_time": int(total)}
+
+
+def recruit_time_batch(body: dict) -> dict:
+    armies = ArmyBatch.from_armies(parse_army(a) for a in check_batch(body["armies"]))
+    _, totals = armies.recruit_time(body.get("tdp", 0), body.get("bonus_alli", 0))
+    return {"recruit_times": totals.tolist()}
+
+
+def recruit_time_grid(body: dict) -> dict:
+    armies, tdps, bonus_allis = check_batch(body["armies"]), check_batch(body["tdps"]), check_batch(body["bonus_allis"])
+    if (size := len(armies) * len(tdps) * len(bonus_allis)) > MAX_BATCH_SIZE:
+        raise ValueError(f"Grids are limited to {MAX_BATCH_SIZE} recruit times, got {size}")
+    armies = ArmyBatch.from_armies(parse_army(a) for a in armies)
+    durations = armies.recruit_time_grid(tdps, bonus_allis, non_xp=body.get("non_xp", False))
+    return {"recruit_times": durations.tolist()}
+
+
+def check_batch(items: list) -> list:
+    if not isinstance(items, list):
+        raise ValueError(f"Expected a list, got {type(items).__name__}")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batches are limited to {MAX_BATCH_SIZE} items, got {len(items)}")
+    return items
+
+
+ROUTES: dict[str, t.Callable[[dict], dict]] = {
+    "/simulate": simulate,
+    "/simulate/batch": simulate_batch,
+    "/simulate/envelope": envelope,
+    "/plan/waves": waves,
+    "/plan/flood": flood,
+    "/analyze": analyze,
+    "/analyze/batch": analyze_batch,
+    "/recruit_time": recruit_time,
+    "/recruit_time/batch": recruit_time_batch,
+    "/recruit_time/grid": recruit_time_grid,
+}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    server_version = "nawminator"
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if (header := self.headers.get("Content-Length")) is None:
+            self.close_connection = True
+            self.send_json(411, {"error": "Requests need a Content-Length"})
+            return
+        # int() also accepts signs, spaces and underscores, a length is only digits
+        if not header.isdigit() or not header.isascii():
+            self.close_connection = True
+            self.send_json(400, {"error": f"Invalid Content-Length {header!r}"})
+            return
+        length = int(header)
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self.send_json(413, {"error": f"Request bodies are limited to {MAX_BODY_SIZE} bytes"})
+            return
+        body = self.rfile.read(length)
+        if (route := ROUTES.get(self.path)) is None:
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        try:
+            result = route(json.loads(body))
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            logger.exception(f"{self.path} failed")
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, result)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 7861) -> http.server.ThreadingHTTPServer:
+    return http.server.ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m nawminator.server", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7861)
+    args = parser.parse_args(argv)
+    with make_server(args.host, args.port) as server:
+        logger.info(f"Serving on http://{args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
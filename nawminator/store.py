@@ -0,0 +1,208 @@
+"""Persistent store of simulated battles and battle analyses in a SQLite file, shared by every process opening it.
+
+A ResultStore can be given as cache to simulate_battle and analyze_battle. Results are keyed by a hash of the
+canonical bytes of their inputs: the unit counts, dmg and hp bonuses and role of both parties for a simulation, the
+fight zone entering the key through the defender bonuses, and the battle arrays for an analysis.
+
+The database runs in WAL mode so that readers don't wait for writers. Battles are stored as their raw round arrays,
+zlib compressed, loss matrices being mostly zeros. Once the file grows over max_bytes, the least recently used
+results are deleted; the file itself doesn't shrink, the freed pages being reused by later results.
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+import typing as t
+import zlib
+
+import numpy as np
+
+import nawminator as nm
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    value BLOB NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+# Hits only refresh the use time of results older than this, so that most reads don't write
+_TOUCH_INTERVAL = 60
+
+_BATTLE_KEY = b"battle:1"
+_ANALYSIS_KEY = b"analysis:1"
+_N_UNITS = len(nm.army.unit_names)
+
+
+def _digest(*parts: bytes) -> bytes:
+    return hashlib.blake2b(b"".join(parts), digest_size=16).digest()
+
+
+def _party_bytes(party: nm.war.WarParty) -> bytes:
+    # + 0.0 turns -0.0 into 0.0, both simulating the same way
+    return party.army._units.astype("<i8").tobytes() + struct.pack(
+        "<dd?", float(party.bonuses.dmg) + 0.0, float(party.bonuses.hp) + 0.0, party.atk
+    )
+
+
+def battle_key(attacker: nm.war.WarParty, defender: nm.war.WarParty) -> bytes:
+    return _digest(_BATTLE_KEY, _party_bytes(attacker), _party_bytes(defender))
+
+
+def encode_battle(battle: nm.battle.Battle) -> bytes:
+    """Number of rounds followed by the armies and round arrays, little endian"""
+    return struct.pack("<I", len(battle)) + b"".join(
+        np.asarray(array, dtype=dtype).tobytes()
+        for array, dtype in (
+            (battle.attacker._units, "<i8"),
+            (battle.defender._units, "<i8"),
+            (battle.attacker_base_dmg, "<i8"),
+            (battle.attacker_bonus_dmg, "<f8"),
+            (battle.defender_base_dmg, "<i8"),
+            (battle.defender_bonus_dmg, "<f8"),
+            (battle.attacker_losses, "<i8"),
+            (battle.defender_losses, "<i8"),
+        )
+    )
+
+
+def decode_battle(data: bytes) -> nm.battle.Battle:
+    (rounds,) = struct.unpack_from("<I", data)
+    # every value is 8 bytes long, the arrays are views of a single int64 buffer
+    values = np.frombuffer(bytearray(data), dtype="<i8", offset=4)
+    units = _N_UNITS * rounds
+    ends = np.cumsum([_N_UNITS, _N_UNITS, rounds, rounds, rounds, rounds, units, units])
+    attacker, defender, atk_base, atk_bonus, def_base, def_bonus, atk_losses, def_losses = np.split(values, ends[:-1])
+    return nm.battle.Battle.from_arrays(
+        nm.army.Army._wrap(attacker),
+        nm.army.Army._wrap(defender),
+        attacker_base_dmg=atk_base,
+        attacker_bonus_dmg=atk_bonus.view("<f8"),
+        defender_base_dmg=def_base,
+        defender_bonus_dmg=def_bonus.view("<f8"),
+        attacker_losses=atk_losses.reshape(rounds, _N_UNITS),
+        defender_losses=def_losses.reshape(rounds, _N_UNITS),
+    )
+
+
+def _bonuses_values(bonuses: nm.war.Bonuses) -> tuple[float, ...]:
+    return tuple(np.nan if v is None else float(v) for v in (bonuses.dmg, bonuses.hp, bonuses.min_dmg, bonuses.min_hp))
+
+
+def _values_bonuses(values: t.Sequence[float]) -> nm.war.Bonuses:
+    dmg, hp, min_dmg, min_hp = (None if np.isnan(v) else np.float64(v) for v in values)
+    return nm.war.Bonuses(dmg, hp, min_dmg, min_hp)
+
+
+class ResultStore:
+    """SQLite store of simulate_battle and analyze_battle results, usable as their cache argument.
+
+    Each thread gets its own connection, and a store sent to another process reopens the same file there. The
+    hit and miss counters are per process, shared by its threads.
+    """
+
+    def __init__(self, path: str | os.PathLike, max_bytes: int = 256 << 20):
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect()
+
+    def __getstate__(self):
+        return {"path": self.path, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["max_bytes"])
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        if (connection := getattr(self._local, "connection", None)) is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _get(self, key: bytes) -> t.Optional[bytes]:
+        connection = self._connect()
+        row = connection.execute("SELECT value, used FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        value, used = row
+        if (now := time.time()) - used > _TOUCH_INTERVAL:
+            connection.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        return value
+
+    def _put(self, key: bytes, value: bytes):
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO results (key, value, used) VALUES (?, ?, ?)", (key, value, time.time())
+        )
+        self._evict(connection)
+
+    def size(self) -> int:
+        """Bytes used by the stored results, the free pages of the file excluded"""
+        connection = self._connect()
+        (page_size,) = connection.execute("PRAGMA page_size").fetchone()
+        (page_count,) = connection.execute("PRAGMA page_count").fetchone()
+        (free_pages,) = connection.execute("PRAGMA freelist_count").fetchone()
+        return page_size * (page_count - free_pages)
+
+    def _evict(self, connection: sqlite3.Connection):
+        while self.size() > self.max_bytes:
+            (count,) = connection.execute("SELECT count(*) FROM results").fetchone()
+            if count == 0:
+                return
+            connection.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)",
+                (max(1, count // 10),),
+            )
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT count(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        self._connect().execute("DELETE FROM results")
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def info(self) -> nm.war.CacheInfo:
+        return nm.war.CacheInfo(self.hits, self.misses, self.max_bytes, len(self))
+
+    def get(self, attacker: nm.war.WarParty, defender: nm.war.WarParty) -> t.Optional[nm.battle.Battle]:
+        data = self._get(battle_key(attacker, defender))
+        return None if data is None else decode_battle(zlib.decompress(data))
+
+    def put(self, attacker: nm.war.WarParty, defender: nm.war.WarParty, battle: nm.battle.Battle):
+        self._put(battle_key(attacker, defender), zlib.compress(encode_battle(battle), 1))
+
+    def get_analysis(self, battle: nm.battle.Battle) -> t.Optional[tuple[nm.war.WarParty, nm.war.WarParty]]:
+        data = self._get(_digest(_ANALYSIS_KEY, encode_battle(battle)))
+        if data is None:
+            return None
+        values = struct.unpack("<8d", data)
+        return (
+            nm.war.WarParty(battle.attacker, _values_bonuses(values[:4]), atk=True),
+            nm.war.WarParty(battle.defender, _values_bonuses(values[4:]), atk=False),
+        )
+
+    def put_analysis(self, battle: nm.battle.Battle, attacker: nm.war.WarParty, defender: nm.war.WarParty):
+        values = _bonuses_values(attacker.bonuses) + _bonuses_values(defender.bonuses)
+        self._put(_digest(_ANALYSIS_KEY, encode_battle(battle)), struct.pack("<8d", *values))
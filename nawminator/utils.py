@@ -1,4 +1,7 @@
-from collections import namedtuple
+import concurrent.futures
+import itertools as it
+import typing as t
+from collections import deque, namedtuple
 
 YJHMS = namedtuple("YJHMS", "Y J H M S")
 
@@ -27,3 +30,28 @@ def format_naw_int(i: int) -> str:
 
 
 NAW_INT_REGEX = r"\d[ \d]*"
+
+
+T = t.TypeVar("T")
+R = t.TypeVar("R")
+
+
+def map_chunks(fn: t.Callable[[T], R], chunks: t.Iterable[T], jobs: int | None = None) -> t.Iterator[tuple[T, R]]:
+    """Yields (chunk, fn(chunk)) for every chunk, in order.
+
+    With jobs > 1, chunks are processed by a pool of jobs processes, with at most 2 * jobs chunks in flight so that
+    memory stays bounded whatever the number of chunks. fn and the chunks must then be picklable.
+    """
+    chunks = iter(chunks)
+    if jobs is None or jobs <= 1:
+        for chunk in chunks:
+            yield chunk, fn(chunk)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque((chunk, executor.submit(fn, chunk)) for chunk in it.islice(chunks, 2 * jobs))
+        while pending:
+            chunk, future = pending.popleft()
+            if (next_chunk := next(chunks, None)) is not None:
+                pending.append((next_chunk, executor.submit(fn, next_chunk)))
+            yield chunk, future.result()
@@ -1,8 +1,13 @@
+import collections
+import itertools as it
+import threading
 from dataclasses import dataclass
+from enum import StrEnum
 
 import numpy as np
 import typing as t
 import nawminator as nm
+from nawminator.metrics import timed
 
 
 def compute_hp_bonus_range(dmg: np.float64, losses: nm.army.Army):
@@ -37,9 +42,12 @@ class Bonuses:
         self.min_hp = min_hp
 
     @classmethod
+    @timed("Bonuses.from_rounds")
     def from_rounds(cls, rounds: list[nm.battle.Round] | nm.battle.Round) -> tuple["Bonuses", "Bonuses"]:
         if isinstance(rounds, nm.battle.Round):
             rounds = [rounds]
+        if len(rounds) == 0:
+            raise ValueError("Can't infer bonuses from a battle without rounds")
 
         atk_bonuses, def_bonuses = cls.compute_bonuses(rounds[0])
         atk_dmg, atk_hp = (atk_bonuses.dmg, atk_bonuses.min_dmg), (atk_bonuses.hp, atk_bonuses.min_hp)
@@ -106,6 +114,146 @@ class Bonuses:
         return atk_bonuses, def_bonuses
 
 
+@dataclass
+class BonusBounds:
+    """Bonus intervals of many war parties as arrays, nan where no round constrains a bound"""
+
+    dmg: np.ndarray
+    min_dmg: np.ndarray
+    hp: np.ndarray
+    min_hp: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.dmg)
+
+    def __getitem__(self, i: int) -> Bonuses:
+        dmg, min_dmg, hp, min_hp = (
+            None if np.isnan(b[i]) else b[i] for b in (self.dmg, self.min_dmg, self.hp, self.min_hp)
+        )
+        return Bonuses(dmg=dmg, min_dmg=min_dmg, hp=hp, min_hp=min_hp)
+
+    @classmethod
+    def from_rounds(
+        cls,
+        base_dmg: np.ndarray,
+        bonus_dmg: np.ndarray,
+        received_dmg: np.ndarray,
+        loss_hp: np.ndarray,
+        last_unit_hp: np.ndarray,
+        wiped: t.Optional[np.ndarray] = None,
+        groups: t.Optional[np.ndarray] = None,
+        n_groups: t.Optional[int] = None,
+        step=5e-3,
+    ) -> "BonusBounds":
+        """Vectorized Bonuses.compute_bonuses over one side of many rounds, intersected per group.
+
+        Each row is a round seen from one war party: the base and bonus damage it dealt, the total damage it
+        received, the base hp of its losses and the hp of the last unit type it lost. Rows where wiped is true only
+        give an upper hp bound, as the damage may have exceeded the hp that was left. groups gives the group (e.g.
+        player) of each row, every row belonging to group 0 if None.
+        """
+        base_dmg, bonus_dmg, received_dmg, loss_hp, last_unit_hp = (
+            np.asarray(a, dtype=np.float64) for a in (base_dmg, bonus_dmg, received_dmg, loss_hp, last_unit_hp)
+        )
+        groups = np.zeros(len(base_dmg), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        n_groups = (groups.max(initial=-1) + 1) if n_groups is None else n_groups
+        istep = np.float64(1) / step
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            known_dmg = base_dmg > 0
+            dmg_max = np.where(known_dmg, np.floor(istep * (bonus_dmg + 0.4999) / base_dmg) / istep, np.nan)
+            dmg_min = np.where(known_dmg, np.ceil(istep * (bonus_dmg - 0.5) / base_dmg) / istep, np.nan)
+
+            known_hp = (loss_hp > 0) & (received_dmg <= 4 * loss_hp)
+            hp_max = np.floor(istep * (received_dmg / (loss_hp - 0.5 * last_unit_hp) - 1)) / istep
+            hp_min = np.ceil(istep * (received_dmg / (loss_hp + 0.49999 * last_unit_hp) - 1)) / istep
+            hp_max = np.where(known_hp, hp_max, np.nan)
+            hp_min = np.where(known_hp if wiped is None else known_hp & ~np.asarray(wiped, dtype=bool), hp_min, np.nan)
+
+        bounds = cls(*(np.full(n_groups, np.nan) for _ in range(4)))
+        np.fmin.at(bounds.dmg, groups, dmg_max)
+        np.fmax.at(bounds.min_dmg, groups, dmg_min)
+        np.fmin.at(bounds.hp, groups, hp_max)
+        np.fmax.at(bounds.min_hp, groups, hp_min)
+        return bounds
+
+    @classmethod
+    def from_battles(
+        cls,
+        battles: t.Sequence[nm.battle.Battle],
+        attacker_groups: t.Optional[t.Sequence[int]] = None,
+        defender_groups: t.Optional[t.Sequence[int]] = None,
+        n_groups: t.Optional[int] = None,
+        step=5e-3,
+    ) -> "BonusBounds":
+        """Bonus intervals from every round of many battles, intersected per group.
+
+        By default the attacker of battle i is group i and its defender group len(battles) + i. The bounds then match
+        Bonuses.from_rounds on each battle, except that:
+        - a round where a side is wiped only gives its upper hp bound, as from_rounds over-estimates the min_hp;
+        - a round where a side deals no base damage gives no dmg bound instead of an infinite or nan one;
+        - a round whose hp bounds meet, which Bonuses stores with min_hp None, is used here and skipped there;
+        - from_rounds raises on a battle without rounds, when a first round without min_hp (hp unknown or exact)
+          is followed by one with it, and when a first round with min_dmg is followed by one without it, where this
+          gives nan or the bounds of the other rounds.
+        Giving the same group to every battle side of a player narrows their bounds with the whole corpus.
+        """
+        n = len(battles)
+        attacker_groups = np.arange(n) if attacker_groups is None else np.asarray(attacker_groups, dtype=np.int64)
+        defender_groups = (
+            np.arange(n, 2 * n) if defender_groups is None else np.asarray(defender_groups, dtype=np.int64)
+        )
+        unit_count = len(nm.army.unit_names)
+        battle_idx = np.repeat(np.arange(n), [len(b) for b in battles])
+
+        def column(name: str, dtype) -> np.ndarray:
+            return np.concatenate([np.zeros(0, dtype=dtype), *(getattr(b, name) for b in battles)])
+
+        dmg = np.stack(
+            [
+                column("attacker_base_dmg", np.float64),
+                column("attacker_bonus_dmg", np.float64),
+                column("defender_base_dmg", np.float64),
+                column("defender_bonus_dmg", np.float64),
+            ],
+            axis=1,
+        )
+        atk_losses = np.concatenate([np.zeros((0, unit_count), dtype=np.int64), *(b.attacker_losses for b in battles)])
+        def_losses = np.concatenate([np.zeros((0, unit_count), dtype=np.int64), *(b.defender_losses for b in battles)])
+        # units lost up to each round, counted from the start of its battle
+        offsets = np.searchsorted(battle_idx, np.arange(n + 1))
+
+        def wiped(army_counts: np.ndarray, losses: np.ndarray) -> np.ndarray:
+            lost = np.cumsum(losses.sum(axis=1))
+            lost_before = np.concatenate([[0], lost])[offsets[:-1]][battle_idx]
+            return lost - lost_before >= army_counts[battle_idx]
+
+        def last_unit_hp(losses: np.ndarray) -> np.ndarray:
+            last_idx = unit_count - 1 - np.argmax(losses[:, ::-1] != 0, axis=1)
+            return nm.army.unit_stats[last_idx, 0]
+
+        return cls.from_rounds(
+            base_dmg=np.concatenate([dmg[:, 0], dmg[:, 2]]),
+            bonus_dmg=np.concatenate([dmg[:, 1], dmg[:, 3]]),
+            received_dmg=np.concatenate([dmg[:, 2] + dmg[:, 3], dmg[:, 0] + dmg[:, 1]]),
+            loss_hp=np.concatenate([atk_losses @ nm.army.unit_stats[:, 0], def_losses @ nm.army.unit_stats[:, 0]]),
+            last_unit_hp=np.concatenate([last_unit_hp(atk_losses), last_unit_hp(def_losses)]),
+            wiped=np.concatenate(
+                [
+                    wiped(np.array([b.attacker.count for b in battles], dtype=np.int64), atk_losses),
+                    wiped(np.array([b.defender.count for b in battles], dtype=np.int64), def_losses),
+                ]
+            ),
+            groups=np.concatenate([attacker_groups[battle_idx], defender_groups[battle_idx]]),
+            n_groups=(
+                (max(attacker_groups.max(initial=-1), defender_groups.max(initial=-1)) + 1)
+                if n_groups is None
+                else n_groups
+            ),
+            step=step,
+        )
+
+
 @dataclass
 class WarParty:
     army: nm.army.Army
@@ -142,44 +290,715 @@ class WarParty:
         return WarParty(lost, self.bonuses, self.atk), WarParty(kept, self.bonuses, self.atk)
 
 
+MAX_ROUNDS = 100
+
+
 def simulate_rounds(attacker: WarParty, defender: WarParty) -> list[nm.battle.Round]:
-    current_atk = attacker
-    current_def = defender
+    return simulate_battle(attacker, defender).rounds
+
+
+def _simulate(attacker: WarParty, defender: WarParty) -> nm.battle.Battle:
+    """Advances both armies as unit arrays, with the same arithmetic as WarParty, and stores the rounds as arrays.
+
+    A first round wipe is built directly, and once a round kills nobody it is repeated up to MAX_ROUNDS without
+    simulating it again, as nothing can change anymore."""
+    unit_stats = nm.army.unit_stats
+    atk_units, def_units = attacker.army._units, defender.army._units
+    atk_stat = unit_stats[:, 1] if attacker.atk else unit_stats[:, 2]
+    def_stat = unit_stats[:, 1] if defender.atk else unit_stats[:, 2]
+    atk_hp_mult, def_hp_mult = 1 + attacker.bonuses.hp, 1 + defender.bonuses.hp
+
+    columns = ([], [], [], [], [], [])
+    repeats = 1
+    for round_no in range(MAX_ROUNDS):
+        atk_base_dmg = atk_units @ atk_stat
+        def_base_dmg = def_units @ def_stat
+        atk_bonus_dmg = np.floor(0.5 + atk_base_dmg * attacker.bonuses.dmg)
+        def_bonus_dmg = np.floor(0.5 + def_base_dmg * defender.bonuses.dmg)
+        atk_total_dmg = np.floor(0.5 + atk_base_dmg + atk_bonus_dmg)
+        def_total_dmg = np.floor(0.5 + def_base_dmg + def_bonus_dmg)
+        defender_mult = np.float64(1)
+        if round_no == 0 and atk_total_dmg >= np.floor(0.5 + (def_units @ unit_stats[:, 0]) * def_hp_mult):
+            defender_mult = np.float64(0.1)
+            if atk_total_dmg / def_hp_mult >= def_units @ unit_stats[:, 0]:
+                return _first_round_wipe(
+                    attacker,
+                    defender,
+                    atk_base_dmg,
+                    atk_bonus_dmg,
+                    def_base_dmg * defender_mult,
+                    def_bonus_dmg * defender_mult,
+                    nm.army.split_units_by_hp(atk_units, def_total_dmg * defender_mult / atk_hp_mult)[0],
+                )
+        atk_losses, atk_units = nm.army.split_units_by_hp(atk_units, def_total_dmg * defender_mult / atk_hp_mult)
+        def_losses, def_units = nm.army.split_units_by_hp(def_units, atk_total_dmg / def_hp_mult)
+        for column, value in zip(
+            columns,
+            (
+                atk_base_dmg,
+                atk_bonus_dmg,
+                def_base_dmg * defender_mult,
+                def_bonus_dmg * defender_mult,
+                atk_losses,
+                def_losses,
+            ),
+        ):
+            column.append(value)
+        if atk_units.sum() == 0 or def_units.sum() == 0:
+            break
+        if defender_mult == 1 and not atk_losses.any() and not def_losses.any():
+            # Stalemate, every remaining round is this one
+            repeats = MAX_ROUNDS - round_no
+            break
+
+    return nm.battle.Battle.from_arrays(
+        attacker.army,
+        defender.army,
+        *(
+            np.concatenate([array, np.repeat(array[-1:], repeats - 1, axis=0)]) if repeats > 1 else array
+            for array in (
+                np.array(columns[0], dtype=np.int64),
+                np.array(columns[1], dtype=np.float64),
+                np.array(columns[2], dtype=np.float64).astype(np.int64),
+                np.array(columns[3], dtype=np.float64),
+                np.array(columns[4], dtype=np.int64),
+                np.array(columns[5], dtype=np.int64),
+            )
+        ),
+    )
+
+
+def _first_round_wipe(
+    attacker: WarParty,
+    defender: WarParty,
+    atk_base_dmg: np.int64,
+    atk_bonus_dmg: np.float64,
+    def_base_dmg: np.float64,
+    def_bonus_dmg: np.float64,
+    atk_losses: np.ndarray,
+) -> nm.battle.Battle:
+    """The attacker deals at least the base hp of the whole defender in the first round: every defending unit
+    dies and the defender only ripostes at 10%, no need to spread the damage over the unit types."""
+    return nm.battle.Battle.from_arrays(
+        attacker.army,
+        defender.army,
+        attacker_base_dmg=np.array([atk_base_dmg], dtype=np.int64),
+        attacker_bonus_dmg=np.array([atk_bonus_dmg], dtype=np.float64),
+        defender_base_dmg=np.array([def_base_dmg], dtype=np.float64).astype(np.int64),
+        defender_bonus_dmg=np.array([def_bonus_dmg], dtype=np.float64),
+        attacker_losses=atk_losses[np.newaxis],
+        defender_losses=defender.army._units[np.newaxis].copy(),
+    )
+
+
+CacheInfo = collections.namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class SimulationCache:
+    """Thread-safe LRU cache of simulated battles, keyed on the content of both war parties.
+
+    The fight zone only changes the defender bonuses, so it is part of the key through them.
+    """
 
-    rounds = []
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._battles: collections.OrderedDict[tuple, nm.battle.Battle] = collections.OrderedDict()
+        self._lock = threading.Lock()
 
-    for round_no in range(100):
-        defender_mult = (
-            np.float64(0.1) if round_no == 0 and current_atk.total_dmg >= current_def.total_hp else np.float64(1)
+    @staticmethod
+    def key(attacker: WarParty, defender: WarParty) -> tuple:
+        return tuple(
+            (p.army._units.tobytes(), float(p.bonuses.dmg), float(p.bonuses.hp), p.atk) for p in (attacker, defender)
         )
-        atk_losses, new_atk_party = current_atk.after_dmg(current_def.total_dmg * defender_mult)
-        def_losses, new_def_party = current_def.after_dmg(current_atk.total_dmg)
-        rounds.append(
-            nm.battle.Round(
-                attacker_base_dmg=current_atk.base_dmg,
-                attacker_bonus_dmg=current_atk.bonus_dmg,
-                defender_base_dmg=np.int64(current_def.base_dmg * defender_mult),
-                defender_bonus_dmg=current_def.bonus_dmg * defender_mult,
-                attacker_losses=atk_losses.army,
-                defender_losses=def_losses.army,
+
+    def get(self, attacker: WarParty, defender: WarParty) -> t.Optional[nm.battle.Battle]:
+        key = self.key(attacker, defender)
+        with self._lock:
+            battle = self._battles.get(key)
+            if battle is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._battles.move_to_end(key)
+            return battle
+
+    def put(self, attacker: WarParty, defender: WarParty, battle: nm.battle.Battle):
+        key = self.key(attacker, defender)
+        with self._lock:
+            self._battles[key] = battle
+            self._battles.move_to_end(key)
+            while len(self._battles) > self.maxsize:
+                self._battles.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._battles.clear()
+            self.hits = self.misses = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._battles))
+
+
+simulation_cache = SimulationCache()
+
+
+@timed(
+    "simulate_battle",
+    lambda battle: {"rounds": len(battle), "units": battle.attacker.count + battle.defender.count},
+)
+def simulate_battle(
+    attacker: WarParty, defender: WarParty, cache: t.Optional["SimulationCache | nm.store.ResultStore"] = None
+) -> nm.battle.Battle:
+    """Simulates a battle, looking it up first in cache if one is given. Cached battles are shared, not copied."""
+    if cache is not None and (battle := cache.get(attacker, defender)) is not None:
+        return battle
+    battle = _simulate(attacker, defender)
+    if cache is not None:
+        cache.put(attacker, defender, battle)
+    return battle
+
+
+@timed(
+    "simulate_battles",
+    lambda batch: {"battles": len(batch), "rounds": len(batch.attacker_base_dmg)},
+)
+def simulate_battles(
+    attackers: np.ndarray, defenders: np.ndarray, atk_bonuses: np.ndarray, def_bonuses: np.ndarray
+) -> nm.battle.BattleBatch:
+    """Vectorized simulate_battle over N matchups.
+
+    attackers and defenders are N×15 unit matrices, bonuses are (dmg, hp) pairs, either one per matchup (N×2)
+    or a single one shared by all of them. Every battle is advanced round by round with the same arithmetic as
+    simulate_rounds, finished battles being dropped from the working set.
+    """
+    attackers = np.atleast_2d(np.asarray(attackers, dtype=np.int64))
+    defenders = np.atleast_2d(np.asarray(defenders, dtype=np.int64))
+    if attackers.shape != defenders.shape or attackers.shape[1:] != (len(nm.army.unit_names),):
+        raise ValueError(
+            f"Expected two N×{len(nm.army.unit_names)} arrays, got {attackers.shape} and {defenders.shape}"
+        )
+    n = len(attackers)
+    atk_bonuses = np.broadcast_to(np.asarray(atk_bonuses, dtype=np.float64), (n, 2))
+    def_bonuses = np.broadcast_to(np.asarray(def_bonuses, dtype=np.float64), (n, 2))
+
+    active = np.arange(n)
+    current_atk = attackers
+    current_def = defenders
+    atk_dmg_bonus, atk_hp_bonus = atk_bonuses.T
+    def_dmg_bonus, def_hp_bonus = def_bonuses.T
+
+    records = []
+    for round_no in range(MAX_ROUNDS):
+        if len(active) == 0:
+            break
+        atk_base_dmg = current_atk @ nm.army.unit_stats[:, 1]
+        def_base_dmg = current_def @ nm.army.unit_stats[:, 2]
+        atk_bonus_dmg = np.floor(0.5 + atk_base_dmg * atk_dmg_bonus)
+        def_bonus_dmg = np.floor(0.5 + def_base_dmg * def_dmg_bonus)
+        atk_total_dmg = np.floor(0.5 + atk_base_dmg + atk_bonus_dmg)
+        def_total_dmg = np.floor(0.5 + def_base_dmg + def_bonus_dmg)
+
+        defender_mult = np.ones(len(active))
+        if round_no == 0:
+            def_total_hp = np.floor(0.5 + (current_def @ nm.army.unit_stats[:, 0]) * (1 + def_hp_bonus))
+            defender_mult[atk_total_dmg >= def_total_hp] = 0.1
+
+        atk_losses, current_atk = nm.army.split_units_by_hp(
+            current_atk, def_total_dmg * defender_mult / (1 + atk_hp_bonus)
+        )
+        def_losses, current_def = nm.army.split_units_by_hp(current_def, atk_total_dmg / (1 + def_hp_bonus))
+        records.append(
+            (
+                active,
+                atk_base_dmg,
+                atk_bonus_dmg,
+                (def_base_dmg * defender_mult).astype(np.int64),
+                def_bonus_dmg * defender_mult,
+                atk_losses,
+                def_losses,
             )
         )
-        current_atk = new_atk_party
-        current_def = new_def_party
-        if current_atk.army.count == 0 or current_def.army.count == 0:
+
+        ongoing = (current_atk.sum(axis=1) != 0) & (current_def.sum(axis=1) != 0)
+        stalled = ongoing & (defender_mult == 1) & ~atk_losses.any(axis=1) & ~def_losses.any(axis=1)
+        if stalled.any() and round_no < MAX_ROUNDS - 1:
+            repeated = np.repeat(np.flatnonzero(stalled), MAX_ROUNDS - 1 - round_no)
+            records.append(tuple(column[repeated] for column in records[-1]))
+        ongoing &= ~stalled
+        active = active[ongoing]
+        current_atk, current_def = current_atk[ongoing], current_def[ongoing]
+        atk_dmg_bonus, atk_hp_bonus = atk_dmg_bonus[ongoing], atk_hp_bonus[ongoing]
+        def_dmg_bonus, def_hp_bonus = def_dmg_bonus[ongoing], def_hp_bonus[ongoing]
+
+    if records:
+        battle_idx, *columns = (np.concatenate(c) for c in zip(*records))
+    else:
+        battle_idx = np.zeros(0, dtype=np.int64)
+        columns = [np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0)]
+        columns += [np.zeros((0, len(nm.army.unit_names)), dtype=np.int64)] * 2
+    # rounds were appended round by round, a stable sort groups them by battle while keeping their order
+    order = np.argsort(battle_idx, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(battle_idx, minlength=n), out=offsets[1:])
+
+    return nm.battle.BattleBatch(attackers, defenders, offsets, *(c[order] for c in columns))
+
+
+class Outcome(StrEnum):
+    WIN = "Victoire"
+    LOSS = "Défaite"
+    UNCERTAIN = "Incertain"
+
+
+@dataclass
+class OutcomeEnvelope:
+    """Battles simulated over a grid of bonuses, the attacker winning a battle when the defender is wiped out.
+
+    bonuses holds one (attacker dmg, attacker hp, defender dmg, defender hp) row per battle."""
+
+    outcome: Outcome
+    bonuses: np.ndarray
+    won: np.ndarray
+    battles: nm.battle.BattleBatch
+
+    @property
+    def win_rate(self) -> float:
+        return float(self.won.mean())
+
+    @property
+    def attacker_losses(self) -> tuple[nm.army.Army, nm.army.Army]:
+        """Smallest and largest losses of each unit type across the grid"""
+        losses, _ = self.battles.get_total_losses()
+        return nm.army.Army._wrap(losses.min(axis=0)), nm.army.Army._wrap(losses.max(axis=0))
+
+    @property
+    def defender_losses(self) -> tuple[nm.army.Army, nm.army.Army]:
+        """Smallest and largest losses of each unit type across the grid"""
+        _, losses = self.battles.get_total_losses()
+        return nm.army.Army._wrap(losses.min(axis=0)), nm.army.Army._wrap(losses.max(axis=0))
+
+
+def bonus_grid(attacker: Bonuses, defender: Bonuses, resolution: int = 3, step: float = 0) -> np.ndarray:
+    """(attacker dmg, attacker hp, defender dmg, defender hp) rows covering the bonus ranges, with resolution
+    evenly spaced values from min to max, both included, on each bounded axis.
+
+    By default the bounds are the bonus range itself, a min of None meaning an exact bonus, as for parties given
+    by their levels. With a step, they are read as analysis bounds rounded to it, like LevelsIndex.query does,
+    the range spanning every bonus within one step of them."""
+    axes = []
+    for bonuses in (attacker, defender):
+        if bonuses.hp is None:
+            raise ValueError(f"Can't simulate without an hp bonus, got {bonuses}")
+        for value, min_value in ((bonuses.dmg, bonuses.min_dmg), (bonuses.hp, bonuses.min_hp)):
+            if step:
+                min_value, value = nm.levels.bonus_interval((min_value, value), step)
+            if min_value is None:
+                axes.append(np.array([value], dtype=np.float64))
+            else:
+                axes.append(np.linspace(min_value, value, max(resolution, 2)))
+    return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 4)
+
+
+def simulate_envelope(attacker: WarParty, defender: WarParty, resolution: int = 3, step: float = 0) -> OutcomeEnvelope:
+    """Simulates the battle at every corner of the bonus ranges of both parties and on a grid inside them, in a
+    single simulate_battles pass, the ranges being read like in bonus_grid. resolution=2 only simulates the
+    corners."""
+    bonuses = bonus_grid(attacker.bonuses, defender.bonuses, resolution, step)
+    n = len(bonuses)
+    attackers = np.broadcast_to(attacker.army._units, (n, len(nm.army.unit_names)))
+    defenders = np.broadcast_to(defender.army._units, (n, len(nm.army.unit_names)))
+    battles = simulate_battles(attackers, defenders, bonuses[:, :2], bonuses[:, 2:])
+
+    _, defender_losses = battles.get_total_losses()
+    won = (defenders - defender_losses).sum(axis=1) == 0
+    if won.all():
+        outcome = Outcome.WIN
+    elif not won.any():
+        outcome = Outcome.LOSS
+    else:
+        outcome = Outcome.UNCERTAIN
+    return OutcomeEnvelope(outcome, bonuses, won, battles)
+
+
+# Resolution of the simplex grid that find_cheapest_army searches whole before refining the best split
+_COARSE_RESOLUTION = 4
+
+
+def _simplex_grid(k: int, resolution: int) -> np.ndarray:
+    """Every way of splitting resolution into k non-negative integer parts, as a M×k array"""
+    combinations = list(it.combinations(range(resolution + k - 1), k - 1))
+    bars = np.array(combinations, dtype=np.int64).reshape(len(combinations), k - 1)
+    edges = np.hstack([np.full((len(bars), 1), -1), bars, np.full((len(bars), 1), resolution + k - 1)])
+    return np.diff(edges, axis=1) - 1
+
+
+def find_cheapest_army(
+    defender: WarParty,
+    levels: nm.levels.Levels,
+    unit_types: t.Sequence[str],
+    tdp: int = 0,
+    bonus_alli: int = 0,
+    resolution: int = 10,
+) -> t.Optional[tuple[nm.army.Army, np.int64]]:
+    """Finds the army of the given unit types with the lowest recruit time that wipes the defender.
+
+    The recruit time budget is split between unit types in shares of 1/resolution. For a set of splits, the
+    smallest winning budget of each one is found by bisection to within 1/1024, all splits being simulated together
+    with simulate_battles, which relies on the outcome only improving as unit counts grow. Every split of a coarse
+    simplex grid is searched first, then the best one is refined on the grid of the given resolution by moving a
+    share from one unit type to another while that lowers the recruit time. The unit counts of the cheapest army
+    are then lowered one type at a time while it still wins.
+    Returns the army and its recruit time, or None if no army of at most MAX_UNIT_COUNT units per type wins.
+    """
+    short_names = [short_name for _, short_name, _ in nm.army.unit_names]
+    type_idx = np.array([short_names.index(unit_type) for unit_type in unit_types], dtype=np.int64)
+    unit_times = nm.army.unit_stats[type_idx, 3]
+    atk_bonuses = levels.bonus_atk
+    def_bonuses = (defender.bonuses.dmg, defender.bonuses.hp)
+
+    def wins(units: np.ndarray) -> np.ndarray:
+        defenders = np.broadcast_to(defender.army._units, (len(units), len(short_names)))
+        battles = simulate_battles(units, defenders, atk_bonuses, def_bonuses)
+        return battles.get_left_armies()[1].sum(axis=1) == 0
+
+    def armies(budgets: np.ndarray, shares: np.ndarray, resolution: int) -> np.ndarray:
+        units = np.zeros((len(shares), len(short_names)), dtype=np.int64)
+        units[:, type_idx] = budgets[:, np.newaxis] * shares // (resolution * unit_times)
+        return units
+
+    def min_budgets(shares: np.ndarray, resolution: int, start: np.ndarray) -> np.ndarray:
+        """Smallest winning budget of each split to within 1/1024, searched from start, -1 if none"""
+        # the largest budget keeping every unit count under MAX_UNIT_COUNT, and budgets times shares in an int64
+        with np.errstate(divide="ignore"):
+            caps = (float(nm.army.MAX_UNIT_COUNT) * resolution * unit_times / shares).min(axis=1) * (1 - 1e-9)
+        caps = np.minimum(caps, np.iinfo(np.int64).max // (2 * resolution)).astype(np.int64)
+        low = np.zeros(len(shares), dtype=np.int64)
+        high = np.clip(start, 1, caps)
+        # Multiplying by 16 until every split wins gives the upper bounds of the bisection
+        losing = np.arange(len(shares))
+        while len(losing) > 0:
+            won = wins(armies(high[losing], shares[losing], resolution))
+            losing = losing[~won]
+            capped = losing[high[losing] == caps[losing]]
+            high[capped], low[capped] = -1, -1
+            losing = losing[high[losing] != -1]
+            low[losing] = high[losing]
+            high[losing] = np.minimum(high[losing] * 16, caps[losing])
+
+        while len(active := np.flatnonzero(high - low > np.maximum(1, high >> 10))) > 0:
+            mid = (low[active] + high[active]) // 2
+            won = wins(armies(mid, shares[active], resolution))
+            high[active[won]] = mid[won]
+            low[active[~won]] = mid[~won]
+        return high
+
+    def costs(budgets: np.ndarray, shares: np.ndarray, resolution: int) -> np.ndarray:
+        units = armies(np.maximum(budgets, 0), shares, resolution)
+        return np.where(budgets >= 0, nm.army.ArmyBatch(units).recruit_time(tdp, bonus_alli)[1], np.inf)
+
+    coarse = min(resolution, _COARSE_RESOLUTION)
+    shares = _simplex_grid(len(type_idx), coarse)
+    budgets = min_budgets(shares, coarse, np.ones(len(shares), dtype=np.int64))
+    split_costs = costs(budgets, shares, coarse)
+    if np.isinf(split_costs.min()):
+        return None
+    i = np.argmin(split_costs)
+    best_army, best_cost = armies(budgets[[i]], shares[[i]], coarse)[0], split_costs[i]
+
+    # the best coarse split on the grid of the given resolution, the rounding remainder going to its largest share,
+    # then the neighbour moving a share between two unit types while it lowers the recruit time
+    split = shares[i] * resolution // coarse
+    split[np.argmax(split)] += resolution - split.sum()
+    splits, budget, cost = split[np.newaxis], max(budgets[i], 1), np.inf
+    seen = {tuple(split)}
+    moves = [(i, j) for i in range(len(type_idx)) for j in range(len(type_idx)) if i != j]
+    while len(splits) > 0:
+        budgets = min_budgets(splits, resolution, np.full(len(splits), budget))
+        split_costs = costs(budgets, splits, resolution)
+        i = np.argmin(split_costs)
+        if split_costs[i] >= cost:
+            break
+        split, budget, cost = splits[i], budgets[i], split_costs[i]
+        if cost < best_cost:
+            best_army, best_cost = armies(budgets[[i]], splits[[i]], resolution)[0], cost
+        neighbours = [split.copy() for _ in moves]
+        for neighbour, (from_type, to_type) in zip(neighbours, moves):
+            neighbour[from_type] -= 1
+            neighbour[to_type] += 1
+        neighbours = [n for n in neighbours if n.min() >= 0 and tuple(n) not in seen]
+        seen.update(tuple(n) for n in neighbours)
+        splits = np.array(neighbours, dtype=np.int64).reshape(-1, len(type_idx))
+
+    best = best_army.copy()
+    for i in type_idx:
+        low_count, high_count = -1, best[i]
+        while high_count - low_count > 1:
+            mid_count = (low_count + high_count) // 2
+            best[i] = mid_count
+            if wins(best[np.newaxis])[0]:
+                high_count = mid_count
+            else:
+                low_count = mid_count
+        best[i] = high_count
+
+    army = nm.army.Army(best)
+    return army, army.recruit_time(tdp, bonus_alli)[1]
+
+
+def simulate_waves(attackers: t.Sequence[WarParty], defender: WarParty) -> list[nm.battle.Battle]:
+    """Simulates successive attacks on the same defender, each wave fighting what the previous ones left.
+
+    Waves after the one wiping the defender out don't fight and have no battle."""
+    battles = []
+    for attacker in attackers:
+        if defender.army.count == 0:
             break
-    return rounds
+        battle = simulate_battle(attacker, defender)
+        battles.append(battle)
+        defender = WarParty(battle.get_left_armies()[1], defender.bonuses, defender.atk)
+    return battles
 
 
-def simulate_battle(attacker: WarParty, defender: WarParty) -> nm.battle.Battle:
-    battle_rounds = simulate_rounds(attacker, defender)
-    return nm.battle.Battle(attacker.army, defender.army, battle_rounds)
+@dataclass
+class WavePlan:
+    """Waves in attack order, the battles they fought, and the cost of the attacker losses"""
+
+    waves: list[nm.army.Army]
+    battles: list[nm.battle.Battle]
+    cost: float
+    wiped: bool
+
+
+@dataclass
+class _WaveNode:
+    remaining: tuple[int, ...]
+    defender: np.ndarray
+    cost: float
+    waves: tuple[tuple[int, ...], ...]
+
+
+def _pareto(nodes: list[_WaveNode]) -> list[_WaveNode]:
+    """Drops the nodes with both a higher cost and more defending units of every type than another one"""
+    kept: list[_WaveNode] = []
+    for node in sorted(nodes, key=lambda n: n.cost):
+        if not any((k.defender <= node.defender).all() for k in kept):
+            kept.append(node)
+    return kept
+
+
+def plan_waves(
+    attacker: WarParty,
+    defender: WarParty,
+    max_waves: int = 3,
+    resolution: int = 1,
+    objective: t.Literal["losses", "ponte"] = "losses",
+) -> WavePlan:
+    """Finds how to split the attacker army into at most max_waves successive waves, and in which order to send
+    them, so that the defender is wiped out for the lowest losses: unit count, or recruit time with "ponte".
+
+    Every unit type is cut into resolution equal shares, a wave being any set of the shares not sent yet. The
+    search goes one wave at a time, every candidate wave of every plan being simulated at once with
+    simulate_battles, and identical (wave, defender) fights only once. Plans are dropped as soon as they cost
+    more than the best wiping one, or when another plan with the same shares left costs less and leaves fewer
+    defending units of every type. If no plan wipes the defender, the one leaving it the least base hp is returned.
+    """
+    if defender.army.count == 0:
+        return WavePlan([], [], 0.0, True)
+    type_idx = np.flatnonzero(attacker.army._units)
+    counts = attacker.army._units[type_idx]
+    weights = np.ones(len(nm.army.unit_names)) if objective == "losses" else nm.army.unit_stats[:, 3]
+    n_units = len(nm.army.unit_names)
+
+    def wave_units(remaining: tuple[int, ...], shares: tuple[int, ...]) -> np.ndarray:
+        used = resolution - np.array(remaining)
+        units = np.zeros(n_units, dtype=np.int64)
+        units[type_idx] = counts * (used + shares) // resolution - counts * used // resolution
+        return units
+
+    fights: dict[tuple[bytes, bytes], tuple[float, np.ndarray]] = {}
+    best: t.Optional[_WaveNode] = None
+    closest = _WaveNode(tuple([resolution] * len(type_idx)), defender.army._units, 0.0, ())
+    frontier = [closest]
+    for _ in range(max_waves):
+        children = []
+        for node in frontier:
+            if best is not None and node.cost >= best.cost:
+                continue
+            for shares in it.product(*(range(r + 1) for r in node.remaining)):
+                if any(shares):
+                    children.append((node, shares, wave_units(node.remaining, shares)))
+
+        unknown = {}
+        for node, _, units in children:
+            key = (units.tobytes(), node.defender.tobytes())
+            if key not in fights:
+                unknown[key] = (units, node.defender)
+        if unknown:
+            battles = simulate_battles(
+                [units for units, _ in unknown.values()],
+                [defender_units for _, defender_units in unknown.values()],
+                (attacker.bonuses.dmg, attacker.bonuses.hp),
+                (defender.bonuses.dmg, defender.bonuses.hp),
+            )
+            attacker_losses, defender_losses = battles.get_total_losses()
+            for i, (key, (_, defender_units)) in enumerate(unknown.items()):
+                fights[key] = float(attacker_losses[i] @ weights), defender_units - defender_losses[i]
+
+        frontier = []
+        for node, shares, units in children:
+            loss_cost, defender_left = fights[(units.tobytes(), node.defender.tobytes())]
+            child = _WaveNode(
+                tuple(r - s for r, s in zip(node.remaining, shares)),
+                defender_left,
+                node.cost + loss_cost,
+                node.waves + (shares,),
+            )
+            if not defender_left.any():
+                if best is None or child.cost < best.cost:
+                    best = child
+            elif any(child.remaining):
+                frontier.append(child)
+            left_hp, closest_hp = defender_left @ nm.army.unit_stats[:, 0], closest.defender @ nm.army.unit_stats[:, 0]
+            if (left_hp, child.cost) < (closest_hp, closest.cost):
+                closest = child
+
+        groups = collections.defaultdict(list)
+        for node in frontier:
+            if best is None or node.cost < best.cost:
+                groups[node.remaining].append(node)
+        frontier = [node for group in groups.values() for node in _pareto(group)]
+        if not frontier:
+            break
+
+    plan = best or closest
+    remaining = tuple([resolution] * len(type_idx))
+    waves = []
+    for shares in plan.waves:
+        waves.append(nm.army.Army._wrap(wave_units(remaining, shares)))
+        remaining = tuple(r - s for r, s in zip(remaining, shares))
+    battles = simulate_waves([WarParty(wave, attacker.bonuses, attacker.atk) for wave in waves], defender)
+    return WavePlan(waves, battles, plan.cost, best is not None)
 
 
-def analyze_battle(battle: nm.battle.Battle) -> tuple[WarParty, WarParty]:
+@dataclass
+class FloodCurve:
+    """Defender hp removed and ponte lost by floods of a single unit type, by increasing unit count"""
+
+    unit_type: str
+    counts: np.ndarray
+    hp_removed: np.ndarray
+    ponte: np.ndarray
+    breakpoint: t.Optional[int]
+
+    @property
+    def efficiency(self) -> np.ndarray:
+        """Defender hp removed per second of ponte lost, infinite when nothing is lost"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.hp_removed > 0, self.hp_removed / self.ponte, 0.0)
+
+    @property
+    def best_count(self) -> int:
+        """Smallest count with the highest efficiency"""
+        return int(self.counts[np.argmax(self.efficiency)])
+
+
+def flood_breakpoint(defender: WarParty, atk_bonuses: Bonuses, unit_type: str) -> t.Optional[int]:
+    """Smallest count of unit_type whose total damage is over the defender total hp, which only ripostes 10% of its
+    damage in the first round then. None if even MAX_UNIT_COUNT units don't reach it."""
+    short_names = [short_name for _, short_name, _ in nm.army.unit_names]
+    unit_atk = nm.army.unit_stats[short_names.index(unit_type), 1]
+    target = defender.total_hp
+
+    def reaches(count: int) -> bool:
+        base_dmg = count * unit_atk
+        return np.floor(0.5 + base_dmg + np.floor(0.5 + base_dmg * atk_bonuses.dmg)) >= target
+
+    low, high = 0, nm.army.MAX_UNIT_COUNT
+    if not reaches(high):
+        return None
+    while high - low > 1:
+        mid = (low + high) // 2
+        if reaches(mid):
+            high = mid
+        else:
+            low = mid
+    return high
+
+
+def size_flood(
+    defender: WarParty,
+    atk_bonuses: Bonuses,
+    unit_type: str = "JS",
+    tdp: int = 0,
+    bonus_alli: int = 0,
+    max_count: t.Optional[int] = None,
+    samples: int = 64,
+) -> FloodCurve:
+    """Scans floods of unit_type against the defender, from 1 to max_count units, defaulting to 4 times the
+    flood_breakpoint, and measures the defender hp removed per second of ponte lost.
+
+    The curve is sampled geometrically, densely around the breakpoint where the first round riposte drops to 10%,
+    then around the most efficient sample, zooming in until its neighbours are next to it. Every step simulates
+    its counts together with simulate_battles."""
+    short_names = [short_name for _, short_name, _ in nm.army.unit_names]
+    type_idx = short_names.index(unit_type)
+    breakpoint = flood_breakpoint(defender, atk_bonuses, unit_type)
+    if max_count is None:
+        max_count = nm.army.MAX_UNIT_COUNT if breakpoint is None else min(4 * breakpoint, nm.army.MAX_UNIT_COUNT)
+    hp_mult = 1 + defender.bonuses.hp
+    results: dict[int, tuple[float, int]] = {}
+
+    def evaluate(counts: np.ndarray):
+        counts = np.setdiff1d(np.clip(counts, 1, max_count), list(results))
+        if len(counts) == 0:
+            return
+        units = np.zeros((len(counts), len(short_names)), dtype=np.int64)
+        units[:, type_idx] = counts
+        defenders = np.broadcast_to(defender.army._units, units.shape)
+        battles = simulate_battles(
+            units, defenders, (atk_bonuses.dmg, atk_bonuses.hp), (defender.bonuses.dmg, defender.bonuses.hp)
+        )
+        atk_losses, def_losses = battles.get_total_losses()
+        hp_removed = def_losses @ nm.army.unit_stats[:, 0] * hp_mult
+        ponte = nm.army.reduced_recruit_time(atk_losses * nm.army.unit_stats[:, 3], tdp, bonus_alli)
+        results.update(zip(counts.tolist(), zip(hp_removed.tolist(), ponte.tolist())))
+
+    def curve() -> FloodCurve:
+        counts = np.array(sorted(results), dtype=np.int64)
+        hp_removed, ponte = np.array([results[count] for count in counts.tolist()]).T
+        return FloodCurve(unit_type, counts, hp_removed, ponte, breakpoint)
+
+    initial = [np.geomspace(1, max_count, samples).round().astype(np.int64)]
+    if breakpoint is not None:
+        initial.append(breakpoint + np.arange(-samples // 8, samples // 8 + 1))
+    evaluate(np.concatenate(initial))
+
+    while True:
+        flood = curve()
+        best = np.argmax(flood.efficiency)
+        low, high = flood.counts[max(best - 1, 0)], flood.counts[min(best + 1, len(flood.counts) - 1)]
+        if high - low <= 2:
+            return flood
+        before = len(results)
+        evaluate(np.linspace(low, high, min(samples, high - low + 1)).round().astype(np.int64))
+        if len(results) == before:
+            return flood
+
+
+def analyze_battle(
+    battle: nm.battle.Battle, cache: t.Optional["nm.store.ResultStore"] = None
+) -> tuple[WarParty, WarParty]:
+    """Infers the bonuses of both parties from the rounds, looking them up first in cache if one is given"""
+    if cache is not None and (parties := cache.get_analysis(battle)) is not None:
+        return parties
     atk_bonuses, def_bonuses = Bonuses.from_rounds(battle.rounds)
 
-    return (
+    parties = (
         WarParty(battle.attacker, bonuses=atk_bonuses, atk=True),
         WarParty(battle.defender, bonuses=def_bonuses, atk=False),
     )
+    if cache is not None:
+        cache.put_analysis(battle, *parties)
+    return parties
@@ -0,0 +1,87 @@
+"""Pool running the CPU-heavy handlers of the app off the Gradio event loop.
+
+Configured from the environment:
+    NAWMINATOR_EXECUTOR    "thread" (default), "process" or "inline" to run in the calling thread
+    NAWMINATOR_WORKERS     number of workers, and of heavy events running at once, defaults to the cpu count
+    NAWMINATOR_QUEUE_SIZE  maximum number of events waiting in the Gradio queue, defaults to 64
+    NAWMINATOR_STORE       path of a SQLite result store shared by every worker, none by default
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import typing as t
+
+import nawminator as nm
+
+EXECUTOR = os.environ.get("NAWMINATOR_EXECUTOR", "thread")
+WORKERS = int(os.environ.get("NAWMINATOR_WORKERS", os.cpu_count() or 1))
+QUEUE_SIZE = int(os.environ.get("NAWMINATOR_QUEUE_SIZE", 64))
+STORE = os.environ.get("NAWMINATOR_STORE")
+
+
+@functools.cache
+def executor() -> t.Optional[concurrent.futures.Executor]:
+    match EXECUTOR:
+        case "process":
+            # spawn rather than fork, the Gradio server being multi-threaded
+            return concurrent.futures.ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        case "thread":
+            return concurrent.futures.ThreadPoolExecutor(WORKERS, thread_name_prefix="nawminator")
+        case "inline":
+            return None
+        case _:
+            raise ValueError(f"Unknown NAWMINATOR_EXECUTOR: {EXECUTOR}")
+
+
+@functools.cache
+def store() -> t.Optional["nm.store.ResultStore"]:
+    return nm.store.ResultStore(STORE) if STORE else None
+
+
+async def run(fn: t.Callable, *args):
+    """Runs fn(*args) in the pool without blocking the event loop, fn and args must be picklable"""
+    if (pool := executor()) is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+def simulate_rc(attacker: nm.war.WarParty, defender: nm.war.WarParty) -> str:
+    if (battle := nm.war.simulation_cache.get(attacker, defender)) is None:
+        battle = nm.war.simulate_battle(attacker, defender, cache=store())
+        nm.war.simulation_cache.put(attacker, defender, battle)
+    return battle.to_rc()
+
+
+def infer_levels_batch(
+    bonuses: t.Sequence[nm.war.Bonuses],
+    lieu: nm.levels.FightZone,
+    alli_types: t.Optional[t.Sequence[t.Optional[nm.levels.AllianceType]]],
+    atk: bool,
+) -> list[t.Optional[nm.levels.Levels]]:
+    """Most plausible levels of each bonuses, solved as one batch, None where no level set explains them"""
+    candidates, unexplained = nm.levels.levels_milp(lieu, atk).solve_batch(
+        [(b.min_dmg, b.dmg) for b in bonuses], [(b.min_hp, b.hp) for b in bonuses], alli_types=alli_types
+    )
+    return [None if skip else nm.levels.LevelsIndex.to_levels(c) for c, skip in zip(candidates, unexplained)]
+
+
+def infer_levels(party: nm.war.WarParty, lieu: nm.levels.FightZone, alli_type, atk: bool) -> nm.levels.Levels:
+    if (levels := infer_levels_batch([party.bonuses], lieu, [alli_type], atk)[0]) is None:
+        b = party.bonuses
+        return nm.levels.Levels.from_bonuses(b.dmg, b.hp, lieu=lieu, alli_type=alli_type, atk=atk)
+    return levels
+
+
+def analyse_rc(
+    rc: str, lieu: nm.levels.FightZone, atk_alli, def_alli
+) -> tuple[nm.war.WarParty, nm.war.WarParty, nm.levels.Levels, nm.levels.Levels]:
+    attacker, defender = nm.war.analyze_battle(nm.battle.Battle.from_rc(rc), cache=store())
+    return (
+        attacker,
+        defender,
+        infer_levels(attacker, lieu, atk_alli, atk=True),
+        infer_levels(defender, lieu, def_alli, atk=False),
+    )
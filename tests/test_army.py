@@ -1,4 +1,7 @@
-from nawminator.army import Army, MAX_UNIT_COUNT
+from fractions import Fraction
+import math
+
+from nawminator.army import Army, ArmyBatch, MAX_UNIT_COUNT, split_units_by_hp, split_units_by_count, unit_stats
 import pytest
 import numpy as np
 import hypothesis as hp
@@ -77,6 +80,9 @@ def test_import(string, expected: Army):
         (Army(JS=1000), 8036, (Army(JS=502), Army(JS=498))),
         (Army(JS=1000), 8040, (Army(JS=503), Army(JS=497))),
         (Army(JS=500, S=500), 10000, (Army(JS=500, S=100), Army(S=400))),
+        # 2**56 + 4 hp of E rounds to 2**56 in floats, which would leave 16 hp rather than 12 for the ME
+        (Army(E=2**54 + 1, ME=10), 2.0**56 + 16, (Army(E=2**54 + 1, ME=2), Army(ME=8))),
+        (Army(E=MAX_UNIT_COUNT, TKE=MAX_UNIT_COUNT), 1e30, (Army(E=MAX_UNIT_COUNT, TKE=MAX_UNIT_COUNT), Army())),
     ],
 )
 def test_split_by_hp(army: Army, dmg, expected: (Army, Army)):
@@ -100,3 +106,118 @@ def test_split_by_count_property(army: Army, count: np.int64):
     lost, left = army.split_by_count(count)
     assert lost.count == count
     assert lost + left == army
+
+
+@hp.given(
+    armies=st.lists(army_strategy, min_size=1, max_size=10),
+    fractions=st.lists(st.floats(min_value=0, max_value=1), min_size=10, max_size=10),
+)
+def test_split_units_matrix(armies: list[Army], fractions: list[float]):
+    units = np.array([a._units for a in armies])
+    hps = np.array([a.base_hp * f for a, f in zip(armies, fractions)])
+    counts = np.array([min(int(a.count * f), a.count) for a, f in zip(armies, fractions)], dtype=np.int64)
+
+    lost, left = split_units_by_hp(units, hps)
+    for army, hp, row_lost, row_left in zip(armies, hps, lost, left):
+        assert army.split_by_hp(hp) == (Army(row_lost), Army(row_left))
+
+    lost, left = split_units_by_count(units, counts)
+    assert (lost.sum(axis=1) == counts).all()
+    for army, cnt, row_lost, row_left in zip(armies, counts, lost, left):
+        assert army.split_by_count(cnt) == (Army(row_lost), Army(row_left))
+
+
+def test_split_units_by_hp_large_counts():
+    """Pins the exact losses of armies whose hp doesn't fit in a float or an int64"""
+    rng = np.random.default_rng(0)
+    units = rng.integers(0, MAX_UNIT_COUNT, (200, 15), endpoint=True)
+    total_hps = units.astype(object) @ unit_stats[:, 0].astype(object)
+    hps = total_hps.astype(np.float64) * rng.random(200)
+    lost, left = split_units_by_hp(units, hps)
+    for row, hp_, row_lost in zip(units, hps, lost):
+        remaining = Fraction(hp_)
+        for count, unit_hp, unit_lost in zip(row.tolist(), unit_stats[:, 0].tolist(), row_lost.tolist()):
+            dmg = min(max(remaining, 0), count * unit_hp)
+            assert unit_lost == (count if dmg == count * unit_hp else math.floor(Fraction(1, 2) + dmg / unit_hp))
+            remaining -= count * unit_hp
+    assert (lost + left == units).all()
+
+
+def test_import_many():
+    strings = [
+        "1 000 Jeunes soldates, 1 000 Jeunes légionnaires, 1 000 Jeunes tanks",
+        "1 JS, 1 JL, 1 JTK, 1 TK, 1 TKE",
+        "Troupe en défense : 582 031 Jeunes soldates, 4 412 Soldates, 2 Soldates d'élite",
+    ]
+    expected = [Army(JS=1000, JL=1000, JTK=1000), Army(JS=1, JL=1, JTK=1, TK=1, TKE=1), Army(JS=582031, S=4412, SE=2)]
+    units = Army.from_strs(strings)
+    assert units.shape == (3, 15)
+    assert units.dtype == np.int64
+    assert [Army(row) for row in units] == expected
+    assert Army.from_strs(iter(strings), as_armies=True) == expected
+    assert Army.from_strs([]).shape == (0, 15)
+
+
+@hp.given(st.lists(army_strategy, max_size=10))
+def test_army_batch(armies: list[Army]):
+    batch = ArmyBatch.from_armies(armies)
+    assert len(batch) == len(armies)
+    assert list(batch) == armies
+    for i, army in enumerate(armies):
+        assert batch[i] == army
+        assert batch.base_hp[i] == army.base_hp
+        assert batch.base_atk[i] == army.base_atk
+        assert batch.base_def[i] == army.base_def
+        assert batch.count[i] == army.count
+        assert batch.recruit_time(tdp=10, bonus_alli=5)[1][i] == army.recruit_time(tdp=10, bonus_alli=5)[1]
+
+
+def test_army_batch_arithmetic():
+    batch = ArmyBatch.from_strs(["1 000 JS, 10 TK", "5 E"])
+    assert batch + Army(E=1) == ArmyBatch.from_armies([Army(E=1, JS=1000, TK=10), Army(E=6)])
+    assert batch - ArmyBatch.from_armies([Army(TK=10), Army(E=5)]) == ArmyBatch.from_armies([Army(JS=1000), Army()])
+    assert batch + batch - batch == batch
+    with pytest.raises(ValueError):
+        batch - Army(JS=1)
+
+
+def test_army_batch_view():
+    batch = ArmyBatch(np.zeros((3, 15)))
+    batch[1]._units[0] = 42
+    assert batch.units[1, 0] == 42
+    assert batch.units.nbytes == 3 * 120
+
+
+def test_army_validation():
+    army = Army(JS=10)
+    with pytest.raises(AttributeError):
+        army.name = "flood"
+    with pytest.raises(ValueError):
+        Army(JS=MAX_UNIT_COUNT + 1)
+    with pytest.raises(ValueError):
+        army - Army(JS=11)
+    lost, left = army.split_by_count(4)
+    assert (lost, left) == (Army(JS=4), Army(JS=6))
+    assert lost._units.dtype == np.int64
+
+
+def test_recruit_time_grid():
+    batch = ArmyBatch.from_strs(["1 000 JS, 10 TK", "5 E, 30 SE", "2 TKE"])
+    grid = batch.recruit_time_grid(range(0, 30, 7), [0, 3, 12])
+    assert grid.shape == (3, 5, 3)
+    for i, army in enumerate(batch):
+        for j, tdp in enumerate(range(0, 30, 7)):
+            for k, bonus_alli in enumerate([0, 3, 12]):
+                assert grid[i, j, k] == army.recruit_time(tdp, bonus_alli)[1]
+    non_xp = batch.recruit_time_grid([10], [5], non_xp=True)
+    assert non_xp[1, 0, 0] == Army(E=5, JS=30).recruit_time(10, 5)[1]
+    assert non_xp[1, 0, 0] == batch[1].non_xp_recruit_time(10, 5)[1]
+
+
+@pytest.mark.parametrize("tdp,bonus_alli", [(101, 0), (10.0, 0), (-1, 0), (10.5, 3), (20, 150)])
+def test_recruit_time_out_of_table(tdp, bonus_alli):
+    army = Army(JS=100, TK=10)
+    raw, total = army.recruit_time(tdp, bonus_alli)
+    assert total == np.floor(raw * 0.95**tdp * 0.99**bonus_alli).astype(np.int64).sum()
+    grid = ArmyBatch.from_armies([army]).recruit_time_grid([tdp], [bonus_alli])
+    assert grid[0, 0, 0] == total
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import nawminator as nm
+import nawminator.cli
+
+ATTACKER = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=True)
+DEFENDER = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=False)
+
+
+def run(capsys, *args) -> list[dict]:
+    assert nm.cli.main(["-q", *args]) == 0
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_analyze(tmp_path, capsys, jobs):
+    rc = nm.war.simulate_battle(ATTACKER, DEFENDER).to_rc()
+    path = tmp_path / "dump.txt"
+    # a report without combat lines parses to a battle without rounds
+    no_rounds = "Troupe en attaque : 1 Jeune soldate\nTroupe en défense : 1 Jeune soldate"
+    path.write_text("\n\n".join([rc, "Troupe en attaque : 1 Jeune soldate\nRien", no_rounds, rc]), encoding="utf-8")
+    results = run(capsys, "--jobs", jobs, "--chunk-size", "1", "analyze", str(path), "--def-alliance", "None")
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert "error" in results[1] and "error" in results[2]
+    assert results[0]["attacker"]["dmg"] == results[3]["attacker"]["dmg"] == 0.95
+    assert results[0]["defender_levels"].startswith("M")
+
+
+def test_simulate_jsonl(tmp_path, capsys):
+    matchup = {
+        "attacker": {"army": "100 JS", "bonuses": {"dmg": 0.95, "hp": 0.95}},
+        "defender": {"army": [0, 0, 100, *[0] * 12], "bonuses": {"dmg": 0.95, "hp": 0.95}},
+    }
+    path = tmp_path / "matchups.jsonl"
+    path.write_text("\n".join([json.dumps(matchup), "{}", json.dumps(matchup)]), encoding="utf-8")
+    results = run(capsys, "simulate", str(path))
+    expected = nm.war.simulate_battle(ATTACKER, DEFENDER)
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert "error" in results[1]
+    assert results[0] == results[2] | {"index": 0}
+    assert results[0]["rounds"] == len(expected)
+    assert results[0]["attacker_left"] == expected.get_left_armies()[0]._units.tolist()
+
+
+def test_simulate_csv(tmp_path, capsys):
+    path = tmp_path / "matchups.csv"
+    path.write_text(
+        "attacker,attacker_dmg,attacker_hp,defender,defender_levels,zone\n"
+        "100 JS,0.95,0.95,100 JS,M10 C10 D5 L0,Dôme\n"
+        "10 TK,0.5,0.5,1 JS,M0 C0,TDC\n"
+        "10 TK,nan,0.5,1 JS,M0 C0,TDC\n",
+        encoding="utf-8",
+    )
+    results = run(capsys, "--jobs", "2", "simulate", str(path))
+    assert len(results) == 3
+    assert results[1]["defender_wiped"] and results[1]["rounds"] == 1
+    assert "error" in results[2]
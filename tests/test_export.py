@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nawminator as nm
+import nawminator.export
+
+PARTIES = [
+    (nm.army.Army(JS=100), nm.army.Army(JS=100)),
+    (nm.army.Army(TK=1000), nm.army.Army(JS=10, G=5)),
+    (nm.army.Army(GE=2), nm.army.Army(TK=1)),
+]
+
+
+@pytest.fixture(scope="module")
+def battles() -> list[nm.battle.Battle]:
+    return [
+        nm.war.simulate_battle(
+            nm.war.WarParty(attacker, nm.war.Bonuses(0.5, 0.5), atk=True),
+            nm.war.WarParty(defender, nm.war.Bonuses(0.3, 0.3), atk=False),
+        )
+        for attacker, defender in PARTIES
+    ]
+
+
+def test_rounds_frame(battles):
+    frame = nm.export.rounds_frame(battles)
+    assert len(frame) == sum(len(b) for b in battles)
+    assert frame.groupby("battle")["round"].max().tolist() == [len(b) - 1 for b in battles]
+    second = frame[frame["battle"] == 0].iloc[1]
+    assert second["attacker_base_dmg"] == battles[0].rounds[1].attacker_base_dmg
+    assert second["defender_losses_JS"] == battles[0].rounds[1].defender_losses._units[2]
+    assert nm.export.rounds_frame(battles[0]).equals(frame[frame["battle"] == 0].reset_index(drop=True))
+
+
+def test_battles_frame(battles):
+    frame = nm.export.battles_frame(battles)
+    assert frame["rounds"].tolist() == [len(b) for b in battles]
+    assert frame["defender_wiped"].tolist() == [b.get_left_armies()[1].count == 0 for b in battles]
+    assert frame["stalemate"].tolist() == [False, False, True]
+    assert frame["attacker_losses_JS"][0] == battles[0].get_total_losses()[0]._units[2]
+    expected_dmg = battles[0].attacker_base_dmg.sum() + battles[0].attacker_bonus_dmg.sum()
+    assert frame["attacker_dmg"][0] == expected_dmg
+
+
+@pytest.mark.parametrize("writer,reader", [("to_parquet", pd.read_parquet), ("to_feather", pd.read_feather)])
+@pytest.mark.parametrize("summary", [False, True])
+def test_write_in_chunks(tmp_path, battles, writer, reader, summary):
+    path = tmp_path / "battles"
+    assert getattr(nm.export, writer)(iter(battles), path, summary=summary, chunk_size=2) == len(battles)
+    expected = (nm.export.battles_frame if summary else nm.export.rounds_frame)(battles)
+    pd.testing.assert_frame_equal(reader(path), expected)
+
+
+def test_empty(tmp_path):
+    path = tmp_path / "empty.parquet"
+    assert nm.export.to_parquet([], path) == 0
+    assert list(pd.read_parquet(path).columns) == list(nm.export.rounds_frame([]).columns)
+    assert len(nm.export.battles_frame(nm.battle.BattleBatch.from_battles([]))) == 0
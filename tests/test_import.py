@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def test_core_does_not_import_ui():
+    code = "import nawminator, sys; print(sorted(m for m in ('gradio', 'pandas', 'loguru', 'scipy', 'nawminator.interface') if m in sys.modules))"
+    process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert process.stdout.strip() == "[]"
+
+
+def test_lazy_modules():
+    import nawminator as nm
+
+    assert nm.workers.__name__ == "nawminator.workers"
+    with pytest.raises(AttributeError):
+        nm.not_a_module
+
+
+def test_metrics(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    code = (
+        "import nawminator as nm; "
+        "nm.war.simulate_rounds(nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0, 0), True), "
+        "defender=nm.war.WarParty(nm.army.Army.from_str(s='100 JS'), nm.war.Bonuses(0, 0), False))"
+    )
+    env = {**os.environ, "NAWMINATOR_METRICS": "1", "NAWMINATOR_METRICS_FILE": str(path)}
+    subprocess.run([sys.executable, "-c", code], capture_output=True, env=env, check=True)
+    metrics = {line["metric"]: line for line in map(json.loads, path.read_text().splitlines())}
+    assert metrics["simulate_battle"]["count"] == 1
+    assert metrics["simulate_battle.units"]["p50"] == 200
+    assert metrics["Army.from_str"]["count"] == 1
+    assert "simulate_rounds" not in metrics
+
+
+def test_metrics_off():
+    code = "import nawminator as nm; print(hasattr(nm.war.simulate_battle, '__wrapped__'))"
+    env = {**os.environ, "NAWMINATOR_METRICS": "0"}
+    process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    assert process.stdout.strip() == "False"
@@ -1,7 +1,19 @@
-from nawminator.levels import Levels, AllianceType, HeroType, FightZone
+from nawminator.levels import (
+    Levels,
+    AllianceType,
+    HeroType,
+    FightZone,
+    levels_index,
+    levels_milp,
+    LevelsMILP,
+    ALLIANCES,
+    HERO_TYPES,
+)
 import pytest
 import numpy as np
 
+import nawminator as nm
+
 
 @pytest.mark.parametrize(
     "levels,expected",
@@ -191,3 +203,137 @@ def test_import(s, expected: Levels):
 )
 def test_from_bonuses(bonus_dmg: np.float64, bonus_hp: np.float64, lieu, alli_type, atk, expected):
     assert Levels.from_bonuses(bonus_dmg, bonus_hp, lieu=lieu, alli_type=alli_type, atk=atk) == expected
+
+
+@pytest.mark.parametrize("bonus_hp,lieu", [(1.46, FightZone.DOME), (2.13, FightZone.LOGE)])
+def test_from_bonuses_hero_type(bonus_hp, lieu):
+    levels = Levels.from_bonuses(1.1, bonus_hp, lieu=lieu, alli_type=AllianceType.PACIFISTE, atk=False)
+    assert levels.hero_type == HeroType.VIE
+    assert Levels.from_str(levels.to_str()) == levels
+
+
+def test_from_bonuses_unexplained():
+    with pytest.raises(ValueError):
+        Levels.from_bonuses(0.02, 0.0, FightZone.TDC, alli_type=AllianceType.GUERRIER, atk=True)
+
+
+class TestLevelsIndex:
+    @pytest.mark.parametrize(
+        "levels,lieu,atk",
+        [
+            (Levels(mandibule=16, carapace=15, hero_lvl=120, alliance=AllianceType.GUERRIER), FightZone.TDC, True),
+            (Levels(mandibule=20, carapace=18, hero_lvl=150, hero_type=HeroType.VIE, dome=25), FightZone.DOME, False),
+            (Levels(mandibule=8, carapace=30, hero_lvl=37, hero_type=HeroType.DEFENSE, loge=12), FightZone.LOGE, False),
+            (Levels(mandibule=0, carapace=0, alliance=None), FightZone.DOME, False),
+        ],
+    )
+    def test_query_exact(self, levels: Levels, lieu, atk):
+        dmg, hp = levels.bonus_atk if atk else bonuses_of(levels, lieu)
+        index = levels_index()
+        candidates = index.query((dmg, dmg), (hp, hp), lieu, atk=atk, step=0)
+        found = [index.to_levels(c) for c in candidates]
+        assert all(np.isclose(l.bonus_atk if atk else bonuses_of(l, lieu), (dmg, hp)).all() for l in found)
+        assert any(
+            (l.mandibule, l.carapace, l.dome, l.loge, l.alliance)
+            == (levels.mandibule, levels.carapace, levels.dome, levels.loge, levels.alliance)
+            and l.hero_type == levels.hero_type
+            and c["hero_lvl_min"] <= levels.hero_lvl <= c["hero_lvl_max"]
+            for l, c in zip(found, candidates)
+        )
+
+    def test_query_rounded_bounds(self):
+        levels = Levels(mandibule=20, carapace=18, hero_lvl=151, hero_type=HeroType.VIE, dome=25)
+        dmg, hp = levels.bonus_dome
+        # bounds rounded to 0.005 like Bonuses.compute_bonuses
+        candidates = levels_index().query(
+            (np.ceil(dmg / 0.005) * 0.005, np.floor(dmg / 0.005) * 0.005),
+            (np.ceil(hp / 0.005) * 0.005, np.floor(hp / 0.005) * 0.005),
+            FightZone.DOME,
+            atk=False,
+            alli_types=[AllianceType.NEUTRE],
+        )
+        assert len(candidates) > 0
+        assert (candidates["alliance"] == ALLIANCES.index(AllianceType.NEUTRE)).all()
+        assert any(
+            (c["mandibule"], c["carapace"], c["dome"], HERO_TYPES[c["hero_type"]]) == (20, 18, 25, HeroType.VIE)
+            and c["hero_lvl_min"] <= 151 <= c["hero_lvl_max"]
+            for c in candidates
+        )
+
+
+class TestLevelsMILP:
+    def lowest(self, candidates: np.ndarray) -> np.ndarray:
+        """Candidates of the lowest total level, then carapace closest to mandibule"""
+        total = candidates["mandibule"] + candidates["carapace"] + candidates["dome"] + candidates["loge"]
+        key = total * 100 + abs(candidates["carapace"] - candidates["mandibule"])
+        return candidates[key == key.min()]
+
+    @pytest.mark.parametrize(
+        "levels,lieu,atk",
+        [
+            (Levels(mandibule=16, carapace=15, hero_lvl=120, alliance=AllianceType.GUERRIER), FightZone.TDC, True),
+            (Levels(mandibule=20, carapace=18, hero_lvl=150, hero_type=HeroType.VIE, dome=25), FightZone.DOME, False),
+            (Levels(mandibule=8, carapace=30, hero_lvl=37, hero_type=HeroType.DEFENSE, loge=12), FightZone.LOGE, False),
+        ],
+    )
+    def test_solve_enumerates_optima(self, levels: Levels, lieu, atk):
+        dmg, hp = levels.bonus_atk if atk else bonuses_of(levels, lieu)
+        # bounds rounded to 0.005 like Bonuses.compute_bonuses
+        bounds = [(np.ceil(b / 0.005) * 0.005, np.floor(b / 0.005) * 0.005) for b in (dmg, hp)]
+        candidates = levels_milp(lieu, atk).solve(*bounds, max_solutions=64)
+        expected = self.lowest(levels_index().query(*bounds, lieu, atk=atk))
+        assert sorted(candidates.tolist()) == sorted(expected.tolist())
+        assert len(levels_milp(lieu, atk).solve(*bounds, max_solutions=1)) == 1
+
+    def test_exact_levels(self):
+        levels = Levels(mandibule=16, carapace=15, hero_lvl=120, alliance=AllianceType.GUERRIER)
+        dmg, hp = levels.bonus_atk
+        (candidate,) = levels_milp(FightZone.TDC).solve((dmg, dmg), (hp, hp), step=0)
+        assert levels_index().to_levels(candidate) == levels
+
+    def test_solve_batch(self):
+        milp = levels_milp(FightZone.DOME, atk=False)
+        bonuses = [
+            Levels(mandibule=m, carapace=c, dome=d).bonus_dome for m, c, d in [(20, 18, 25), (5, 5, 5), (0, 0, 0)]
+        ]
+        dmg = [(dmg, dmg) for dmg, _ in bonuses] + [(0.01, 0.01)]
+        hp = [(hp, hp) for _, hp in bonuses] + [(0.5, 0.5)]
+        candidates, infeasible = milp.solve_batch(dmg * 2, hp * 2, step=0, alli_types=[AllianceType.NEUTRE])
+        assert infeasible.tolist() == [False, False, False, True] * 2
+        assert (candidates[:4] == candidates[4:]).all()
+        for i in range(3):
+            expected = milp.solve(dmg[i], hp[i], step=0, alli_types=[AllianceType.NEUTRE], max_solutions=1)
+            assert candidates[i]["mandibule"] + candidates[i]["carapace"] + candidates[i]["dome"] == (
+                expected["mandibule"] + expected["carapace"] + expected["dome"]
+            )
+        assert len(milp.solve(dmg[3], hp[3], step=0, alli_types=[AllianceType.NEUTRE])) == 0
+
+    @pytest.mark.parametrize("lieu,atk", [(FightZone.TDC, True), (FightZone.DOME, False), (FightZone.LOGE, False)])
+    def test_solve_batch_index(self, monkeypatch, lieu, atk):
+        rng = np.random.default_rng(0)
+        dmg, hp = [], []
+        for m, c, d, h, alliance in zip(
+            *rng.integers(0, 61, (3, 50)), rng.integers(0, 181, 50), rng.integers(0, 4, 50)
+        ):
+            levels = Levels(mandibule=m, carapace=c, hero_lvl=h, dome=d, loge=d, alliance=ALLIANCES[alliance])
+            bonuses = levels.bonus_atk if atk else bonuses_of(levels, lieu)
+            bounds = [(np.floor(b / 0.005) * 0.005, np.ceil(b / 0.005) * 0.005) for b in bonuses]
+            dmg.append(bounds[0])
+            hp.append((None, None) if h % 5 == 0 else bounds[1])
+
+        def objective(candidates: np.ndarray) -> np.ndarray:
+            levels = np.array([candidates[name] for name in ("mandibule", "carapace", "dome", "loge")])
+            return levels.sum(axis=0) * 100 + abs(candidates["carapace"] - candidates["mandibule"])
+
+        alli_types = [AllianceType.NEUTRE]
+        candidates, infeasible = LevelsMILP(lieu, atk).solve_batch(dmg, hp, alli_types=alli_types)
+        # every analysis solved by the program
+        monkeypatch.setattr(nm.levels, "MILP_INDEX_WIDTH", -1)
+        expected, expected_infeasible = LevelsMILP(lieu, atk).solve_batch(dmg, hp, alli_types=alli_types)
+        assert not infeasible.all()
+        assert (infeasible == expected_infeasible).all()
+        assert (objective(candidates)[~infeasible] == objective(expected)[~infeasible]).all()
+
+
+def bonuses_of(levels: Levels, lieu: FightZone):
+    return {FightZone.TDC: levels.bonus_tdc, FightZone.DOME: levels.bonus_dome, FightZone.LOGE: levels.bonus_loge}[lieu]
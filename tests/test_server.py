@@ -0,0 +1,156 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import nawminator as nm
+import nawminator.server
+
+
+@pytest.fixture(scope="module")
+def connection():
+    server = nm.server.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection(*server.server_address)
+    yield connection
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+
+def post(connection: http.client.HTTPConnection, path: str, body) -> tuple[int, dict]:
+    connection.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+ATTACKER = {"army": "100 Jeunes soldates", "bonuses": {"dmg": 0.95, "hp": 0.95}}
+DEFENDER = {"army": {"JS": 100}, "bonuses": {"dmg": 0.95, "hp": 0.95}}
+
+
+def test_simulate(connection):
+    status, body = post(connection, "/simulate", {"attacker": ATTACKER, "defender": DEFENDER})
+    expected = nm.war.simulate_battle(
+        nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=True),
+        nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=False),
+    )
+    assert status == 200
+    assert len(body["rounds"]) == len(expected.rounds)
+    assert body["attacker_left"] == expected.get_left_armies()[0]._units.tolist()
+
+
+def test_simulate_batch_matches_simulate(connection):
+    defender = {"army": [0, 0, 50, *[0] * 12], "levels": "M10 C10 D5 L0", "zone": "Dôme"}
+    _, single = post(connection, "/simulate", {"attacker": ATTACKER, "defender": defender})
+    status, batch = post(
+        connection, "/simulate/batch", {"matchups": [{"attacker": ATTACKER, "defender": defender}] * 3}
+    )
+    assert status == 200
+    assert batch["battles"] == [single] * 3
+
+
+def test_simulate_envelope(connection):
+    attacker = {"army": "1 000 JS", "bonuses": {"dmg": 0.5, "hp": 0.5, "min_dmg": 0.1, "min_hp": 0.1}}
+    defender = {"army": "1 000 JS", "bonuses": {"dmg": 0.3, "hp": 0.3, "min_dmg": 0.1, "min_hp": 0.1}}
+    status, body = post(connection, "/simulate/envelope", {"attacker": attacker, "defender": defender})
+    assert status == 200
+    assert body["outcome"] == "uncertain"
+    assert body["samples"] == 3**4
+    assert body["defender_losses"][1][2] == 1000
+    body = {"attacker": attacker, "defender": defender, "resolution": 2, "step": 0.005}
+    assert post(connection, "/simulate/envelope", body)[1]["samples"] == 2**4
+    assert (
+        post(connection, "/simulate/envelope", {"attacker": attacker, "defender": defender, "resolution": 50})[0] == 400
+    )
+
+
+def test_plan_waves(connection):
+    attacker = {"army": {"JS": 30000, "S": 20000, "TK": 5000}, "bonuses": {"dmg": 0.5, "hp": 0.5}}
+    defender = {"army": {"JS": 20000, "G": 20000, "L": 5000, "TK": 3000}, "bonuses": {"dmg": 0.6, "hp": 0.8}}
+    status, body = post(connection, "/plan/waves", {"attacker": attacker, "defender": defender, "max_waves": 2})
+    assert status == 200
+    assert body["wiped"]
+    assert len(body["waves"]) == len(body["battles"]) == 2
+    assert post(connection, "/plan/waves", {"attacker": attacker, "defender": defender, "max_waves": 20})[0] == 400
+    assert post(connection, "/plan/waves", {"attacker": attacker, "defender": defender, "objective": "xp"})[0] == 400
+
+
+def test_plan_flood(connection):
+    defender = {"army": {"JS": 20000, "G": 20000}, "bonuses": {"dmg": 0.6, "hp": 0.8}}
+    body = {"attacker": {"bonuses": {"dmg": 0.5, "hp": 0.5}}, "defender": defender, "unit_type": "E"}
+    status, curve = post(connection, "/plan/flood", body)
+    assert status == 200
+    assert curve["best_count"] in curve["counts"]
+    assert len(curve["counts"]) == len(curve["hp_removed"]) == len(curve["ponte"])
+    assert post(connection, "/plan/flood", {**body, "unit_type": "X"})[0] == 400
+
+
+def test_analyze_and_recruit_time(connection):
+    rc = nm.workers.simulate_rc(
+        nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=True),
+        nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=False),
+    )
+    status, single = post(connection, "/analyze", {"rc": rc})
+    assert status == 200
+    assert single["attacker"]["dmg"] == 0.95
+    _, batch = post(connection, "/analyze/batch", {"rcs": [rc]})
+    assert batch["battles"][0]["defender"]["dmg"] == single["defender"]["dmg"]
+    assert "defender_levels" not in batch["battles"][0]
+    _, batch = post(connection, "/analyze/batch", {"rcs": [rc], "zone": "Dôme", "def_alliance": None})
+    assert batch["battles"][0]["defender_levels"].startswith("M")
+
+    _, single = post(connection, "/recruit_time", {"army": "100 JS", "tdp": 10})
+    _, batch = post(connection, "/recruit_time/batch", {"armies": ["100 JS", "1 TKE"], "tdp": 10})
+    assert single["recruit_time"] == batch["recruit_times"][0] == nm.army.Army(JS=100).recruit_time(10)[1]
+
+    _, grid = post(
+        connection, "/recruit_time/grid", {"armies": ["100 JS", "1 TKE"], "tdps": [0, 10], "bonus_allis": [0]}
+    )
+    assert [row[1][0] for row in grid["recruit_times"]] == batch["recruit_times"]
+    body = {"armies": ["100 JS"] * 100, "tdps": list(range(11)), "bonus_allis": list(range(10))}
+    assert post(connection, "/recruit_time/grid", body)[0] == 400
+
+
+def test_errors(connection):
+    assert post(connection, "/simulate", {"attacker": ATTACKER})[0] == 400
+    for bonuses in (
+        {"dmg": "nan", "hp": 0.5},
+        {"dmg": 0.5, "hp": "inf"},
+        {"dmg": 1e308, "hp": 0.5},
+        {"dmg": 0, "hp": -1},
+    ):
+        attacker = {"army": "100 JS", "bonuses": bonuses}
+        assert post(connection, "/simulate", {"attacker": attacker, "defender": DEFENDER})[0] == 400
+    assert post(connection, "/unknown", {})[0] == 404
+    # the server answers from the headers, without waiting for a body it would not read
+    connection.putrequest("POST", "/simulate")
+    connection.putheader("Content-Length", str(nm.server.MAX_BODY_SIZE + 1))
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 413
+    response.read()
+    connection.close()
+    connection.request("GET", "/health")
+    assert json.loads(connection.getresponse().read()) == {"status": "ok"}
+
+
+@pytest.mark.parametrize("length,status", [(None, 411), ("-1", 400), ("abc", 400), ("+5", 400)])
+def test_invalid_content_length(connection, length, status):
+    connection.putrequest("POST", "/simulate")
+    if length is not None:
+        connection.putheader("Content-Length", length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == status
+    assert "error" in json.loads(response.read())
+
+
+def test_internal_error(connection, monkeypatch):
+    def fail(body: dict) -> dict:
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(nm.server.ROUTES, "/fail", fail)
+    assert post(connection, "/fail", {}) == (500, {"error": "RuntimeError: boom"})
+    assert post(connection, "/simulate", {"attacker": ATTACKER, "defender": DEFENDER})[0] == 200
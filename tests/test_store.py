@@ -0,0 +1,56 @@
+import concurrent.futures
+import pickle
+
+import numpy as np
+
+import nawminator as nm
+import nawminator.store
+
+ATTACKER = nm.war.WarParty(nm.army.Army(JS=100, TK=20), nm.war.Bonuses(0.95, 0.95), atk=True)
+DEFENDER = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.5, 0.6), atk=False)
+
+
+def test_encode_decode():
+    battle = nm.war.simulate_battle(ATTACKER, DEFENDER)
+    assert nm.store.decode_battle(nm.store.encode_battle(battle)) == battle
+
+
+def test_simulate_battle(tmp_path):
+    store = nm.store.ResultStore(tmp_path / "results.db")
+    battle = nm.war.simulate_battle(ATTACKER, DEFENDER, cache=store)
+    # another connection to the same file, as another process would have
+    other = pickle.loads(pickle.dumps(store))
+    assert other.get(ATTACKER, DEFENDER) == battle
+    assert nm.war.simulate_battle(ATTACKER, DEFENDER, cache=other) == battle
+    assert other.info().hits == 2
+    assert other.get(ATTACKER, nm.war.WarParty(DEFENDER.army, nm.war.Bonuses(0.5, 0.65), atk=False)) is None
+    assert store.info() == nm.war.CacheInfo(hits=0, misses=1, maxsize=store.max_bytes, currsize=1)
+
+
+def test_analyze_battle(tmp_path):
+    store = nm.store.ResultStore(tmp_path / "results.db")
+    battle = nm.battle.Battle.from_rc(nm.war.simulate_battle(ATTACKER, DEFENDER).to_rc())
+    expected = nm.war.analyze_battle(battle, cache=store)
+    assert nm.war.analyze_battle(battle, cache=store) == expected
+    assert store.info().hits == 1
+    assert nm.war.analyze_battle(battle) == expected
+
+
+def test_threads(tmp_path):
+    store = nm.store.ResultStore(tmp_path / "results.db")
+    nm.war.simulate_battle(ATTACKER, DEFENDER, cache=store)
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        battles = list(pool.map(lambda _: store.get(ATTACKER, DEFENDER), range(400)))
+    assert all(battle is not None for battle in battles)
+    assert store.info().hits == 400
+
+
+def test_eviction(tmp_path):
+    store = nm.store.ResultStore(tmp_path / "results.db", max_bytes=64 << 10)
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        attacker = nm.war.WarParty(nm.army.Army(rng.integers(0, 10**6, 15)), ATTACKER.bonuses, atk=True)
+        nm.war.simulate_battle(attacker, DEFENDER, cache=store)
+    assert store.size() <= store.max_bytes
+    assert 0 < len(store) < 300
+    assert store.get(attacker, DEFENDER) is not None
@@ -1,6 +1,15 @@
 import pytest
 import nawminator as nm
 import numpy as np
+import hypothesis as hp
+import hypothesis.strategies as st
+
+small_army_strategy = st.lists(st.integers(min_value=0, max_value=10**6), min_size=15, max_size=15).map(nm.army.Army)
+bonuses_strategy = st.builds(
+    nm.war.Bonuses,
+    st.integers(min_value=0, max_value=300).map(lambda x: x * 0.005),
+    st.integers(min_value=0, max_value=300).map(lambda x: x * 0.005),
+)
 
 
 class TestBonuses:
@@ -88,6 +97,46 @@ class TestBonuses:
     def test_from_rounds(self, rounds: list[nm.battle.Round], expected):
         assert nm.war.Bonuses.from_rounds(rounds) == expected
 
+    def test_from_no_rounds(self):
+        with pytest.raises(ValueError):
+            nm.war.Bonuses.from_rounds([])
+
+
+class TestBonusBounds:
+    rounds = [
+        nm.battle.Round(800, 760, 700, 665, nm.army.Army(JS=50), nm.army.Army(JS=44)),
+        nm.battle.Round(448, 426, 350, 333, nm.army.Army(JS=28), nm.army.Army(JS=22)),
+        nm.battle.Round(272, 258, 154, 146, nm.army.Army(JS=17), nm.army.Army(JS=10)),
+        nm.battle.Round(192, 182, 35, 33, nm.army.Army(JS=5), nm.army.Army(JS=2)),
+    ]
+
+    def test_from_battles_matches_from_rounds(self):
+        battles = [
+            nm.battle.Battle(nm.army.Army(JS=100), nm.army.Army(JS=100), self.rounds),
+            nm.battle.Battle(nm.army.Army(JS=100), nm.army.Army(JS=100), self.rounds[:1]),
+        ]
+        bounds = nm.war.BonusBounds.from_battles(battles)
+        assert len(bounds) == 4
+        for i, battle in enumerate(battles):
+            assert (bounds[i], bounds[len(battles) + i]) == nm.war.Bonuses.from_rounds(battle.rounds)
+
+    def test_groups_intersect(self):
+        battles = [
+            nm.battle.Battle(nm.army.Army(JS=100), nm.army.Army(JS=100), self.rounds[i : i + 1]) for i in range(3)
+        ]
+        bounds = nm.war.BonusBounds.from_battles(battles, attacker_groups=[0, 0, 0], defender_groups=[1, 1, 1])
+        assert bounds[1] == nm.war.Bonuses.from_rounds(self.rounds[:3])[1]
+
+    def test_wiped_side_only_bounds_hp_from_above(self):
+        battle = nm.battle.Battle(
+            nm.army.Army(JS=100),
+            nm.army.Army(JS=1118),
+            [nm.battle.Round(800, 840, 7826, 6965, nm.army.Army(JS=100), nm.army.Army(JS=33))],
+        )
+        bounds = nm.war.BonusBounds.from_battles([battle])
+        assert np.isnan(bounds.min_hp[0])
+        assert bounds[1] == nm.war.Bonuses.from_rounds(battle.rounds)[1]
+
 
 @pytest.mark.parametrize(
     "attacker,defender,expected",
@@ -131,6 +180,267 @@ def test_simulate_rounds(attacker: nm.war.WarParty, defender: nm.war.WarParty, e
     assert nm.war.simulate_rounds(attacker, defender) == expected
 
 
+@pytest.mark.parametrize(
+    "attacker,defender",
+    [
+        (
+            nm.war.WarParty(nm.army.Army(JS=100), bonuses=nm.war.Bonuses(0.95, 0.95), atk=True),
+            nm.war.WarParty(nm.army.Army(JS=100), bonuses=nm.war.Bonuses(0.95, 0.95), atk=False),
+        ),
+        (
+            nm.war.WarParty(
+                nm.army.Army(E=999990, ME=502, JS=2480000, S=777537, SE=925779, JTK=291373, TK=203211, TKE=383906),
+                bonuses=nm.war.Bonuses(1.14, 1.0),
+                atk=True,
+            ),
+            nm.war.WarParty(
+                nm.army.Army(JS=99989, S=909880, SE=3856893, JTK=31776, TK=114476, TKE=869999),
+                bonuses=nm.war.Bonuses(1.05, 1.45),
+                atk=False,
+            ),
+        ),
+        (
+            nm.war.WarParty(nm.army.Army(JS=2**50, TKE=2**48), bonuses=nm.war.Bonuses(1.5, 1.2), atk=True),
+            nm.war.WarParty(nm.army.Army(JS=2**50, G=2**49), bonuses=nm.war.Bonuses(1.2, 2.5), atk=False),
+        ),
+        (
+            nm.war.WarParty(nm.army.Army(), bonuses=nm.war.Bonuses(0, 0), atk=True),
+            nm.war.WarParty(nm.army.Army(JS=1), bonuses=nm.war.Bonuses(0, 0), atk=False),
+        ),
+    ],
+)
+def test_simulate_battles(attacker: nm.war.WarParty, defender: nm.war.WarParty):
+    battles = nm.war.simulate_battles(
+        [attacker.army._units, attacker.army._units],
+        [defender.army._units, defender.army._units],
+        (attacker.bonuses.dmg, attacker.bonuses.hp),
+        (defender.bonuses.dmg, defender.bonuses.hp),
+    )
+    expected = nm.war.simulate_battle(attacker, defender)
+    assert len(battles) == 2
+    assert battles[0] == expected
+    assert battles[1] == expected
+
+
+@hp.given(
+    st.lists(
+        st.tuples(small_army_strategy, bonuses_strategy, small_army_strategy, bonuses_strategy), min_size=1, max_size=10
+    )
+)
+def test_simulate_battles_property(matchups):
+    battles = nm.war.simulate_battles(
+        [a._units for a, _, _, _ in matchups],
+        [d._units for _, _, d, _ in matchups],
+        [(b.dmg, b.hp) for _, b, _, _ in matchups],
+        [(b.dmg, b.hp) for _, _, _, b in matchups],
+    )
+    atk_left, def_left = battles.get_left_armies()
+    for i, (atk, atk_bonuses, dfd, def_bonuses) in enumerate(matchups):
+        expected = nm.war.simulate_battle(
+            nm.war.WarParty(atk, atk_bonuses, atk=True), nm.war.WarParty(dfd, def_bonuses, atk=False)
+        )
+        assert battles[i] == expected
+        assert (nm.army.Army(atk_left[i]), nm.army.Army(def_left[i])) == expected.get_left_armies()
+
+
 @pytest.mark.skip
 class TestWarParty:
     pass
+
+
+class TestFindCheapestArmy:
+    defender = nm.war.WarParty(nm.army.Army(JS=10000, G=20000), nm.war.Bonuses(0.5, 0.8), atk=False)
+    levels = nm.levels.Levels(mandibule=10, carapace=10)
+
+    def wins(self, army: nm.army.Army) -> bool:
+        attacker = nm.war.WarParty(army, nm.war.Bonuses(*self.levels.bonus_atk), atk=True)
+        return nm.war.simulate_battle(attacker, self.defender).get_left_armies()[1].count == 0
+
+    def test_single_unit_type(self):
+        army, duration = nm.war.find_cheapest_army(self.defender, self.levels, ["JS"])
+        assert duration == army.recruit_time()[1]
+        assert self.wins(army)
+        assert not self.wins(army - nm.army.Army(JS=1))
+
+    def test_mixed_unit_types(self):
+        army, duration = nm.war.find_cheapest_army(self.defender, self.levels, ["JS", "S", "TK"], tdp=5)
+        assert self.wins(army)
+        for unit_type in ["JS", "S", "TK"]:
+            _, single_duration = nm.war.find_cheapest_army(self.defender, self.levels, [unit_type], tdp=5)
+            assert duration <= single_duration
+
+    def test_unbeatable(self):
+        # E and JS can't wipe that many TKE even at MAX_UNIT_COUNT units per type
+        defender = nm.war.WarParty(nm.army.Army(TKE=nm.army.MAX_UNIT_COUNT), nm.war.Bonuses(3, 3), atk=False)
+        assert nm.war.find_cheapest_army(defender, self.levels, ["E", "JS"]) is None
+
+
+class TestSimulationCache:
+    attacker = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=True)
+    defender = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=False)
+
+    def test_hits_on_equal_content(self):
+        cache = nm.war.SimulationCache(maxsize=2)
+        battle = nm.war.simulate_battle(self.attacker, self.defender, cache=cache)
+        attacker = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=True)
+        assert nm.war.simulate_battle(attacker, self.defender, cache=cache) is battle
+        assert battle == nm.war.simulate_battle(self.attacker, self.defender)
+        assert cache.info() == nm.war.CacheInfo(hits=1, misses=1, maxsize=2, currsize=1)
+
+    def test_lru_eviction(self):
+        cache = nm.war.SimulationCache(maxsize=2)
+        parties = [nm.war.WarParty(nm.army.Army(JS=n), nm.war.Bonuses(0, 0), atk=True) for n in (10, 20, 30)]
+        first = nm.war.simulate_battle(parties[0], self.defender, cache=cache)
+        nm.war.simulate_battle(parties[1], self.defender, cache=cache)
+        nm.war.simulate_battle(parties[0], self.defender, cache=cache)
+        nm.war.simulate_battle(parties[2], self.defender, cache=cache)
+        assert cache.info().currsize == 2
+        assert cache.get(parties[0], self.defender) is first
+        assert cache.get(parties[1], self.defender) is None
+
+
+class TestSimulateEnvelope:
+    attacker = nm.war.WarParty(nm.army.Army(JS=1000), nm.war.Bonuses(0.5, 0.5, 0.1, 0.1), atk=True)
+
+    def defender(self, count: int) -> nm.war.WarParty:
+        return nm.war.WarParty(nm.army.Army(JS=count), nm.war.Bonuses(0.3, 0.3, 0.1, 0.1), atk=False)
+
+    @pytest.mark.parametrize("count,outcome", [(300, "Victoire"), (1000, "Incertain"), (5000, "Défaite")])
+    def test_outcome(self, count, outcome):
+        envelope = nm.war.simulate_envelope(self.attacker, self.defender(count))
+        assert envelope.outcome == outcome
+        assert len(envelope.bonuses) == len(envelope.battles) == 3**4
+        low, high = envelope.attacker_losses
+        assert (low._units <= high._units).all()
+
+    def test_matches_simulate_battle(self):
+        defender = self.defender(1000)
+        envelope = nm.war.simulate_envelope(self.attacker, defender, resolution=2)
+        for bonuses, battle in zip(envelope.bonuses, envelope.battles):
+            expected = nm.war.simulate_battle(
+                nm.war.WarParty(self.attacker.army, nm.war.Bonuses(*bonuses[:2]), atk=True),
+                nm.war.WarParty(defender.army, nm.war.Bonuses(*bonuses[2:]), atk=False),
+            )
+            assert battle == expected
+
+    def test_point_bonuses(self):
+        attacker = nm.war.WarParty(nm.army.Army(JS=1000), nm.war.Bonuses(0.5, 0.5), atk=True)
+        envelope = nm.war.simulate_envelope(attacker, self.defender(300), resolution=5)
+        assert len(envelope.bonuses) == 5**2
+        assert set(envelope.bonuses[:, 0]) == {0.5}
+
+    def test_rounded_bounds(self):
+        attacker = nm.war.WarParty(nm.army.Army(JS=1000), nm.war.Bonuses(0.5, 0.5, min_hp=0.1), atk=True)
+        envelope = nm.war.simulate_envelope(attacker, self.defender(300), resolution=2, step=5e-3)
+        assert len(envelope.bonuses) == 2**4
+        # every bonus strictly within one step of the bounds, in multiples of 0.0005 like LevelsIndex.query
+        assert np.allclose(envelope.bonuses.min(axis=0), [0.4955, 0.0955, 0.0955, 0.0955])
+        assert np.allclose(envelope.bonuses.max(axis=0), [0.5045, 0.5045, 0.3045, 0.3045])
+
+
+class TestShortcuts:
+    stalled = (
+        nm.war.WarParty(nm.army.Army(GE=2), nm.war.Bonuses(0, 0), atk=True),
+        nm.war.WarParty(nm.army.Army(TK=1), nm.war.Bonuses(0, 0), atk=False),
+    )
+
+    def test_stalemate(self):
+        battle = nm.war.simulate_battle(*self.stalled)
+        assert len(battle) == nm.war.MAX_ROUNDS
+        assert battle.stalemate
+        assert battle.get_left_armies() == (self.stalled[0].army, self.stalled[1].army)
+        assert nm.battle.Battle.from_rc(battle.to_rc()) == battle
+
+    def test_first_round_wipe(self):
+        attacker = nm.war.WarParty(nm.army.Army(TK=1000), nm.war.Bonuses(0.5, 0.5), atk=True)
+        defender = nm.war.WarParty(nm.army.Army(JS=1000, G=500), nm.war.Bonuses(0.3, 0.3), atk=False)
+        battle = nm.war.simulate_battle(attacker, defender)
+        assert len(battle) == 1
+        assert not battle.stalemate
+        assert battle.get_left_armies()[1].count == 0
+        assert battle.defender_base_dmg[0] == int(defender.base_dmg * 0.1)
+        assert battle.rounds[0] == nm.battle.Battle.from_rc(battle.to_rc()).rounds[0]
+
+    def test_batch_matches_single(self):
+        attackers = [self.stalled[0].army._units, nm.army.Army(TK=1000)._units, nm.army.Army(JS=100)._units]
+        defenders = [self.stalled[1].army._units, nm.army.Army(JS=10)._units, nm.army.Army(JS=100)._units]
+        batch = nm.war.simulate_battles(attackers, defenders, (0, 0), (0, 0))
+        for i, battle in enumerate(batch):
+            expected = nm.war.simulate_battle(
+                nm.war.WarParty(nm.army.Army(attackers[i]), nm.war.Bonuses(0, 0), atk=True),
+                nm.war.WarParty(nm.army.Army(defenders[i]), nm.war.Bonuses(0, 0), atk=False),
+            )
+            assert battle == expected
+            assert battle.stalemate == batch.stalemates[i]
+        assert batch.stalemates.tolist() == [True, False, False]
+
+
+class TestWaves:
+    attacker = nm.war.WarParty(nm.army.Army(JS=30000, S=20000, TK=5000), nm.war.Bonuses(0.5, 0.5), atk=True)
+    defender = nm.war.WarParty(nm.army.Army(JS=20000, G=20000, L=5000, TK=3000), nm.war.Bonuses(0.6, 0.8), atk=False)
+
+    def test_simulate_waves(self):
+        waves = [nm.war.WarParty(nm.army.Army(JS=n), self.attacker.bonuses, atk=True) for n in (5000, 100000, 10)]
+        first, second = nm.war.simulate_waves(waves, self.defender)
+        assert first == nm.war.simulate_battle(waves[0], self.defender)
+        assert second.defender == first.get_left_armies()[1]
+        assert second.get_left_armies()[1].count == 0
+
+    @pytest.mark.parametrize("objective,weights", [("losses", 1), ("ponte", nm.army.unit_stats[:, 3])])
+    def test_plan_waves(self, objective, weights):
+        single = nm.war.plan_waves(self.attacker, self.defender, max_waves=1, objective=objective)
+        assert single.waves == [self.attacker.army]
+        plan = nm.war.plan_waves(self.attacker, self.defender, max_waves=4, resolution=2, objective=objective)
+        assert plan.wiped
+        assert plan.cost <= single.cost
+        assert plan.battles == nm.war.simulate_waves(
+            [nm.war.WarParty(wave, self.attacker.bonuses, atk=True) for wave in plan.waves], self.defender
+        )
+        assert plan.cost == sum((battle.get_total_losses()[0]._units * weights).sum() for battle in plan.battles)
+        assert (sum(wave._units for wave in plan.waves) <= self.attacker.army._units).all()
+
+    def test_flood_first(self):
+        plan = nm.war.plan_waves(self.attacker, self.defender, max_waves=2)
+        assert plan.cost < nm.war.plan_waves(self.attacker, self.defender, max_waves=1).cost
+        assert len(plan.waves) == 2
+
+    def test_not_wiped(self):
+        attacker = nm.war.WarParty(nm.army.Army(JS=100, S=100), nm.war.Bonuses(0, 0), atk=True)
+        plan = nm.war.plan_waves(attacker, self.defender, max_waves=3)
+        assert not plan.wiped
+        assert plan.battles[-1].get_left_armies()[1].count > 0
+
+
+class TestSizeFlood:
+    defender = nm.war.WarParty(nm.army.Army(JS=20000, G=20000, L=5000, TK=3000), nm.war.Bonuses(0.6, 0.8), atk=False)
+    bonuses = nm.war.Bonuses(0.5, 0.5)
+
+    def flood(self, count: int) -> nm.war.WarParty:
+        return nm.war.WarParty(nm.army.Army(JS=count), self.bonuses, atk=True)
+
+    def test_breakpoint(self):
+        breakpoint = nm.war.flood_breakpoint(self.defender, self.bonuses, "JS")
+        assert self.flood(breakpoint).total_dmg >= self.defender.total_hp
+        assert self.flood(breakpoint - 1).total_dmg < self.defender.total_hp
+
+    def test_curve(self):
+        curve = nm.war.size_flood(self.defender, self.bonuses, "JS", tdp=10)
+        assert (np.diff(curve.counts) > 0).all()
+        assert curve.counts[-1] == 4 * curve.breakpoint
+        battle = nm.war.simulate_battle(self.flood(curve.best_count), self.defender)
+        attacker_losses, defender_losses = battle.get_total_losses()
+        assert curve.ponte[curve.counts == curve.best_count][0] == attacker_losses.recruit_time(tdp=10)[1]
+        assert curve.hp_removed[curve.counts == curve.best_count][0] == defender_losses.base_hp * 1.8
+
+    def test_best_count_beats_dense_scan(self):
+        curve = nm.war.size_flood(self.defender, self.bonuses, "JS")
+        counts = np.arange(1, curve.counts[-1] + 1, 97)
+        units = np.zeros((len(counts), 15), dtype=np.int64)
+        units[:, 2] = counts
+        defenders = np.broadcast_to(self.defender.army._units, units.shape)
+        attacker_losses, defender_losses = nm.war.simulate_battles(
+            units, defenders, (0.5, 0.5), (0.6, 0.8)
+        ).get_total_losses()
+        hp_removed = defender_losses @ nm.army.unit_stats[:, 0] * 1.8
+        ponte = attacker_losses @ nm.army.unit_stats[:, 3]
+        assert curve.efficiency.max() >= (hp_removed / ponte).max()
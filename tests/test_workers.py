@@ -0,0 +1,20 @@
+import asyncio
+
+import nawminator as nm
+
+ATTACKER = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=True)
+DEFENDER = nm.war.WarParty(nm.army.Army(JS=100), nm.war.Bonuses(0.95, 0.95), atk=False)
+
+
+def test_run_simulate_rc():
+    rc = asyncio.run(nm.workers.run(nm.workers.simulate_rc, ATTACKER, DEFENDER))
+    assert rc == nm.war.simulate_battle(ATTACKER, DEFENDER).to_rc()
+
+
+def test_analyse_rc():
+    rc = nm.workers.simulate_rc(ATTACKER, DEFENDER)
+    attacker, defender, attacker_levels, defender_levels = nm.workers.analyse_rc(
+        rc, nm.levels.FightZone.TDC, nm.levels.AllianceType.NEUTRE, nm.levels.AllianceType.NEUTRE
+    )
+    assert (attacker.army, defender.army) == (ATTACKER.army, DEFENDER.army)
+    assert attacker_levels.alliance == defender_levels.alliance == nm.levels.AllianceType.NEUTRE
@@ -1,3 +1,4 @@
+import io
 import numpy as np
 import pytest
 import hypothesis as hp
@@ -212,3 +213,43 @@ class TestBattle:
     )
     def test_get_total_losses(self, battle, expected):
         assert battle.get_total_losses() == expected
+
+
+class TestIterRcs:
+    DUMP = "\n\n".join(
+        [RC_REEL, "Troupe en attaque : 100 Jeunes soldates\nCombat sans défenseur", RC_SIMU_NAW, RC_SIMU_NM]
+    )
+
+    def test_split_rcs(self):
+        rcs = list(nm.battle.split_rcs(io.StringIO(self.DUMP)))
+        assert len(rcs) == 4
+        assert all(rc.startswith("Troupe en attaque :") for rc in rcs)
+
+    @pytest.mark.parametrize("jobs,chunk_size", [(None, 256), (None, 1), (2, 1)])
+    def test_iter_rcs(self, tmp_path, jobs, chunk_size):
+        path = tmp_path / "dump.txt"
+        path.write_text(self.DUMP, encoding="utf-8")
+        errors = []
+        battles = list(nm.battle.iter_rcs(path, errors=errors, jobs=jobs, chunk_size=chunk_size))
+        assert battles == [nm.battle.Battle.from_rc(rc) for rc in (RC_REEL, RC_SIMU_NAW, RC_SIMU_NM)]
+        assert [e.index for e in errors] == [1]
+
+    def test_iter_rcs_raises_without_errors(self):
+        with pytest.raises(ValueError):
+            list(nm.battle.iter_rcs(io.StringIO(self.DUMP)))
+
+
+class TestBattleArrays:
+    battle = nm.battle.Battle.from_rc(RC_SIMU_NM)
+
+    def test_rounds_are_views(self):
+        assert len(self.battle) == 4
+        assert self.battle.attacker_losses.shape == (4, 15)
+        assert self.battle.rounds[1] == nm.battle.Round(448, 426, 350, 333, nm.army.Army(JS=28), nm.army.Army(JS=22))
+        assert nm.battle.Battle(self.battle.attacker, self.battle.defender, self.battle.rounds) == self.battle
+
+    def test_get_armies_by_round(self):
+        attackers, defenders = self.battle.get_armies_by_round()
+        assert attackers[:, 2].tolist() == [100, 56, 34, 24, 22]
+        assert defenders[:, 2].tolist() == [100, 50, 22, 5, 0]
+        assert (nm.army.Army(attackers[-1]), nm.army.Army(defenders[-1])) == self.battle.get_left_armies()